@@ -0,0 +1,254 @@
+import random
+from collections import namedtuple
+
+import instrumentation
+from compiled_network import get_network
+from sampling_inference import counts_to_probabilities
+from counter_rng import sequential_rng
+
+# Result of adaptive_query
+AdaptiveResult = namedtuple('AdaptiveResult', ['probabilities', 'effective_sample_size', 'samples', 'updates'])
+
+# Learning rate schedule eta(k) = ETA_START * (ETA_END / ETA_START) ** (k / updates)
+ETA_START = 0.4
+ETA_END = 0.14
+
+# Importance probabilities of evidence ancestors are kept at or above this
+# (for states the CPT allows), so no state becomes unreachable
+MIN_IMPORTANCE = 0.04
+
+# Importance tables are re-learned this many times per run, at most
+MAX_UPDATES = 10
+MIN_STAGE_SAMPLES = 10
+
+
+def evidence_ancestors(network, evidence):
+    """
+    Non-evidence ancestors of the evidence nodes. Every other node already
+    has P(node | parents, evidence) = P(node | parents), so only these get
+    an importance table.
+    """
+    ancestors = set()
+    stack = list(evidence)
+    while stack:
+        for parent in network.parents[stack.pop()]:
+            if parent not in ancestors:
+                ancestors.add(parent)
+                stack.append(parent)
+    return sorted(ancestors - set(evidence))
+
+
+def _floor_row(row, prior_row, floor):
+    """
+    Raise the entries the CPT allows to at least floor and renormalize.
+    """
+    row = [max(p, floor) if q > 0 else 0.0 for p, q in zip(row, prior_row)]
+    total = sum(row)
+    return [p / total for p in row]
+
+
+def typical_states(network):
+    """
+    Every node's most probable state when its parents are in their own
+    typical states, found in one forward pass.
+    """
+    states = [0] * len(network.nodes)
+    for node_id in range(len(network.nodes)):
+        card = network.cardinality[node_id]
+        row = network.parent_config(node_id, states) * card
+        probs = network.tables[node_id][row:row + card]
+        states[node_id] = probs.index(max(probs))
+    return states
+
+
+def initial_importance_tables(network, evidence, learned):
+    """
+    AIS-BN starting point: the parents of surprising evidence start uniform
+    (over the states their CPT allows), and small probabilities of every
+    learned node are raised to MIN_IMPORTANCE.
+
+    Evidence counts as surprising when the observed state has probability
+    below 1 / cardinality with the parents in their typical states, i.e.
+    the prior would rarely produce it.
+
+    Returns:
+        Dictionary {node_id: flat table} for the learned nodes, laid out like
+        the CPTs
+    """
+    typical = typical_states(network)
+    evidence_parents = set()
+    for node_id, state in evidence.items():
+        if network.probability(node_id, state, typical) < 1.0 / network.cardinality[node_id]:
+            evidence_parents.update(network.parents[node_id])
+
+    tables = {}
+    for node_id in learned:
+        card = network.cardinality[node_id]
+        cpt = network.tables[node_id]
+        table = []
+        for row in range(0, len(cpt), card):
+            prior_row = cpt[row:row + card]
+            if node_id in evidence_parents:
+                start = [1.0 if q > 0 else 0.0 for q in prior_row]
+            else:
+                start = prior_row
+            table.extend(_floor_row(start, prior_row, MIN_IMPORTANCE))
+        tables[node_id] = table
+    return tables
+
+
+def _draw(table, row, card, u):
+    for state in range(card - 1):
+        u -= table[row + state]
+        if u < 0:
+            return state
+    return card - 1
+
+
+def _importance_sample(network, evidence, importance, rand=random.random):
+    """
+    One sample with evidence clamped and learned nodes drawn from their
+    importance tables; rand() gives the uniform draws.
+
+    Returns:
+        Tuple of (states list, weight P(x, e) / Q(x))
+    """
+    states = [0] * len(network.nodes)
+    weight = 1.0
+    for node_id in range(len(network.nodes)):
+        card = network.cardinality[node_id]
+        row = network.parent_config(node_id, states) * card
+        cpt = network.tables[node_id]
+        if node_id in evidence:
+            state = evidence[node_id]
+            weight *= cpt[row + state]
+        elif node_id in importance:
+            table = importance[node_id]
+            state = _draw(table, row, card, rand())
+            weight *= cpt[row + state] / table[row + state]
+        else:
+            state = network.sample_state(node_id, row // card, rand())
+        states[node_id] = state
+    return states, weight
+
+
+def _stage_sizes(num_samples, max_updates):
+    stage = max(MIN_STAGE_SAMPLES, -(-num_samples // (max_updates + 1)))
+    sizes = []
+    remaining = num_samples
+    while remaining > 0:
+        sizes.append(min(stage, remaining))
+        remaining -= sizes[-1]
+    return sizes
+
+
+def adaptive_run(query_vars, evidence, num_samples, max_updates=MAX_UPDATES, network=None, rng=None):
+    """
+    Adaptive importance sampling (AIS-BN style).
+
+    Samples are drawn in stages. After each stage the importance table of
+    every evidence ancestor moves towards the weighted frequencies
+    P(node | parents, evidence) seen in that stage, with a decaying learning
+    rate. Every sample, including those from the learning stages, counts
+    towards the estimate with its own weight P(x, e) / Q(x), so the
+    estimate stays consistent while the proposal improves. The stages
+    depend on each other, so the draws come from one sequential generator
+    (see counter_rng.sequential_rng for what rng may be).
+
+    Returns:
+        Tuple of (weights keyed by query state tuples, sum of weights,
+        sum of squared weights, number of table updates)
+    """
+    if network is None:
+        network = get_network()
+    query_ids = network.query_ids(query_vars)
+    encoded = network.encode_evidence(evidence)
+    learned = evidence_ancestors(network, encoded)
+    importance = initial_importance_tables(network, encoded, learned)
+    rand = sequential_rng(rng).random
+
+    weighted_counts = {}
+    total = 0.0
+    total_sq = 0.0
+    updates = 0
+    sizes = _stage_sizes(num_samples, max_updates)
+
+    for stage, size in enumerate(sizes):
+        # Weighted tallies of (node, parent config, state) for the update
+        tallies = {node_id: [0.0] * len(importance[node_id]) for node_id in learned}
+        for _ in range(size):
+            states, weight = _importance_sample(network, encoded, importance, rand)
+            key = tuple(states[i] for i in query_ids)
+            weighted_counts[key] = weighted_counts.get(key, 0) + weight
+            total += weight
+            total_sq += weight * weight
+            if weight > 0:
+                for node_id in learned:
+                    card = network.cardinality[node_id]
+                    tallies[node_id][network.parent_config(node_id, states) * card + states[node_id]] += weight
+
+        if stage == len(sizes) - 1 or updates >= max_updates:
+            continue
+        eta = ETA_START * (ETA_END / ETA_START) ** (updates / max_updates)
+        for node_id in learned:
+            card = network.cardinality[node_id]
+            table = importance[node_id]
+            tally = tallies[node_id]
+            for row in range(0, len(table), card):
+                seen = sum(tally[row:row + card])
+                if seen == 0:
+                    continue  # no evidence about this parent configuration yet
+                moved = [q + eta * (t / seen - q) for q, t in zip(table[row:row + card], tally[row:row + card])]
+                table[row:row + card] = _floor_row(moved, network.tables[node_id][row:row + card], MIN_IMPORTANCE)
+        updates += 1
+
+    if instrumentation.active:
+        instrumentation.add('adaptive.samples_generated', num_samples)
+        instrumentation.add('adaptive.table_updates', updates)
+        instrumentation.add('adaptive.weight_sum', total)
+    return weighted_counts, total, total_sq, updates
+
+
+def adaptive_counts(query_vars, evidence, num_samples, network=None, rng=None):
+    """
+    Adaptive importance sampling tallies: total weight per query assignment.
+
+    Returns:
+        Tuple of (weights keyed by query state tuples, total weight)
+    """
+    weighted_counts, total, _, _ = adaptive_run(query_vars, evidence, num_samples, network=network, rng=rng)
+    return weighted_counts, total
+
+
+def adaptive_importance_sampling(query_vars, evidence, num_samples, network=None, rng=None):
+    """
+    Approximate P(query_vars | evidence) using adaptive importance sampling.
+
+    Args:
+        query_vars: List of query variable names
+        evidence: Dictionary of evidence
+        num_samples: Number of weighted samples, learning stages included
+        network: CompiledNetwork to use (defaults to network_definition)
+        rng: random generator or seed (see sampling_inference.prior_sampling)
+
+    Returns:
+        Dictionary mapping query assignments to probabilities
+    """
+    with instrumentation.timer('infer'):
+        weighted_counts, total = adaptive_counts(query_vars, evidence, num_samples, network, rng)
+    return counts_to_probabilities(query_vars, weighted_counts, total, network)
+
+
+def adaptive_query(query_vars, evidence, num_samples, max_updates=MAX_UPDATES, network=None, rng=None):
+    """
+    Like adaptive_importance_sampling, but also reports the effective sample
+    size (sum of weights)^2 / (sum of squared weights).
+
+    Returns:
+        AdaptiveResult(probabilities, effective_sample_size, samples, updates)
+    """
+    weighted_counts, total, total_sq, updates = adaptive_run(query_vars, evidence, num_samples, max_updates, network,
+                                                             rng)
+    ess = total * total / total_sq if total_sq > 0 else 0.0
+    probabilities = counts_to_probabilities(query_vars, weighted_counts, total, network)
+    return AdaptiveResult(probabilities, ess, num_samples, updates)
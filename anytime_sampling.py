@@ -0,0 +1,179 @@
+import math
+import time
+from collections import namedtuple
+
+from compiled_network import get_network
+from sampling_inference import _prior_states, _weighted_states, _sample_draws, counts_to_probabilities
+from counter_rng import counter_stream
+
+# Running estimate yielded after every chunk
+#   probabilities: current posterior estimate over the query assignments
+#   std_errors: standard error of each probability (same keys)
+#   half_width: largest confidence half-width over the assignments
+#   samples: samples generated so far
+#   accepted: samples that matched the evidence (equal to samples for LW)
+#   effective_sample_size: Kish ESS, (sum w)^2 / sum w^2
+#   elapsed: seconds since the first chunk started
+Estimate = namedtuple('Estimate', [
+    'probabilities', 'std_errors', 'half_width', 'samples', 'accepted', 'effective_sample_size', 'elapsed'
+])
+
+
+# A half-width-only rule gives up after this many samples without any
+# weight, since it could never fire
+MAX_EMPTY_SAMPLES = 1000000
+
+
+class NoMatchingSamples(ValueError):
+    """
+    Raised when a half-width-only run gives up without any sample matching
+    the evidence; the evidence may be rare rather than impossible.
+    """
+
+
+class StoppingRule:
+    """
+    When to stop an anytime sampler. Any rule that fires stops the run.
+
+    Args:
+        half_width: stop once every probability is within this half-width
+        deadline: stop after this many seconds of wall-clock time
+        max_samples: stop after this many samples
+        z: normal quantile for the half-width (1.96 is a 95% interval)
+        min_accepted: do not trust the half-width before this many accepted samples
+    """
+
+    def __init__(self, half_width=None, deadline=None, max_samples=None, z=1.96, min_accepted=30):
+        if half_width is None and deadline is None and max_samples is None:
+            raise ValueError("A stopping rule needs a half-width, a deadline or a sample limit")
+        self.half_width = half_width
+        self.deadline = deadline
+        self.max_samples = max_samples
+        self.z = z
+        self.min_accepted = min_accepted
+
+    def should_stop(self, estimate):
+        if self.max_samples is not None and estimate.samples >= self.max_samples:
+            return True
+        if self.deadline is not None and estimate.elapsed >= self.deadline:
+            return True
+        if (self.half_width is not None and estimate.accepted >= self.min_accepted
+                and estimate.half_width <= self.half_width):
+            return True
+        return False
+
+
+def _estimate(network, query_vars, query_ids, sums, squares, total, total_sq, samples, accepted, z, start):
+    probabilities = counts_to_probabilities(query_vars, sums, total, network)
+    ess = total ** 2 / total_sq if total_sq > 0 else 0.0
+    std_errors = {}
+    for combination in network.assignments(query_ids):
+        key = network.decode(query_ids, combination)
+        if total == 0:
+            std_errors[key] = float('inf')
+            continue
+        p = probabilities[key]
+        # Delta-method variance of a self-normalized weighted mean; for unit
+        # weights this is p(1-p)/n
+        in_key = squares.get(combination, 0.0)
+        variance = (in_key * (1 - p) ** 2 + (total_sq - in_key) * p ** 2) / total ** 2
+        # The plug-in variance is 0 while every sample falls on one side, so
+        # it is floored with an add-one (Agresti-Coull style) estimate
+        smoothed = (p * ess + 1) / (ess + 2)
+        variance = max(variance, smoothed * (1 - smoothed) / (ess + 2))
+        std_errors[key] = math.sqrt(variance)
+
+    return Estimate(
+        probabilities=probabilities,
+        std_errors=std_errors,
+        half_width=z * max(std_errors.values()),
+        samples=samples,
+        accepted=accepted,
+        effective_sample_size=ess,
+        elapsed=time.monotonic() - start,
+    )
+
+
+def iter_estimates(method, query_vars, evidence, stop, chunk_size=500, network=None, rng=None):
+    """
+    Run a sampler in chunks, yielding a running estimate after every chunk.
+
+    Args:
+        method: 'prior', 'rejection' or 'likelihood'
+        query_vars: List of query variable names
+        evidence: Dictionary of evidence
+        stop: StoppingRule deciding when to finish
+        chunk_size: Samples drawn between two estimates
+        network: CompiledNetwork to use (defaults to network_definition)
+        rng: random generator or seed (see sampling_inference.prior_sampling);
+             with a seed, sample i is the same whatever the chunk size
+
+    Yields:
+        Estimate namedtuples; the last one is the estimate the rule stopped on
+
+    Raises:
+        NoMatchingSamples: if the rule has only a half-width and
+                           MAX_EMPTY_SAMPLES samples all missed the evidence
+                           (or had zero weight)
+    """
+    if method not in ('prior', 'rejection', 'likelihood'):
+        raise ValueError(f"Unknown sampling method: {method}")
+    if network is None:
+        network = get_network()
+    query_ids = network.query_ids(query_vars)
+    encoded = network.encode_evidence(evidence)
+    evidence_items = list(encoded.items())
+
+    sums = {}
+    squares = {}
+    total = 0.0
+    total_sq = 0.0
+    samples = 0
+    accepted = 0
+    start = time.monotonic()
+    counter = counter_stream(rng)
+
+    while True:
+        n = chunk_size
+        if stop.max_samples is not None:
+            n = min(n, stop.max_samples - samples)
+
+        uniforms, rand = _sample_draws(rng if counter is None else counter.advance(samples), 'random', n,
+                                       len(network.nodes))
+        for _ in range(n):
+            u = None if uniforms is None else next(uniforms)
+            if method == 'likelihood':
+                sample, weight = _weighted_states(network, encoded, u, rand=rand)
+            else:
+                # Prior and rejection sampling both keep only the samples
+                # that agree with the evidence
+                sample = _prior_states(network, u, rand)
+                if not all(sample[var] == val for var, val in evidence_items):
+                    continue
+                weight = 1.0
+            accepted += 1
+            key = tuple(sample[var] for var in query_ids)
+            sums[key] = sums.get(key, 0.0) + weight
+            squares[key] = squares.get(key, 0.0) + weight * weight
+            total += weight
+            total_sq += weight * weight
+        samples += n
+
+        estimate = _estimate(network, query_vars, query_ids, sums, squares, total, total_sq,
+                             samples, accepted, stop.z, start)
+        yield estimate
+        if stop.should_stop(estimate):
+            return
+        if (total == 0 and samples >= MAX_EMPTY_SAMPLES
+                and stop.max_samples is None and stop.deadline is None):
+            raise NoMatchingSamples(f"No sample matched the evidence in {samples} draws")
+
+
+def anytime_query(method, query_vars, evidence, stop, chunk_size=500, network=None, rng=None):
+    """
+    Run iter_estimates to completion and return the final Estimate.
+    """
+    estimate = None
+    for estimate in iter_estimates(method, query_vars, evidence, stop, chunk_size, network, rng):
+        pass
+    return estimate
@@ -0,0 +1,429 @@
+import json
+import weakref
+import hashlib
+from collections import OrderedDict
+
+import instrumentation
+from compiled_network import get_network
+from variable_elimination import interaction_graph, greedy_order
+
+try:
+    import numpy as np
+except ImportError:  # circuits need numpy; the other exact engines do not
+    np = None
+
+# Node kinds of the flat circuit program
+PARAMETER, INDICATOR, SUM, PRODUCT = 0, 1, 2, 3
+
+# Bumped whenever the layout of a saved circuit changes
+FORMAT_VERSION = 1
+
+
+def network_digest(network):
+    """
+    Hash of a network's structure and CPTs, stored with a saved circuit so a
+    circuit is never evaluated against a different network.
+    """
+    text = json.dumps([network.nodes, network.cardinality, [list(p) for p in network.parents], network.tables])
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class _Builder:
+    """
+    Appends circuit nodes, sharing identical leaves and sub-expressions.
+    Children always come before their parents, so the node list is already
+    in evaluation order.
+    """
+
+    def __init__(self, network):
+        self.kinds = []
+        self.children = []
+        self.values = []
+        self.memo = {}
+        self.indicator_offsets = []
+        offset = 0
+        for card in network.cardinality:
+            self.indicator_offsets.append(offset)
+            offset += card
+
+    def _node(self, key, kind, children, value):
+        if key not in self.memo:
+            self.memo[key] = len(self.kinds)
+            self.kinds.append(kind)
+            self.children.append(children)
+            self.values.append(value)
+        return self.memo[key]
+
+    def parameter(self, value):
+        return self._node((PARAMETER, value), PARAMETER, (), value)
+
+    def indicator(self, node_id, state):
+        index = self.indicator_offsets[node_id] + state
+        return self._node((INDICATOR, index), INDICATOR, (), index)
+
+    def product(self, a, b):
+        a, b = min(a, b), max(a, b)
+        return self._node((PRODUCT, a, b), PRODUCT, (a, b), None)
+
+    def sum(self, children):
+        children = tuple(sorted(children))
+        if len(children) == 1:
+            return children[0]
+        return self._node((SUM,) + children, SUM, children, None)
+
+
+def _cpt_factor(builder, network, node_id):
+    """
+    The CPT of node_id as a symbolic factor: every row is theta * lambda,
+    rows with a zero parameter are dropped and a parameter of one is left out.
+    """
+    scope = network.parents[node_id] + (node_id,)
+    assignment = [0] * len(network.nodes)
+    table = {}
+    for states in network.assignments(scope):
+        for v, s in zip(scope, states):
+            assignment[v] = s
+        theta = network.probability(node_id, assignment[node_id], assignment)
+        if theta == 0:
+            continue
+        leaf = builder.indicator(node_id, assignment[node_id])
+        table[states] = leaf if theta == 1 else builder.product(builder.parameter(theta), leaf)
+    return scope, table
+
+
+def _multiply(builder, f1, f2):
+    (vars1, table1), (vars2, table2) = f1, f2
+    shared_in_1 = [vars1.index(v) for v in vars1 if v in vars2]
+    shared_in_2 = [vars2.index(v) for v in vars1 if v in vars2]
+    extra = [v for v in vars2 if v not in vars1]
+    extra_in_2 = [vars2.index(v) for v in extra]
+
+    groups = {}
+    for values, node in table2.items():
+        groups.setdefault(tuple(values[i] for i in shared_in_2), []).append(
+            (tuple(values[i] for i in extra_in_2), node))
+    table = {}
+    for values, node in table1.items():
+        for tail, other in groups.get(tuple(values[i] for i in shared_in_1), ()):
+            table[values + tail] = builder.product(node, other)
+    return vars1 + tuple(extra), table
+
+
+def _sum_out(builder, var, factor):
+    variables, table = factor
+    idx = variables.index(var)
+    groups = {}
+    for values, node in table.items():
+        groups.setdefault(values[:idx] + values[idx + 1:], []).append(node)
+    return variables[:idx] + variables[idx + 1:], {key: builder.sum(nodes) for key, nodes in groups.items()}
+
+
+class ArithmeticCircuit:
+    """
+    A network compiled into a sum-product circuit over evidence indicators.
+
+    Compilation runs variable elimination once, symbolically: factor entries
+    are circuit nodes instead of numbers, with every CPT row multiplied by
+    the indicator lambda[X = x] of its child. Setting the indicators of
+    observed values to 0 makes the circuit output P(evidence).
+
+    The circuit is stored as flat arrays grouped into layers (a node's
+    layer is one more than its deepest child). Evaluation is one sweep over
+    the layers with numpy gathers and reduceat; a backward sweep gives the
+    partial derivative for every indicator, and
+    d f / d lambda[X = x] = P(X = x, evidence) for every unobserved X, so
+    one forward and one backward pass yield all posterior marginals.
+    """
+
+    def __init__(self, network, kinds, children, starts, values, indicator_offsets, root):
+        if np is None:
+            raise ImportError("numpy is required for arithmetic circuits")
+        self.network = network
+        self.kinds = np.asarray(kinds, dtype=np.int8)
+        self.children = np.asarray(children, dtype=np.int64)
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.indicator_offsets = list(indicator_offsets)
+        self.num_indicators = sum(network.cardinality)
+        self.root = int(root)
+        self._plan()
+
+    @classmethod
+    def compile(cls, network=None, heuristic='min_fill'):
+        """
+        Compile a network (defaults to the active one).
+
+        Args:
+            network: CompiledNetwork
+            heuristic: elimination heuristic, 'min_fill' or 'min_degree'
+        """
+        if network is None:
+            network = get_network()
+        with instrumentation.timer('compile'):
+            builder = _Builder(network)
+            factors = [_cpt_factor(builder, network, v) for v in range(len(network.nodes))]
+            graph = interaction_graph(network, range(len(network.nodes)))
+            for var, _ in greedy_order(graph, range(len(network.nodes)), heuristic):
+                involved = [f for f in factors if var in f[0]]
+                factors = [f for f in factors if var not in f[0]]
+                product = involved[0]
+                for f in involved[1:]:
+                    product = _multiply(builder, product, f)
+                factors.append(_sum_out(builder, var, product))
+
+            root = None
+            for _, table in factors:
+                # Every factor is a scalar by now; an empty table is a zero
+                node = table[()] if () in table else builder.parameter(0.0)
+                root = node if root is None else builder.product(root, node)
+
+        flat = []
+        starts = []
+        for children in builder.children:
+            starts.append(len(flat))
+            flat.extend(children)
+        starts.append(len(flat))
+        values = [0.0 if v is None else v for v in builder.values]
+        instrumentation.add('circuit.nodes', len(builder.kinds))
+        return cls(network, builder.kinds, flat, starts, values, builder.indicator_offsets, root)
+
+    def _plan(self):
+        """
+        Group the internal nodes into layers for the vectorized sweeps.
+        """
+        kinds = self.kinds
+        size = len(kinds)
+        depth = np.zeros(size, dtype=np.int64)
+        counts = np.diff(self.starts)
+        for node in np.flatnonzero(counts):
+            depth[node] = 1 + depth[self.children[self.starts[node]:self.starts[node + 1]]].max()
+
+        self.parameters = np.flatnonzero(kinds == PARAMETER)
+        self.indicators = np.flatnonzero(kinds == INDICATOR)
+        self.indicator_index = self.values[self.indicators].astype(np.int64)
+        self.layers = []
+        for level in range(1, int(depth.max(initial=0)) + 1):
+            in_layer = depth == level
+            products = np.flatnonzero(in_layer & (kinds == PRODUCT))
+            sums = np.flatnonzero(in_layer & (kinds == SUM))
+            left = self.children[self.starts[products]]
+            right = self.children[self.starts[products] + 1]
+            sum_children = np.concatenate([self.children[self.starts[s]:self.starts[s + 1]] for s in sums]) \
+                if len(sums) else np.zeros(0, dtype=np.int64)
+            sum_starts = np.concatenate([[0], np.cumsum(counts[sums])[:-1]]).astype(np.int64) \
+                if len(sums) else np.zeros(0, dtype=np.int64)
+            self.layers.append((products, left, right, sums, sum_children, sum_starts, counts[sums]))
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def indicator_values(self, evidence):
+        """
+        Indicator vector for encoded evidence {node_id: state}: 1 everywhere
+        except the unobserved states of evidence nodes.
+        """
+        lam = np.ones(self.num_indicators)
+        for node_id, state in evidence.items():
+            offset = self.indicator_offsets[node_id]
+            lam[offset:offset + self.network.cardinality[node_id]] = 0.0
+            lam[offset + state] = 1.0
+        return lam
+
+    def forward(self, lam):
+        """
+        Evaluate every node.
+
+        Args:
+            lam: indicator values, shape (indicators,) or (indicators, batch)
+                 to evaluate a batch of indicator settings at once
+
+        Returns:
+            Node values, shape (nodes,) or (nodes, batch)
+        """
+        lam = np.asarray(lam, dtype=np.float64)
+        values = np.empty((len(self.kinds),) + lam.shape[1:])
+        values[self.parameters] = self.values[self.parameters].reshape((-1,) + (1,) * (lam.ndim - 1))
+        values[self.indicators] = lam[self.indicator_index]
+        for products, left, right, sums, sum_children, sum_starts, _ in self.layers:
+            if len(products):
+                values[products] = values[left] * values[right]
+            if len(sums):
+                values[sums] = np.add.reduceat(values[sum_children], sum_starts, axis=0)
+        if instrumentation.active:
+            instrumentation.add('circuit.evaluations')
+        return values
+
+    def backward(self, values):
+        """
+        Partial derivatives of the root with respect to every node, given
+        the node values of one forward pass (same shape).
+        """
+        grads = np.zeros_like(values)
+        grads[self.root] = 1.0
+        for products, left, right, sums, sum_children, sum_starts, sum_counts in reversed(self.layers):
+            if len(sums):
+                np.add.at(grads, sum_children, np.repeat(grads[sums], sum_counts, axis=0))
+            if len(products):
+                upstream = grads[products]
+                np.add.at(grads, left, upstream * values[right])
+                np.add.at(grads, right, upstream * values[left])
+        return grads
+
+    def probability_of_evidence(self, evidence):
+        """
+        P(evidence) from one forward pass.
+        """
+        return float(self.forward(self.indicator_values(self.network.encode_evidence(evidence)))[self.root])
+
+    def marginals(self, evidence):
+        """
+        Posterior marginals of every non-evidence node from one forward and
+        one backward pass, in the format of JunctionTree.marginals.
+        """
+        network = self.network
+        encoded = network.encode_evidence(evidence)
+        values = self.forward(self.indicator_values(encoded))
+        total = values[self.root]
+        if total == 0:
+            raise ValueError("Evidence has zero probability")
+        grads = self.backward(values)
+
+        by_indicator = np.zeros(self.num_indicators)
+        by_indicator[self.indicator_index] = grads[self.indicators]
+        result = {}
+        for node_id, name in enumerate(network.nodes):
+            if node_id in encoded:
+                continue
+            offset = self.indicator_offsets[node_id]
+            result[name] = {(network.domains[node_id][s],): float(by_indicator[offset + s] / total)
+                            for s in range(network.cardinality[node_id])}
+        return result
+
+    def query(self, query_vars, evidence):
+        """
+        P(query_vars | evidence): every query assignment is one column of a
+        single batched forward pass.
+
+        Returns:
+            Dictionary mapping query assignments to probabilities, as query_exact
+        """
+        network = self.network
+        query_ids = network.query_ids(query_vars)
+        encoded = network.encode_evidence(evidence)
+        base = self.indicator_values(encoded)
+        combinations = list(network.assignments(query_ids))
+
+        lam = np.repeat(base[:, None], len(combinations), axis=1)
+        for column, combination in enumerate(combinations):
+            for node_id, state in zip(query_ids, combination):
+                offset = self.indicator_offsets[node_id]
+                observed = lam[offset + state, column]
+                lam[offset:offset + network.cardinality[node_id], column] = 0.0
+                lam[offset + state, column] = observed
+        joint = self.forward(lam)[self.root]
+
+        with instrumentation.timer('normalize'):
+            total = joint.sum()
+            if total == 0:
+                raise ValueError("Evidence has zero probability")
+            return {network.decode(query_ids, c): float(p / total) for c, p in zip(combinations, joint)}
+
+    def save(self, path):
+        """
+        Write the circuit to path (a .npz file) with the digest of its network.
+        """
+        meta = {
+            'version': FORMAT_VERSION,
+            'nodes': self.network.nodes,
+            'digest': network_digest(self.network),
+            'indicator_offsets': self.indicator_offsets,
+            'root': self.root,
+        }
+        with open(path, 'wb') as f:
+            np.savez(f, kinds=self.kinds, children=self.children, starts=self.starts,
+                     values=self.values, meta=np.array(json.dumps(meta)))
+
+    @classmethod
+    def load(cls, path, network=None):
+        """
+        Read a circuit saved by save().
+
+        Raises:
+            ValueError: if it was compiled from a different network (or an
+                        older file format)
+        """
+        if np is None:
+            raise ImportError("numpy is required for arithmetic circuits")
+        if network is None:
+            network = get_network()
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('version') != FORMAT_VERSION or meta['digest'] != network_digest(network):
+                raise ValueError(f"Circuit {path} was compiled from a different network")
+            return cls(network, data['kinds'], data['children'], data['starts'], data['values'],
+                       meta['indicator_offsets'], meta['root'])
+
+
+def load_or_compile(path, network=None):
+    """
+    Load the circuit saved at path, or compile one and save it there when
+    the file is missing or belongs to another network.
+    """
+    if network is None:
+        network = get_network()
+    try:
+        return ArithmeticCircuit.load(path, network)
+    except (OSError, ValueError, KeyError):
+        pass
+    circuit = ArithmeticCircuit.compile(network)
+    try:
+        circuit.save(path)
+    except OSError:
+        pass  # read-only location: the compiled circuit still works
+    return circuit
+
+
+# Circuits kept by shared_circuit, least recently used first, by network digest
+CIRCUIT_CACHE_SIZE = 8
+_circuits = OrderedDict()
+
+# Circuits installed with use_circuit, by network digest; never evicted
+_installed = {}
+
+# Digest of every network seen; a digest holds no reference to its network,
+# so an entry goes away with the network
+_digests = weakref.WeakKeyDictionary()
+
+
+def _digest(network):
+    digest = _digests.get(network)
+    if digest is None:
+        digest = _digests[network] = network_digest(network)
+    return digest
+
+
+def shared_circuit(network):
+    """
+    The circuit kept for network, compiled on first use (use_circuit
+    installs one loaded from disk). The CIRCUIT_CACHE_SIZE most recently
+    used networks keep their circuits; an installed circuit is never
+    evicted by queries on other networks.
+    """
+    digest = _digest(network)
+    circuit = _installed.get(digest)
+    if circuit is not None:
+        return circuit
+    circuit = _circuits.get(digest)
+    if circuit is None:
+        circuit = _circuits[digest] = ArithmeticCircuit.compile(network)
+        while len(_circuits) > CIRCUIT_CACHE_SIZE:
+            _circuits.popitem(last=False)
+    _circuits.move_to_end(digest)
+    return circuit
+
+
+def use_circuit(circuit):
+    """
+    Make circuit the one query_exact(method='circuit') uses for its network.
+    """
+    _installed[_digest(circuit.network)] = circuit
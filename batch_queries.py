@@ -0,0 +1,181 @@
+import itertools
+
+from exact_inference import query_exact, query_exact_many, marginalize_joint
+from sampling_inference import prior_sampling, rejection_sampling, likelihood_weighting
+from gibbs_sampling import gibbs_sampling
+from adaptive_sampling import adaptive_importance_sampling
+from sample_bank import SampleBank
+from query_cache import QueryCache
+from compiled_network import get_network
+
+SAMPLERS = {
+    'prior': prior_sampling,
+    'rejection': rejection_sampling,
+    'likelihood': likelihood_weighting,
+    'gibbs': gibbs_sampling,
+    'adaptive': adaptive_importance_sampling,
+}
+
+ENGINES = ('exact', 'enumeration', 'tabulated', 'circuit', 'bank') + tuple(SAMPLERS)
+
+# query_exact method behind each exact engine name
+EXACT_METHODS = {'exact': 'elimination', 'enumeration': 'enumeration', 'tabulated': 'tabulated', 'circuit': 'circuit'}
+
+
+def joint_posterior(union_vars, evidence, engine='exact', num_samples=1000, rng=None):
+    """
+    Posterior over all of union_vars from one run of the chosen engine.
+    rng is the sampling engines' generator or seed (see
+    sampling_inference.prior_sampling).
+    """
+    if engine in EXACT_METHODS:
+        return query_exact(union_vars, evidence, method=EXACT_METHODS[engine])
+    elif engine in SAMPLERS:
+        return SAMPLERS[engine](union_vars, evidence, num_samples, rng=rng)
+    else:
+        raise ValueError(f"Unknown engine: {engine}")
+
+
+class BatchAnswerer:
+    """
+    Answers groups of parsed queries, sharing work between queries that have
+    the same evidence.
+
+    For every distinct evidence set in a block the engine runs once for the
+    union of the query variables, and each query is read off that joint
+    (query_exact_many for the exact engines). Exact answers are kept across
+    blocks (they never change) in an LRU of memo_size entries, so a stream
+    of repeated queries only pays for inference the first time and an
+    endless stream does not grow the memo without bound.
+
+    The 'bank' engine draws num_samples prior samples once into a SampleBank
+    and answers every block from it in a single pass.
+
+    With a seed, every sampling run uses the counter-based stream of that
+    seed, so an evidence group gets the same samples whatever else is in
+    the batch.
+    """
+
+    def __init__(self, engine='exact', num_samples=1000, seed=None, memo_size=1024):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine: {engine}")
+        self.engine = engine
+        self.num_samples = num_samples
+        self.seed = seed
+        self.answers = QueryCache(memo_size)
+        self.inference_runs = 0
+        self.bank = None
+
+    def _joint(self, evidence_key, union_vars):
+        joint = joint_posterior(list(union_vars), dict(evidence_key), self.engine, self.num_samples, self.seed)
+        self.inference_runs += 1
+        return joint
+
+    def answer(self, queries):
+        """
+        Args:
+            queries: list of (evidence dict, query_vars list) pairs
+
+        Returns:
+            List with, for every query in the same order, either a
+            probability dictionary or the exception raised for it
+        """
+        groups = {}
+        for i, (evidence, query_vars) in enumerate(queries):
+            groups.setdefault(tuple(sorted(evidence.items())), []).append(i)
+
+        results = [None] * len(queries)
+        if self.engine in EXACT_METHODS:
+            return self._answer_exact(queries, groups, results)
+
+        unions = {}
+        for evidence_key, members in groups.items():
+            union = []
+            for i in members:
+                for var in queries[i][1]:
+                    if var not in union:
+                        union.append(var)
+            unions[evidence_key] = tuple(sorted(union))
+
+        if self.engine == 'bank':
+            return self._answer_from_bank(queries, groups, unions, results)
+
+        for evidence_key, members in groups.items():
+            union_vars = unions[evidence_key]
+            try:
+                joint = self._joint(evidence_key, union_vars)
+            except Exception as e:
+                for i in members:
+                    results[i] = e
+                continue
+
+            for i in members:
+                results[i] = marginalize_joint(union_vars, joint, queries[i][1])
+        return results
+
+    def _answer_exact(self, queries, groups, results):
+        self.answers.check_network(get_network())
+        for evidence_key, members in groups.items():
+            # One query_exact_many run for the queries not answered before
+            found = {}
+            missing = []
+            for i in members:
+                query_key = tuple(queries[i][1])
+                if query_key in found or query_key in missing:
+                    continue
+                answer = self.answers.get((evidence_key, query_key))
+                if answer is None:
+                    missing.append(query_key)
+                else:
+                    found[query_key] = answer
+            if missing:
+                try:
+                    answers = query_exact_many([list(q) for q in missing], dict(evidence_key),
+                                               EXACT_METHODS[self.engine])
+                except Exception as e:
+                    for i in members:
+                        results[i] = e
+                    continue
+                self.inference_runs += 1
+                for query_key, answer in zip(missing, answers):
+                    self.answers.put((evidence_key, query_key), answer)
+                    found[query_key] = answer
+
+            for i in members:
+                results[i] = dict(found[tuple(queries[i][1])])
+        return results
+
+    def _answer_from_bank(self, queries, groups, unions, results):
+        if self.bank is None:
+            self.bank = SampleBank.generate(self.num_samples, rng=self.seed)
+            self.inference_runs += 1
+
+        # Invalid evidence or variables fail on their own, not the whole block
+        valid = []
+        for evidence_key, members in groups.items():
+            try:
+                self.bank.network.encode_evidence(dict(evidence_key))
+                self.bank.network.query_ids(unions[evidence_key])
+                valid.append(evidence_key)
+            except ValueError as e:
+                for i in members:
+                    results[i] = e
+
+        joints = self.bank.query_many([(dict(key), list(unions[key])) for key in valid])
+        for evidence_key, joint in zip(valid, joints):
+            for i in groups[evidence_key]:
+                results[i] = marginalize_joint(unions[evidence_key], joint, queries[i][1])
+        return results
+
+
+def blocks(lines, block_size=4096):
+    """
+    Split an iterable of lines into lists of at most block_size non-blank lines.
+    """
+    lines = (line.strip() for line in lines)
+    lines = (line for line in lines if line)
+    while True:
+        block = list(itertools.islice(lines, block_size))
+        if not block:
+            return
+        yield block
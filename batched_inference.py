@@ -0,0 +1,176 @@
+import instrumentation
+from compiled_network import get_network
+from variable_elimination import eliminate_query
+
+try:
+    import numpy as np
+except ImportError:  # batched inference needs numpy; the other exact engines do not
+    np = None
+
+# Entry of an evidence matrix for a node that is not observed
+UNOBSERVED = -1
+
+# numpy.einsum accepts at most 52 distinct subscripts; one is the batch axis
+MAX_CONTRACTION_NODES = 51
+
+
+def evidence_matrix(evidence_rows, network=None):
+    """
+    Build an evidence matrix from a list of evidence dictionaries.
+
+    Args:
+        evidence_rows: list of {name: value} dictionaries, as query_exact takes
+        network: CompiledNetwork to use (defaults to network_definition)
+
+    Returns:
+        Integer array of shape (rows, nodes): the observed state index of
+        every node, UNOBSERVED where the node is not observed
+    """
+    if np is None:
+        raise ImportError("numpy is required for batched exact inference")
+    if network is None:
+        network = get_network()
+    matrix = np.full((len(evidence_rows), len(network.nodes)), UNOBSERVED, dtype=np.int64)
+    for row, evidence in enumerate(evidence_rows):
+        for node_id, state in network.encode_evidence(evidence).items():
+            matrix[row, node_id] = state
+    return matrix
+
+
+def _cpt_tensors(network):
+    """
+    Every CPT as a tensor with one axis per parent and one for the node.
+
+    The flat table is indexed by config * cardinality + state with parent 0
+    least significant in config, so the C-order axes are the parents in
+    reverse order followed by the node itself.
+    """
+    tensors = []
+    for node_id, table in enumerate(network.tables):
+        parents = [p for p, _ in network.parent_strides[node_id]][::-1]
+        shape = [network.cardinality[p] for p in parents] + [network.cardinality[node_id]]
+        tensors.append((np.asarray(table, dtype=np.float64).reshape(shape), parents + [node_id]))
+    return tensors
+
+
+def _unique_rows(matrix, network):
+    """
+    Distinct evidence rows and, for every row of matrix, the index of its
+    distinct row. Rows are packed into one integer (state + 1 in a mixed
+    radix of cardinality + 1) so the deduplication is a 1-D sort.
+    """
+    radices = [card + 1 for card in network.cardinality]
+    size = 1
+    for radix in radices:
+        size *= radix
+    if size >= 2 ** 63:
+        return np.unique(matrix, axis=0, return_inverse=True)
+
+    codes = np.zeros(len(matrix), dtype=np.int64)
+    for node_id, radix in enumerate(radices):
+        codes = codes * radix + (matrix[:, node_id] + 1)
+    _, first, inverse = np.unique(codes, return_index=True, return_inverse=True)
+    return matrix[first], inverse.reshape(-1)
+
+
+def _contract(network, query_ids, rows):
+    """
+    Unnormalized P(query, evidence) for every distinct evidence row, shape
+    (rows, query assignments), from one einsum over the CPT tensors and
+    one evidence indicator matrix per node.
+    """
+    batch = len(network.nodes)
+    operands = []
+    for tensor, axes in _cpt_tensors(network):
+        operands += [tensor, axes]
+
+    for node_id, card in enumerate(network.cardinality):
+        column = rows[:, node_id]
+        if (column == UNOBSERVED).all():
+            continue
+        # Indicator of the observed state; all ones where the node is unobserved
+        indicator = (column[:, None] == np.arange(card)) | (column[:, None] == UNOBSERVED)
+        operands += [indicator.astype(np.float64), [batch, node_id]]
+
+    output = [batch] + list(query_ids)
+    if not any(batch in axes for axes in operands[1::2]):
+        # No evidence at all: every row has the same answer
+        joint = np.einsum(*operands, list(query_ids), optimize='greedy')
+        return np.broadcast_to(joint.reshape(1, -1), (len(rows), joint.size))
+    joint = np.einsum(*operands, output, optimize='greedy')
+    return joint.reshape(len(rows), -1)
+
+
+def _eliminate_rows(network, query_ids, rows):
+    joint = np.empty((len(rows), len(list(network.assignments(query_ids)))))
+    for i, row in enumerate(rows):
+        encoded = {node_id: int(s) for node_id, s in enumerate(row) if s != UNOBSERVED}
+        try:
+            posterior = eliminate_query(network, query_ids, encoded)
+        except ValueError:
+            joint[i] = 0.0
+            continue
+        joint[i] = list(posterior.values())
+    return joint
+
+
+def query_exact_batch(query_vars, evidence, network=None):
+    """
+    P(query_vars | evidence row) for every row of an evidence matrix.
+
+    Identical rows are answered once. The distinct rows go through a single
+    tensor contraction of the CPTs with per-row evidence indicators (numpy
+    picks the contraction order), so the cost is one vectorized pass over
+    the network instead of one query_exact call per row. Networks with more
+    than MAX_CONTRACTION_NODES nodes fall back to variable elimination per
+    distinct row.
+
+    Args:
+        query_vars: List of query variable names
+        evidence: array of shape (rows, nodes) with the observed state index
+                  of every node in compiled order, UNOBSERVED (-1) where the
+                  node is not observed (see evidence_matrix)
+        network: CompiledNetwork to use (defaults to network_definition)
+
+    Returns:
+        Tuple of (keys, probabilities): keys lists the query assignments in
+        the order of network.assignments, and probabilities has shape
+        (rows, len(keys)). A row whose evidence has zero probability is NaN.
+        An observed query variable keeps its observed value, as in query_exact.
+    """
+    if np is None:
+        raise ImportError("numpy is required for batched exact inference")
+    if network is None:
+        network = get_network()
+    query_ids = network.query_ids(query_vars)
+    keys = [network.decode(query_ids, c) for c in network.assignments(query_ids)]
+
+    matrix = np.asarray(evidence)
+    if matrix.ndim != 2 or matrix.shape[1] != len(network.nodes):
+        raise ValueError(f"Evidence must have shape (rows, {len(network.nodes)})")
+    if not np.issubdtype(matrix.dtype, np.integer):
+        raise ValueError("Evidence must hold integer state indices")
+    matrix = matrix.astype(np.int64, copy=False)
+    if len(matrix) == 0:
+        return keys, np.empty((0, len(keys)))
+    cards = np.asarray(network.cardinality)
+    if ((matrix < UNOBSERVED) | (matrix >= cards)).any():
+        raise ValueError("Evidence state out of range")
+
+    with instrumentation.timer('infer'):
+        rows, inverse = _unique_rows(matrix, network)
+        if len(network.nodes) <= MAX_CONTRACTION_NODES:
+            joint = _contract(network, query_ids, rows)
+        else:
+            joint = _eliminate_rows(network, query_ids, rows)
+
+    with instrumentation.timer('normalize'):
+        totals = joint.sum(axis=1, keepdims=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            posteriors = np.where(totals > 0, joint / totals, np.nan)
+        probabilities = posteriors[inverse]
+
+    if instrumentation.active:
+        instrumentation.add('batched.rows', len(matrix))
+        instrumentation.add('batched.distinct_rows', len(rows))
+    return keys, probabilities
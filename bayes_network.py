@@ -1,31 +1,26 @@
 from network_definition import *
+import instrumentation
+from compiled_network import get_network
 
 def get_probability(node, value, parent_values):
-    if node == 'B':
-        return P_BURGLARY[value]
-    elif node == 'E':
-        return P_EARTHQUAKE[value]
-    elif node == 'A':
-        b_val = parent_values['B']
-        e_val = parent_values['E']
-        prob = P_ALARM[(b_val, e_val)]
-        return prob if value else 1 - prob
-    elif node == 'J':
-        a_val = parent_values['A']
-        prob = P_JOHN[a_val]
-        return prob if value else 1 - prob
-        return P_JOHN[parent_values]
-    elif node == 'M':
-        a_val = parent_values['A']
-        prob = P_MARY[a_val]
-        return prob if value else 1 - prob
-    else:
+    """
+    P(node=value | parents), looked up in the compiled network.
+    Kept for callers that work with dictionaries of parent values.
+    """
+    instrumentation.add('get_probability.calls')
+    network = get_network()
+    if node not in network.index:
         raise ValueError("Unknown node")
+    i = network.index[node]
+    config = 0
+    for parent, stride in network.parent_strides[i]:
+        config += network.state_index[parent][parent_values[network.nodes[parent]]] * stride
+    return network.tables[i][config * network.cardinality[i] + network.state_index[i][value]]
     
 
 def get_all_parent_values(node, assignment):
     parent_values = {}
-    for parent in PARENTS[node]:
+    for parent in get_network().parent_names[node]:
         parent_values[parent] = assignment[parent]
     return parent_values
 
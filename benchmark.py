@@ -0,0 +1,391 @@
+import sys
+import json
+import math
+import time
+import random
+import platform
+import subprocess
+import tracemalloc
+
+from compiled_network import CompiledNetwork, get_network
+from exact_inference import query_exact
+from variable_elimination import variable_elimination
+from joint_table import can_tabulate
+from sampling_inference import prior_sampling, rejection_sampling, likelihood_weighting
+from gibbs_sampling import gibbs_sampling
+from adaptive_sampling import adaptive_importance_sampling
+from random_streams import STREAMS, MAX_SOBOL_DIMS
+import arithmetic_circuit
+import batched_inference
+
+# The three cases from main.analyze_specific_cases plus two single-variable queries
+ALARM_CASES = [
+    {"name": "case1", "evidence": {"A": False}, "query": ["B", "J"]},
+    {"name": "case2", "evidence": {"J": True, "E": False}, "query": ["B", "M"]},
+    {"name": "case3", "evidence": {"M": True, "J": False}, "query": ["B", "E"]},
+    {"name": "burglary_given_calls", "evidence": {"J": True, "M": True}, "query": ["B"]},
+    {"name": "prior_alarm", "evidence": {}, "query": ["A"]},
+]
+
+EXACT_METHODS = ['enumeration', 'elimination', 'tabulated', 'circuit']
+
+SAMPLERS = {
+    'prior': prior_sampling,
+    'rejection': rejection_sampling,
+    'likelihood': likelihood_weighting,
+    'likelihood_batched': lambda q, e, n, network=None: likelihood_weighting(q, e, n, batch_size=65536, network=network),
+    'gibbs': gibbs_sampling,
+    'adaptive': adaptive_importance_sampling,
+}
+
+# Samplers compared across the random-stream backends
+STREAM_SAMPLERS = {
+    'prior': prior_sampling,
+    'rejection': rejection_sampling,
+    'likelihood': likelihood_weighting,
+}
+
+# Enumeration is exponential in the number of nodes, so it is skipped above this
+MAX_ENUMERATION_NODES = 16
+
+
+def synthetic_network(num_nodes, max_parents=3, seed=0):
+    """
+    Random boolean network: node i picks up to max_parents parents among
+    the previous nodes and gets CPT entries drawn uniformly from (0.05, 0.95).
+    """
+    rng = random.Random(seed)
+    nodes = [f"X{i}" for i in range(num_nodes)]
+    parents = {}
+    tables = {}
+    for i, name in enumerate(nodes):
+        # Prefer recent nodes so the network is deep rather than flat
+        window = nodes[max(0, i - 2 * max_parents):i]
+        parents[name] = rng.sample(window, min(len(window), rng.randint(1, max_parents))) if window else []
+        table = []
+        for _ in range(2 ** len(parents[name])):
+            prob_true = rng.uniform(0.05, 0.95)
+            table.extend([1 - prob_true, prob_true])
+        tables[name] = table
+    network = CompiledNetwork(nodes, parents, {n: (False, True) for n in nodes}, tables)
+    network.fingerprint = ('synthetic', num_nodes, max_parents, seed)
+    return network
+
+
+def synthetic_cases(network, seed=0):
+    """
+    A query on the first nodes with evidence on the last ones, and one with
+    evidence scattered through the middle of the network.
+    """
+    rng = random.Random(seed)
+    nodes = network.nodes
+    return [
+        {"name": "root_given_leaves", "query": [nodes[0]],
+         "evidence": {n: rng.random() < 0.5 for n in nodes[-3:]}},
+        {"name": "joint_given_middle", "query": [nodes[1], nodes[len(nodes) // 2 + 1]],
+         "evidence": {n: rng.random() < 0.5 for n in nodes[len(nodes) // 3:len(nodes) // 2]}},
+    ]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(math.ceil(q / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def errors(exact, estimate):
+    """
+    Max absolute error and KL(exact || estimate); the estimate is smoothed so
+    a missed assignment gives a large but finite KL.
+    """
+    eps = 1e-12
+    abs_error = max(abs(exact[k] - estimate.get(k, 0.0)) for k in exact)
+    kl = 0.0
+    for k, p in exact.items():
+        if p > 0:
+            kl += p * math.log(p / max(estimate.get(k, 0.0), eps))
+    return abs_error, kl
+
+
+def peak_memory(fn):
+    """
+    Peak Python heap allocation (bytes) while running fn once.
+    """
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def time_calls(fn, repeats):
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_exact(network, case, method, repeats):
+    query, evidence = case['query'], case['evidence']
+    run = lambda: query_exact(query, evidence, method=method, network=network)
+    run()  # warm-up (compiles tables for the tabulated engine)
+    latencies = time_calls(run, repeats)
+    return {
+        "engine": method,
+        "kind": "exact",
+        "queries_per_sec": repeats / sum(latencies),
+        "p50_latency_ms": percentile(latencies, 50) * 1000,
+        "p99_latency_ms": percentile(latencies, 99) * 1000,
+        "peak_memory_bytes": peak_memory(run),
+    }
+
+
+def bench_sampler(network, case, name, num_samples, trials, exact):
+    query, evidence = case['query'], case['evidence']
+    sampler = SAMPLERS[name]
+    estimates = []
+    latencies = []
+    for _ in range(trials):
+        start = time.perf_counter()
+        estimates.append(sampler(query, evidence, num_samples, network=network))
+        latencies.append(time.perf_counter() - start)
+
+    abs_errors = []
+    kls = []
+    for estimate in estimates:
+        abs_error, kl = errors(exact, estimate)
+        abs_errors.append(abs_error)
+        kls.append(kl)
+
+    return {
+        "engine": name,
+        "kind": "sampling",
+        "num_samples": num_samples,
+        "trials": trials,
+        "samples_per_sec": num_samples * trials / sum(latencies),
+        "queries_per_sec": trials / sum(latencies),
+        "p50_latency_ms": percentile(latencies, 50) * 1000,
+        "p99_latency_ms": percentile(latencies, 99) * 1000,
+        "peak_memory_bytes": peak_memory(lambda: sampler(query, evidence, num_samples, network=network)),
+        "mean_abs_error": sum(abs_errors) / trials,
+        "mean_kl": sum(kls) / trials,
+    }
+
+
+def bench_streams(network, case, name, num_samples, trials, exact):
+    """
+    Mean squared error of one sampler under every random-stream backend, and
+    the variance reduction of each backend relative to the plain 'random'
+    stream (ratio of mean squared errors; above 1 is better).
+    """
+    query, evidence = case['query'], case['evidence']
+    sampler = STREAM_SAMPLERS[name]
+    rows = []
+    for stream in STREAMS:
+        if stream == 'sobol' and len(network.nodes) > MAX_SOBOL_DIMS:
+            continue
+        squared_errors = []
+        start = time.perf_counter()
+        for _ in range(trials):
+            estimate = sampler(query, evidence, num_samples, network=network, stream=stream)
+            squared_errors.append(sum((exact[k] - estimate.get(k, 0.0)) ** 2 for k in exact))
+        elapsed = time.perf_counter() - start
+        rows.append({
+            "engine": f"{name}/{stream}",
+            "kind": "stream",
+            "num_samples": num_samples,
+            "trials": trials,
+            "queries_per_sec": trials / elapsed,
+            "mean_squared_error": sum(squared_errors) / trials,
+        })
+
+    baseline = rows[0]['mean_squared_error']
+    for row in rows:
+        mse = row['mean_squared_error']
+        row['variance_reduction'] = baseline / mse if mse > 0 else None
+    return rows
+
+
+# Observed nodes of the synthetic batched case, enough for hundreds of
+# distinct evidence rows so the contraction (not the deduplication) is timed
+BATCHED_EVIDENCE_NODES = 10
+
+
+def batched_case(network):
+    """
+    Query on the first node with random evidence on BATCHED_EVIDENCE_NODES
+    nodes from the second half of the network.
+    """
+    observed = network.nodes[len(network.nodes) // 2:][:BATCHED_EVIDENCE_NODES]
+    return {"name": "many_distinct_rows", "query": [network.nodes[0]], "evidence": {n: True for n in observed}}
+
+
+def bench_batched(network, case, num_rows, repeats, seed=0):
+    """
+    Rows per second of query_exact_batch on a matrix of random evidence
+    over the case's evidence nodes. Identical rows are answered once, so
+    distinct_rows_per_sec is the rate of the contraction itself.
+    """
+    np = batched_inference.np
+    rng = np.random.default_rng(seed)
+    matrix = np.full((num_rows, len(network.nodes)), batched_inference.UNOBSERVED, dtype=np.int64)
+    for node in case['evidence']:
+        node_id = network.index[node]
+        matrix[:, node_id] = rng.integers(0, network.cardinality[node_id], num_rows)
+    distinct = len(np.unique(matrix, axis=0))
+    run = lambda: batched_inference.query_exact_batch(case['query'], matrix, network)
+    run()
+    latencies = time_calls(run, repeats)
+    return {
+        "engine": "batched",
+        "kind": "batched",
+        "num_rows": num_rows,
+        "distinct_rows": distinct,
+        "rows_per_sec": num_rows * repeats / sum(latencies),
+        "distinct_rows_per_sec": distinct * repeats / sum(latencies),
+        "queries_per_sec": num_rows * repeats / sum(latencies),
+        "p50_latency_ms": percentile(latencies, 50) * 1000,
+        "p99_latency_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def run_network(label, network, cases, sample_sizes, trials, repeats, stream_trials=0):
+    results = []
+    for case in cases:
+        exact = variable_elimination(case['query'], case['evidence'], network=network)
+        for method in EXACT_METHODS:
+            if method == 'enumeration' and len(network.nodes) > MAX_ENUMERATION_NODES:
+                continue
+            if method == 'tabulated' and not can_tabulate(network):
+                continue
+            if method == 'circuit' and arithmetic_circuit.np is None:
+                continue
+            row = bench_exact(network, case, method, repeats)
+            row.update({"network": label, "case": case['name'], "num_nodes": len(network.nodes)})
+            results.append(row)
+            print(f"{label:<14} {case['name']:<22} {method:<20} {row['queries_per_sec']:>14.1f} q/s", file=sys.stderr)
+        for name in SAMPLERS:
+            for n in sample_sizes:
+                row = bench_sampler(network, case, name, n, trials, exact)
+                row.update({"network": label, "case": case['name'], "num_nodes": len(network.nodes)})
+                results.append(row)
+                print(f"{label:<14} {case['name']:<22} {name + ' n=' + str(n):<20} "
+                      f"{row['samples_per_sec']:>14.1f} samples/s  abs err {row['mean_abs_error']:.5f}", file=sys.stderr)
+        for name in STREAM_SAMPLERS if stream_trials else ():
+            for n in sample_sizes[:2]:
+                rows = bench_streams(network, case, name, n, stream_trials, exact)
+                for row in rows:
+                    row.update({"network": label, "case": case['name'], "num_nodes": len(network.nodes)})
+                results += rows
+                reductions = '  '.join(f"{row['engine'].split('/')[1]} {row['variance_reduction'] or 0:.2f}x"
+                                       for row in rows[1:])
+                print(f"{label:<14} {case['name']:<22} {name + ' n=' + str(n):<20} variance reduction: {reductions}",
+                      file=sys.stderr)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _batched_row(label, network, case, num_rows):
+    row = bench_batched(network, case, num_rows, 5)
+    row.update({"network": label, "case": case['name'], "num_nodes": len(network.nodes)})
+    print(f"{label:<14} {case['name']:<22} {'batched':<20} {row['rows_per_sec']:>14.1f} rows/s  "
+          f"{row['distinct_rows_per_sec']:.1f} distinct rows/s ({row['distinct_rows']} distinct)", file=sys.stderr)
+    return row
+
+
+def run_benchmarks(quick=False, seed=42):
+    """
+    Run the whole suite and return the JSON-serializable report.
+    """
+    random.seed(seed)
+    if quick:
+        sample_sizes, trials, repeats, sizes, stream_trials = [100, 1000], 3, 20, [12], 20
+        batch_rows = 100000
+    else:
+        sample_sizes, trials, repeats, sizes, stream_trials = [100, 1000, 10000], 10, 200, [12, 24, 48], 50
+        batch_rows = 1000000
+
+    alarm = get_network()
+    results = run_network("alarm", alarm, ALARM_CASES, sample_sizes, trials, repeats, stream_trials)
+    if batched_inference.np is not None:
+        for case in ALARM_CASES[:4]:
+            results.append(_batched_row("alarm", alarm, case, batch_rows))
+    for num_nodes in sizes:
+        network = synthetic_network(num_nodes, seed=num_nodes)
+        label = f"synthetic-{num_nodes}"
+        results += run_network(label, network, synthetic_cases(network, seed=num_nodes),
+                               sample_sizes, trials, max(1, repeats // 10), stream_trials)
+        if batched_inference.np is not None:
+            results.append(_batched_row(label, network, batched_case(network), batch_rows // 10))
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "quick": quick,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(old_path, new_path):
+    """
+    Print throughput ratios (new / old) for the rows present in both reports.
+    """
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    def key(row):
+        return (row['network'], row['case'], row['engine'], row.get('num_samples'))
+
+    old_rows = {key(row): row for row in old['results']}
+    print(f"{'Network':<14} {'Case':<22} {'Engine':<20} {'Samples':<8} {'Old q/s':>12} {'New q/s':>12} {'Ratio':>8}")
+    for row in new['results']:
+        before = old_rows.get(key(row))
+        if before is None:
+            continue
+        ratio = row['queries_per_sec'] / before['queries_per_sec'] if before['queries_per_sec'] else float('inf')
+        print(f"{row['network']:<14} {row['case']:<22} {row['engine']:<20} {str(row.get('num_samples') or ''):<8} "
+              f"{before['queries_per_sec']:>12.1f} {row['queries_per_sec']:>12.1f} {ratio:>8.2f}")
+
+
+def main():
+    args = sys.argv[1:]
+    if args and args[0] == '--compare':
+        if len(args) != 3:
+            print("Usage: python benchmark.py --compare OLD.json NEW.json")
+            sys.exit(1)
+        compare(args[1], args[2])
+        return
+
+    quick = '--quick' in args
+    out = None
+    if '--out' in args:
+        out = args[args.index('--out') + 1]
+
+    report = run_benchmarks(quick=quick)
+    text = json.dumps(report, indent=2)
+    if out:
+        with open(out, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
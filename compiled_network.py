@@ -0,0 +1,255 @@
+import hashlib
+import itertools
+import network_definition
+
+
+class CompiledNetwork:
+    """
+    Array-backed form of a Bayesian network.
+
+    Nodes are numbered by their position in the topological order and every
+    value is stored as a state index into the node's domain (for boolean
+    nodes the domain is (False, True), so the state is the bit value).
+
+    Each CPT is a flat list laid out as table[config * cardinality + state],
+    where config packs the parent states with parent i weighted by the
+    product of the cardinalities of parents 0..i-1. For boolean parents this
+    is the bit-packed parent configuration.
+    """
+
+    def __init__(self, nodes, parents, domains, tables):
+        """
+        Args:
+            nodes: list of node names in topological order
+            parents: dictionary {node: list of parent names}
+            domains: dictionary {node: tuple of values}
+            tables: dictionary {node: flat list of P(state | config)}
+        """
+        self.nodes = list(nodes)
+        self.index = {name: i for i, name in enumerate(self.nodes)}
+        self.domains = [tuple(domains[name]) for name in self.nodes]
+        self.cardinality = [len(domain) for domain in self.domains]
+        self.state_index = [{value: s for s, value in enumerate(domain)} for domain in self.domains]
+        self.parent_names = {name: list(parents[name]) for name in self.nodes}
+        self.parents = []
+        self.parent_strides = []
+        self.tables = []
+        self.children = [[] for _ in self.nodes]
+        self.fingerprint = None
+        # Hash of the node names and value labels, everything a parsed query
+        # depends on; networks that differ only in their CPTs share it
+        self.schema = hashlib.sha256(repr((self.nodes, self.domains)).encode()).hexdigest()
+
+        for i, name in enumerate(self.nodes):
+            ids = []
+            for parent in parents[name]:
+                if parent not in self.index or self.index[parent] >= i:
+                    raise ValueError(f"Parent {parent} of {name} must come earlier in the node order")
+                ids.append(self.index[parent])
+                self.children[self.index[parent]].append(i)
+
+            strides = []
+            stride = 1
+            for p in ids:
+                strides.append((p, stride))
+                stride *= self.cardinality[p]
+
+            table = list(tables[name])
+            if len(table) != stride * self.cardinality[i]:
+                raise ValueError(f"CPT for {name} has {len(table)} entries, expected {stride * self.cardinality[i]}")
+
+            self.parents.append(tuple(ids))
+            self.parent_strides.append(tuple(strides))
+            self.tables.append(table)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def is_boolean(self):
+        return all(card == 2 for card in self.cardinality)
+
+    def bit_fields(self):
+        """
+        Bit field of every node when a full assignment is packed into one
+        integer: node i occupies widths[i] bits starting at offsets[i] (one
+        bit for a boolean node, so a boolean network uses bit i for node i).
+
+        Returns:
+            Tuple of (offsets, widths)
+        """
+        offsets = []
+        widths = []
+        offset = 0
+        for card in self.cardinality:
+            width = max(1, (card - 1).bit_length())
+            offsets.append(offset)
+            widths.append(width)
+            offset += width
+        return offsets, widths
+
+    def parent_config(self, node_id, assignment):
+        """
+        Packed parent configuration of a node under a state assignment.
+
+        Args:
+            node_id: integer node id
+            assignment: list of states indexed by node id
+        """
+        config = 0
+        for parent, stride in self.parent_strides[node_id]:
+            config += assignment[parent] * stride
+        return config
+
+    def probability(self, node_id, state, assignment):
+        """
+        P(node=state | parents) with the parent states read from assignment.
+        """
+        return self.tables[node_id][self.parent_config(node_id, assignment) * self.cardinality[node_id] + state]
+
+    def sample_state(self, node_id, config, u):
+        """
+        Turn a uniform draw u into a state of node_id given its parent config.
+
+        Boolean nodes are True when u < P(True), matching the scalar samplers.
+        """
+        card = self.cardinality[node_id]
+        row = config * card
+        table = self.tables[node_id]
+        if card == 2:
+            return 1 if u < table[row + 1] else 0
+        for state in range(card - 1):
+            u -= table[row + state]
+            if u < 0:
+                return state
+        return card - 1
+
+    def encode_evidence(self, evidence):
+        """
+        Convert {name: value} evidence into {node_id: state}.
+        """
+        encoded = {}
+        for name, value in evidence.items():
+            if name not in self.index:
+                raise ValueError(f"Invalid node: {name}")
+            i = self.index[name]
+            if value not in self.state_index[i]:
+                raise ValueError(f"Invalid value for {name}: {value}")
+            encoded[i] = self.state_index[i][value]
+        return encoded
+
+    def query_ids(self, query_vars):
+        for name in query_vars:
+            if name not in self.index:
+                raise ValueError(f"Invalid query variable: {name}")
+        return [self.index[name] for name in query_vars]
+
+    def assignments(self, node_ids):
+        """
+        All joint state tuples of the given nodes.
+        """
+        return itertools.product(*[range(self.cardinality[i]) for i in node_ids])
+
+    def parse_value(self, name, text):
+        """
+        Read a value written in the query syntax: t/f for boolean nodes,
+        otherwise one of the node's value labels (case-insensitive).
+        """
+        i = self.index[name]
+        if self.domains[i] == (False, True):
+            if text.lower() == 't':
+                return True
+            if text.lower() == 'f':
+                return False
+            raise ValueError(f"Invalid value: {text}. Use 't' or 'f'.")
+        for value in self.domains[i]:
+            if str(value).lower() == text.lower():
+                return value
+        raise ValueError(f"Invalid value for {name}: {text}. Use one of {', '.join(map(str, self.domains[i]))}.")
+
+    def decode(self, node_ids, states):
+        """
+        Convert a tuple of states back into a tuple of domain values.
+        """
+        return tuple(self.domains[i][s] for i, s in zip(node_ids, states))
+
+
+def _boolean_table(name, cpt, parents):
+    """
+    Flatten one of the dictionaries in network_definition into a CPT list.
+    Root CPTs map value -> P(value); the others map the parent value (or a
+    tuple of parent values) -> P(node=True).
+    """
+    table = []
+    for config in range(2 ** len(parents)):
+        parent_values = tuple(bool(config >> i & 1) for i in range(len(parents)))
+        if not parents:
+            prob_true = cpt[True]
+        elif len(parents) == 1:
+            prob_true = cpt[parent_values[0]]
+        else:
+            prob_true = cpt[parent_values]
+        table.extend([1 - prob_true, prob_true])
+    return table
+
+
+def definition_fingerprint():
+    """
+    Snapshot of the structure and CPT contents in network_definition, stored
+    as the compiled network's fingerprint so caches can tell when a reload
+    picked up edited tables.
+    """
+    return (
+        tuple(network_definition.NODES),
+        tuple(tuple(network_definition.PARENTS[n]) for n in network_definition.NODES),
+        tuple(tuple(network_definition.CPTS[n].items()) for n in network_definition.NODES),
+    )
+
+
+def compile_network():
+    """
+    Build a CompiledNetwork from the tables in network_definition.
+    """
+    nodes = network_definition.NODES
+    parents = network_definition.PARENTS
+    tables = {n: _boolean_table(n, network_definition.CPTS[n], parents[n]) for n in nodes}
+    domains = {n: (False, True) for n in nodes}
+    network = CompiledNetwork(nodes, parents, domains, tables)
+    network.fingerprint = definition_fingerprint()
+    return network
+
+
+_compiled = None
+_active = None
+
+
+def set_network(network):
+    """
+    Make a loaded network the default for every engine (None restores the
+    network from network_definition).
+    """
+    global _active
+    _active = network
+
+
+def reload_network():
+    """
+    Recompile the tables in network_definition; call after editing them at
+    runtime. Caches keyed on the network fingerprint drop their entries
+    only if the contents actually changed.
+    """
+    global _compiled
+    _compiled = compile_network()
+    return _compiled
+
+
+def get_network():
+    """
+    Return the active network: the one passed to set_network if any,
+    otherwise the compiled network_definition (compiled on first use and
+    kept until reload_network).
+    """
+    if _active is not None:
+        return _active
+    if _compiled is None:
+        return reload_network()
+    return _compiled
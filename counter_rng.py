@@ -0,0 +1,277 @@
+import os
+import random
+import operator
+
+try:
+    import numpy as np
+except ImportError:  # the pure Python rounds are used instead
+    np = None
+
+# Philox4x32-10 constants (Salmon et al., "Parallel random numbers: as easy
+# as 1, 2, 3"): round multipliers and the Weyl sequence bumping the key
+PHILOX_M0 = 0xD2511F53
+PHILOX_M1 = 0xCD9E8D57
+PHILOX_W0 = 0x9E3779B9
+PHILOX_W1 = 0xBB67AE85
+PHILOX_ROUNDS = 10
+
+MASK32 = 0xFFFFFFFF
+MASK64 = (1 << 64) - 1
+
+# Fourth counter word, keeping the three kinds of draws from ever sharing a
+# counter under the same key
+SAMPLE_DOMAIN = 0
+SEQUENTIAL_DOMAIN = 1
+SPAWN_DOMAIN = 2
+
+# Samples generated per vectorized call when iterating a CounterStream
+BLOCK_SIZE = 4096
+
+# Counters evaluated per refill of a PhiloxRandom buffer (numpy only)
+REFILL_BLOCKS = 256
+
+
+def philox4x32(counter, key, rounds=PHILOX_ROUNDS):
+    """
+    The Philox4x32 bijection of one 128-bit counter under a 64-bit key.
+
+    Args:
+        counter: four 32-bit words
+        key: two 32-bit words
+
+    Returns:
+        Tuple of four 32-bit output words
+    """
+    c0, c1, c2, c3 = counter
+    k0, k1 = key
+    for r in range(rounds):
+        if r:
+            k0 = (k0 + PHILOX_W0) & MASK32
+            k1 = (k1 + PHILOX_W1) & MASK32
+        p0 = PHILOX_M0 * c0
+        p1 = PHILOX_M1 * c2
+        c0, c1, c2, c3 = (p1 >> 32) ^ c1 ^ k0, p1 & MASK32, (p0 >> 32) ^ c3 ^ k1, p0 & MASK32
+    return c0, c1, c2, c3
+
+
+def _philox_arrays(c0, c1, c2, c3, k0, k1, rounds=PHILOX_ROUNDS):
+    """
+    philox4x32 over uint64 arrays of counter words (each below 2 ** 32);
+    every 32 x 32 bit product fits in the 64-bit lanes.
+    """
+    m0 = np.uint64(PHILOX_M0)
+    m1 = np.uint64(PHILOX_M1)
+    mask = np.uint64(MASK32)
+    shift = np.uint64(32)
+    for r in range(rounds):
+        if r:
+            k0 = (k0 + PHILOX_W0) & MASK32
+            k1 = (k1 + PHILOX_W1) & MASK32
+        p0 = c0 * m0
+        p1 = c2 * m1
+        c0, c1, c2, c3 = (p1 >> shift) ^ c1 ^ np.uint64(k0), p1 & mask, (p0 >> shift) ^ c3 ^ np.uint64(k1), p0 & mask
+    return c0, c1, c2, c3
+
+
+def _key_words(seed):
+    seed = operator.index(seed) & MASK64
+    return seed & MASK32, seed >> 32
+
+
+def _unit(hi, lo):
+    # 53 random bits of a 64-bit pair as a double in [0, 1)
+    return (((hi << 32) | lo) >> 11) * (1.0 / (1 << 53))
+
+
+class CounterStream:
+    """
+    Counter-based uniform draws for samplers that use one uniform per node
+    and sample.
+
+    Draw d of sample i is Philox4x32-10 of the counter (i, d // 2) under
+    the stream's seed, so it depends only on (seed, i, d): any range of
+    samples can be generated on its own, in any order and on any worker,
+    and the union of the ranges is the same sample set a single run draws.
+    advance() moves to a later sample range and spawn() derives
+    statistically independent streams (one per trial, chain, ...).
+
+        stream = CounterStream(42)
+        first = stream.uniform_matrix(1000, len(network.nodes))
+        second = stream.advance(1000).uniform_matrix(1000, len(network.nodes))
+    """
+
+    def __init__(self, seed, start=0):
+        """
+        Args:
+            seed: integer seed (the low 64 bits are the Philox key)
+            start: index of the stream's first sample
+        """
+        self.seed = operator.index(seed) & MASK64
+        self.start = start
+        self.key = _key_words(self.seed)
+
+    def __repr__(self):
+        return f"CounterStream({self.seed}, start={self.start})"
+
+    def __eq__(self, other):
+        return isinstance(other, CounterStream) and (self.seed, self.start) == (other.seed, other.start)
+
+    def __hash__(self):
+        return hash((self.seed, self.start))
+
+    def advance(self, num_samples):
+        """
+        The same stream, starting num_samples samples later.
+        """
+        return CounterStream(self.seed, self.start + num_samples)
+
+    def spawn(self, index):
+        """
+        Independent child stream number index; the child's seed is a Philox
+        output of the index, so children never overlap their parent.
+        """
+        w0, w1, _, _ = philox4x32((index & MASK32, index >> 32 & MASK32, 0, SPAWN_DOMAIN), self.key)
+        return CounterStream(w0 | w1 << 32)
+
+    def generator(self):
+        """
+        A random.Random-compatible generator on this stream's key, for
+        engines that consume draws one after another (Gibbs chains,
+        adaptive importance sampling).
+        """
+        return PhiloxRandom(self.seed)
+
+    def uniform_matrix(self, num_samples, dims):
+        """
+        Draws of samples start .. start + num_samples - 1.
+
+        Returns:
+            Float array of shape (num_samples, dims); column d drives node d
+        """
+        if np is None:
+            raise ImportError("numpy is required for CounterStream.uniform_matrix")
+        pairs = (dims + 1) // 2
+        index = np.arange(self.start, self.start + num_samples, dtype=np.uint64)
+        c0 = np.repeat(index & np.uint64(MASK32), pairs)
+        c1 = np.repeat(index >> np.uint64(32), pairs)
+        c2 = np.tile(np.arange(pairs, dtype=np.uint64), num_samples)
+        c3 = np.full(len(c0), SAMPLE_DOMAIN, dtype=np.uint64)
+        w0, w1, w2, w3 = _philox_arrays(c0, c1, c2, c3, *self.key)
+
+        shift = np.uint64(32)
+        scale = 1.0 / (1 << 53)
+        draws = np.empty((num_samples, 2 * pairs))
+        draws[:, 0::2] = (((w0 << shift) | w1) >> np.uint64(11)).reshape(num_samples, pairs) * scale
+        draws[:, 1::2] = (((w2 << shift) | w3) >> np.uint64(11)).reshape(num_samples, pairs) * scale
+        return draws[:, :dims]
+
+    def uniforms(self, num_samples, dims):
+        """
+        Iterator over the draws of samples start .. start + num_samples - 1,
+        one list of dims uniforms per sample, in the format of
+        random_streams.uniform_stream.
+        """
+        if np is not None:
+            for offset in range(0, num_samples, BLOCK_SIZE):
+                block = self.advance(offset).uniform_matrix(min(BLOCK_SIZE, num_samples - offset), dims)
+                yield from block.tolist()
+            return
+        pairs = (dims + 1) // 2
+        for i in range(self.start, self.start + num_samples):
+            draws = []
+            for pair in range(pairs):
+                w0, w1, w2, w3 = philox4x32((i & MASK32, i >> 32 & MASK32, pair, SAMPLE_DOMAIN), self.key)
+                draws += [_unit(w0, w1), _unit(w2, w3)]
+            yield draws[:dims]
+
+
+class PhiloxRandom(random.Random):
+    """
+    random.Random driven by Philox4x32-10 in counter mode: word n of the
+    output is a function of (seed, n) only, and every method of
+    random.Random (shuffle, choice, gauss, ...) works on top of it. The
+    state is the seed and a counter, so it pickles to a worker cheaply.
+    """
+
+    def __init__(self, seed=None):
+        super().__init__(seed)
+
+    def seed(self, a=None, version=2):
+        if a is None:
+            a = int.from_bytes(os.urandom(8), 'little')
+        self._seed = operator.index(a) & MASK64
+        self._key = _key_words(self._seed)
+        self._counter = 0
+        self._words = []
+        self._pos = 0
+        self.gauss_next = None
+
+    def getstate(self):
+        return self._seed, self._counter, tuple(self._words), self._pos, self.gauss_next
+
+    def setstate(self, state):
+        seed, self._counter, words, self._pos, self.gauss_next = state
+        self._seed = seed
+        self._key = _key_words(seed)
+        self._words = list(words)
+
+    def _refill(self):
+        if np is not None:
+            count = np.arange(self._counter, self._counter + REFILL_BLOCKS, dtype=np.uint64)
+            words = _philox_arrays(count & np.uint64(MASK32), count >> np.uint64(32),
+                                   np.zeros(REFILL_BLOCKS, dtype=np.uint64),
+                                   np.full(REFILL_BLOCKS, SEQUENTIAL_DOMAIN, dtype=np.uint64), *self._key)
+            self._words = np.stack(words, axis=1).reshape(-1).tolist()
+            self._counter += REFILL_BLOCKS
+        else:
+            c = self._counter
+            self._words = list(philox4x32((c & MASK32, c >> 32 & MASK32, 0, SEQUENTIAL_DOMAIN), self._key))
+            self._counter += 1
+        self._pos = 0
+
+    def _word(self):
+        if self._pos == len(self._words):
+            self._refill()
+        word = self._words[self._pos]
+        self._pos += 1
+        return word
+
+    def random(self):
+        return _unit(self._word(), self._word())
+
+    def getrandbits(self, k):
+        if k < 0:
+            raise ValueError("number of bits must be non-negative")
+        value = 0
+        for _ in range((k + 31) // 32):
+            value = value << 32 | self._word()
+        return value >> (-k % 32)
+
+
+def counter_stream(rng):
+    """
+    The CounterStream an engine's rng argument asks for: an integer seed
+    becomes CounterStream(seed) and a CounterStream is used as is.
+
+    Returns:
+        CounterStream, or None when rng is None or a generator object
+    """
+    if isinstance(rng, CounterStream):
+        return rng
+    if rng is None or hasattr(rng, 'random'):
+        return None
+    return CounterStream(rng)
+
+
+def sequential_rng(rng):
+    """
+    A generator with random() and getrandbits() for an engine's rng
+    argument: the global random module for None, a PhiloxRandom for an
+    integer seed or a CounterStream, and rng itself otherwise.
+    """
+    if rng is None:
+        return random
+    stream = counter_stream(rng)
+    if stream is not None:
+        return stream.generator()
+    return rng
@@ -1,83 +1,285 @@
-from network_definition import NODES
-from bayes_network import get_probability, get_all_parent_values
-import itertools
+import instrumentation
+from log_math import LOG_ZERO, log, logsumexp, log_normalize
+from compiled_network import get_network
+from variable_elimination import variable_elimination
+from joint_table import query_tabulated
+from arithmetic_circuit import ArithmeticCircuit, shared_circuit
+from network_pruning import prune_network
 
-def enumerate_all(variables, evidence):
+
+def _enumerate(network, node_id, assignment):
+    """
+    Enumeration over compiled node ids.
+
+    Nodes before node_id are already assigned; unassigned entries of
+    assignment are None. The assignment list is updated in place and
+    restored before returning, so no per-level copies are made.
+    """
+    if node_id == len(network.nodes):
+        return 1.0
+
+    state = assignment[node_id]
+    if instrumentation.active:
+        instrumentation.add('enumeration.calls')
+        instrumentation.add('enumeration.cpt_lookups', 1 if state is not None else network.cardinality[node_id])
+    if state is not None:
+        prob = network.probability(node_id, state, assignment)
+        return prob * _enumerate(network, node_id + 1, assignment)
+
+    total = 0.0
+    for state in range(network.cardinality[node_id]):
+        assignment[node_id] = state
+        prob = network.probability(node_id, state, assignment)
+        total += prob * _enumerate(network, node_id + 1, assignment)
+    assignment[node_id] = None
+    return total
+
+
+def _enumerate_log(network, node_id, assignment):
+    """
+    _enumerate in log space: returns the log of the same sum, adding log
+    CPT entries and combining branches with log-sum-exp.
+    """
+    if node_id == len(network.nodes):
+        return 0.0
+
+    state = assignment[node_id]
+    if instrumentation.active:
+        instrumentation.add('enumeration.calls')
+        instrumentation.add('enumeration.cpt_lookups', 1 if state is not None else network.cardinality[node_id])
+    if state is not None:
+        log_prob = log(network.probability(node_id, state, assignment))
+        if log_prob == LOG_ZERO:
+            return LOG_ZERO
+        return log_prob + _enumerate_log(network, node_id + 1, assignment)
+
+    terms = []
+    for state in range(network.cardinality[node_id]):
+        assignment[node_id] = state
+        log_prob = log(network.probability(node_id, state, assignment))
+        if log_prob != LOG_ZERO:
+            terms.append(log_prob + _enumerate_log(network, node_id + 1, assignment))
+    assignment[node_id] = None
+    return logsumexp(terms)
+
+
+def enumerate_all(variables, evidence, network=None, log_space=False):
     """
     Core enumeration algorithm,
     args:
         variables: list of all variable names in topological order
         evidence: dictionary of variable assignments {variable: value}
+        network: CompiledNetwork to use (defaults to network_definition)
+        log_space: return the log of the sum, computed without underflow
         
     returns:
         Sum of probabilities over all assignments consistent with evidence
     """
-    if not variables:
-        return 1.0
-    
-    # Get the first variable
-    var = variables[0]
-    remaining = variables[1:]
-    
-    if var in evidence:
-        # If variable is in evidence, use that value
-        val = evidence[var]
-        parent_values = get_all_parent_values(var, evidence)
-        prob = get_probability(var, val, parent_values)
-        return prob * enumerate_all(remaining, evidence)
-    else:
-        # If variable is not in evidence, sum over both possible values
-        total = 0.0
-        for val in [True, False]:
-            new_evidence = evidence.copy()
-            new_evidence[var] = val
-            parent_values = get_all_parent_values(var, new_evidence)
-            prob = get_probability(var, val, parent_values)
-            total += prob * enumerate_all(remaining, new_evidence)
-        return total
-
-
-def exact_inference(query_vars, evidence):
+    if network is None:
+        network = get_network()
+    if list(variables) != network.nodes[len(network.nodes) - len(variables):]:
+        raise ValueError("variables must be a suffix of the network's topological order")
+
+    assignment = [None] * len(network.nodes)
+    for node_id, state in network.encode_evidence(evidence).items():
+        assignment[node_id] = state
+
+    # Nodes before the suffix contribute through the evidence only
+    if log_space:
+        return _enumerate_log(network, len(network.nodes) - len(variables), assignment)
+    return _enumerate(network, len(network.nodes) - len(variables), assignment)
+
+
+def exact_inference(query_vars, evidence, network=None, log_space=False):
     """
     Compute P(query_vars | evidence) using enumeration.
     
     Args:
         query_vars: List of query variable names (e.g., ['J'] or ['M', 'A'])
         evidence: Dictionary of evidence {variable: value} (e.g., {'A': True, 'B': False})
+        network: CompiledNetwork to use (defaults to network_definition)
+        log_space: accumulate log probabilities and normalize with
+                   log-sum-exp, for evidence too unlikely for floats
     
     Returns:
         Dictionary mapping query variable assignments to probabilities
         Example: {(True,): 0.9} for single variable or {(True, True): 0.5, ...} for multiple
     """
-    query_combinations = list(itertools.product([True, False], repeat=len(query_vars)))
-    
-    unnormalized = {}
-    
-    for combination in query_combinations:
-        extended_evidence = evidence.copy()
-        for i, var in enumerate(query_vars):
-            extended_evidence[var] = combination[i]
-        
-        # Enumerate over all variables in topological order
-        prob = enumerate_all(NODES, extended_evidence)
-        unnormalized[combination] = prob
-    
+    if network is None:
+        network = get_network()
+    return enumerate_query(network, network.query_ids(query_vars), network.encode_evidence(evidence), log_space)
+
+
+def enumerate_query(network, query_ids, encoded, log_space=False):
+    """
+    exact_inference over compiled ids: query_ids is a list of node ids and
+    encoded is the evidence as {node_id: state}.
+
+    All query assignments come out of one depth-first pass: the nodes up to
+    the last query node are enumerated with the running product of their
+    CPT entries, and once every query node has a state the remaining suffix
+    is summed by _enumerate. Prefixes shared by several query assignments
+    are therefore computed once. A query node that is also evidence keeps
+    its observed value.
+    """
+    assignment = [None] * len(network.nodes)
+    for node_id, state in encoded.items():
+        assignment[node_id] = state
+
+    last = max(query_ids, default=-1)
+    if log_space:
+        buckets = {combination: [] for combination in network.assignments(query_ids)}
+        _enumerate_joint_log(network, 0, assignment, 0.0, query_ids, last, buckets)
+        with instrumentation.timer('normalize'):
+            return log_normalize({network.decode(query_ids, k): logsumexp(terms) for k, terms in buckets.items()})
+
+    buckets = {combination: 0.0 for combination in network.assignments(query_ids)}
+    _enumerate_joint(network, 0, assignment, 1.0, query_ids, last, buckets)
+
     # Normalize the probabilities
-    total = sum(unnormalized.values())
-    normalized = {k: v / total for k, v in unnormalized.items()}
-    
-    return normalized
+    with instrumentation.timer('normalize'):
+        total = sum(buckets.values())
+        if total == 0:
+            raise ValueError("Evidence has zero probability")
+        return {network.decode(query_ids, k): v / total for k, v in buckets.items()}
+
+
+def _enumerate_joint(network, node_id, assignment, weight, query_ids, last, buckets):
+    """
+    Depth-first enumeration of nodes node_id..last, adding the probability
+    of every completed prefix (times the summed suffix) to the bucket of its
+    query states.
+    """
+    if node_id > last:
+        key = tuple(assignment[i] for i in query_ids)
+        buckets[key] += weight * _enumerate(network, node_id, assignment)
+        return
+
+    state = assignment[node_id]
+    if instrumentation.active:
+        instrumentation.add('enumeration.calls')
+        instrumentation.add('enumeration.cpt_lookups', 1 if state is not None else network.cardinality[node_id])
+    if state is not None:
+        prob = network.probability(node_id, state, assignment)
+        if prob > 0:
+            _enumerate_joint(network, node_id + 1, assignment, weight * prob, query_ids, last, buckets)
+        return
+
+    for state in range(network.cardinality[node_id]):
+        assignment[node_id] = state
+        prob = network.probability(node_id, state, assignment)
+        if prob > 0:
+            _enumerate_joint(network, node_id + 1, assignment, weight * prob, query_ids, last, buckets)
+    assignment[node_id] = None
+
+
+def _enumerate_joint_log(network, node_id, assignment, log_weight, query_ids, last, buckets):
+    """
+    _enumerate_joint in log space: buckets collect the log terms of every
+    query assignment, to be combined with log-sum-exp.
+    """
+    if node_id > last:
+        suffix = _enumerate_log(network, node_id, assignment)
+        if suffix != LOG_ZERO:
+            buckets[tuple(assignment[i] for i in query_ids)].append(log_weight + suffix)
+        return
+
+    observed = assignment[node_id]
+    if instrumentation.active:
+        instrumentation.add('enumeration.calls')
+        instrumentation.add('enumeration.cpt_lookups', 1 if observed is not None else network.cardinality[node_id])
+    for state in (observed,) if observed is not None else range(network.cardinality[node_id]):
+        assignment[node_id] = state
+        log_prob = log(network.probability(node_id, state, assignment))
+        if log_prob != LOG_ZERO:
+            _enumerate_joint_log(network, node_id + 1, assignment, log_weight + log_prob, query_ids, last, buckets)
+    assignment[node_id] = observed
+
+
+def marginalize_joint(joint_vars, joint, query_vars):
+    """
+    Marginal of query_vars from a joint distribution over joint_vars.
+
+    Args:
+        joint_vars: variables of the joint, in key order
+        joint: dictionary {tuple of values: probability}
+        query_vars: subset of joint_vars (any order)
+
+    Returns:
+        Dictionary mapping query assignments to probabilities
+    """
+    positions = [joint_vars.index(v) for v in query_vars]
+    result = {}
+    for values, prob in joint.items():
+        key = tuple(values[p] for p in positions)
+        result[key] = result.get(key, 0.0) + prob
+    return result
 
 
-def query_exact(query_vars, evidence):
+def query_exact(query_vars, evidence, method='enumeration', heuristic='min_fill', network=None, prune=False,
+                log_space=False):
     """
     Run exact inference and return results.
     
     Args:
         query_vars: List of query variables
         evidence: Dictionary of evidence
+        method: 'enumeration', 'elimination' (variable elimination),
+                'tabulated' (precomputed full joint, small networks only) or
+                'circuit' (compiled arithmetic circuit, needs numpy)
+        heuristic: elimination order for 'elimination' ('min_fill', 'min_degree' or a list)
+        network: CompiledNetwork to use (defaults to network_definition)
+        prune: first drop the barren and d-separated nodes (see network_pruning)
+        log_space: work with log probabilities ('enumeration' and
+                   'elimination' only), for rare evidence on deep networks
     
     Returns:
         Dictionary of probabilities for each query assignment
     """
-    return exact_inference(query_vars, evidence)
\ No newline at end of file
+    if log_space and method not in ('enumeration', 'elimination'):
+        raise ValueError(f"log_space is not supported by the {method} method")
+    if prune:
+        network, evidence, _ = prune_network(query_vars, evidence, network)
+
+    if method not in ('enumeration', 'elimination', 'tabulated', 'circuit'):
+        raise ValueError(f"Unknown exact inference method: {method}")
+    instrumentation.add(f'{method}.queries')
+    with instrumentation.timer('infer'):
+        if method == 'enumeration':
+            return exact_inference(query_vars, evidence, network, log_space)
+        elif method == 'elimination':
+            return variable_elimination(query_vars, evidence, heuristic, network, log_space)
+        elif method == 'circuit':
+            if prune:
+                # A pruned network is new for every query, so its circuit is not kept
+                return ArithmeticCircuit.compile(network).query(query_vars, evidence)
+            return shared_circuit(network if network is not None else get_network()).query(query_vars, evidence)
+        else:
+            # Likewise, the table of a pruned network is not kept
+            return query_tabulated(query_vars, evidence, network, keep=not prune)
+
+
+def query_exact_many(queries, evidence, method='enumeration', heuristic='min_fill', network=None, prune=False):
+    """
+    Answer several query variable sets that share the same evidence.
+
+    The engine runs once, for the posterior joint over the union of all the
+    query variables, and every query is marginalized from that joint. The
+    joint has one entry per assignment of the union, so this pays off while
+    the union stays small (as with the few variables of a batch block).
+
+    Args:
+        queries: list of query variable lists
+        evidence: Dictionary of evidence shared by all the queries
+        method, heuristic, network, prune: as for query_exact
+
+    Returns:
+        List of probability dictionaries, in the order of queries
+    """
+    union = []
+    for query_vars in queries:
+        for var in query_vars:
+            if var not in union:
+                union.append(var)
+    joint = query_exact(union, evidence, method, heuristic, network, prune)
+    return [marginalize_joint(union, joint, query_vars) for query_vars in queries]
@@ -0,0 +1,294 @@
+import math
+import random
+from collections import namedtuple
+
+import instrumentation
+from compiled_network import get_network
+from sampling_inference import counts_to_probabilities
+from counter_rng import counter_stream, sequential_rng
+
+# Result of gibbs_query: the posterior estimate plus per-assignment diagnostics
+GibbsResult = namedtuple('GibbsResult', ['probabilities', 'r_hat', 'ess', 'samples', 'chains'])
+
+DEFAULT_CHAINS = 4
+DEFAULT_BURN_IN = 100
+
+# Tries at drawing a starting state consistent with the evidence
+MAX_INIT_TRIES = 1000
+
+
+def markov_blankets(network):
+    """
+    For every node, the nodes whose CPT entries mention it: the node itself
+    followed by its children. The product of those entries is proportional
+    to P(node | Markov blanket).
+
+    Returns:
+        List of node id tuples indexed by node id
+    """
+    return [(node_id,) + tuple(network.children[node_id]) for node_id in range(len(network.nodes))]
+
+
+def _initial_state(network, evidence, rng):
+    """
+    Forward-sample the non-evidence nodes with the evidence clamped, retrying
+    until the state has non-zero probability.
+    """
+    for _ in range(MAX_INIT_TRIES):
+        states = [0] * len(network.nodes)
+        weight = 1.0
+        for node_id in range(len(network.nodes)):
+            config = network.parent_config(node_id, states)
+            if node_id in evidence:
+                states[node_id] = evidence[node_id]
+                weight *= network.tables[node_id][config * network.cardinality[node_id] + evidence[node_id]]
+            else:
+                states[node_id] = network.sample_state(node_id, config, rng.random())
+        if weight > 0:
+            return states
+    raise ValueError("Could not find a state consistent with the evidence")
+
+
+def _run_chain(network, query_ids, evidence, num_samples, burn_in, thin, seed):
+    """
+    One Gibbs chain with a systematic scan over the non-evidence nodes.
+
+    Args:
+        network: CompiledNetwork
+        query_ids: query node ids
+        evidence: dictionary of encoded evidence {node_id: state}
+        num_samples: number of samples to keep
+        burn_in: sweeps discarded before the first kept sample
+        thin: sweeps between kept samples
+        seed: seed for this chain's own random.Random, or the chain's
+              generator itself
+
+    Returns:
+        List of query state tuples, one per kept sample
+    """
+    rng = seed if hasattr(seed, 'random') else random.Random(seed)
+    states = _initial_state(network, evidence, rng)
+    blankets = markov_blankets(network)
+    free = [i for i in range(len(network.nodes)) if i not in evidence]
+
+    trace = []
+    sweeps = burn_in + num_samples * thin
+    for sweep in range(1, sweeps + 1):
+        for node_id in free:
+            # P(node = s | Markov blanket), up to a constant
+            weights = []
+            for s in range(network.cardinality[node_id]):
+                states[node_id] = s
+                w = 1.0
+                for f in blankets[node_id]:
+                    w *= network.probability(f, states[f], states)
+                weights.append(w)
+
+            u = rng.random() * sum(weights)
+            state = len(weights) - 1
+            for s, w in enumerate(weights):
+                u -= w
+                if u < 0:
+                    state = s
+                    break
+            states[node_id] = state
+
+        if sweep > burn_in and (sweep - burn_in) % thin == 0:
+            trace.append(tuple(states[i] for i in query_ids))
+    return trace
+
+
+def _chain_task(task):
+    """
+    Process-pool entry point for _run_chain; the network is looked up in
+    the worker unless one was passed along.
+    """
+    network, query_ids, evidence, num_samples, burn_in, thin, seed = task
+    if network is None:
+        network = get_network()
+    return _run_chain(network, query_ids, evidence, num_samples, burn_in, thin, seed)
+
+
+def _chain_lengths(num_samples, chains):
+    return [num_samples // chains + (1 if c < num_samples % chains else 0) for c in range(chains)]
+
+
+def run_chains(query_vars, evidence, num_samples, chains=DEFAULT_CHAINS, burn_in=DEFAULT_BURN_IN,
+               thin=1, pool=None, network=None, rng=None):
+    """
+    Run several independent Gibbs chains and return their traces.
+
+    Each chain is seeded from rng (the global random module by default) in
+    a fixed order, so the traces depend only on the seed and not on
+    whether (or how) a process pool runs them. With an integer seed or a
+    CounterStream, chain c runs on the Philox stream spawned for c.
+
+    Args:
+        query_vars: List of query variable names
+        evidence: Dictionary of evidence
+        num_samples: Number of kept samples, split evenly across the chains
+        chains: Number of chains
+        burn_in: Sweeps each chain discards before keeping samples
+        thin: Keep one sample every thin sweeps
+        pool: Optional concurrent.futures executor to run the chains on
+        network: CompiledNetwork to use (defaults to network_definition)
+        rng: random generator or seed (see sampling_inference.prior_sampling)
+
+    Returns:
+        List of traces (lists of query state tuples), one per chain
+    """
+    if chains < 1 or thin < 1 or burn_in < 0:
+        raise ValueError("Need at least one chain, thin >= 1 and burn_in >= 0")
+    shipped = network
+    if network is None:
+        network = get_network()
+    query_ids = network.query_ids(query_vars)
+    encoded = network.encode_evidence(evidence)
+
+    counter = counter_stream(rng)
+    if counter is not None:
+        seeds = [counter.spawn(c).generator() for c in range(chains)]
+    else:
+        generator = sequential_rng(rng)
+        seeds = [generator.getrandbits(64) for _ in range(chains)]
+    tasks = [(shipped, query_ids, encoded, n, burn_in, thin, seed)
+             for n, seed in zip(_chain_lengths(num_samples, chains), seeds)]
+    if instrumentation.active:
+        instrumentation.add('gibbs.chains', len(tasks))
+        instrumentation.add('gibbs.sweeps', sum(burn_in + task[3] * thin for task in tasks))
+        instrumentation.add('gibbs.samples_kept', num_samples)
+    if pool is not None:
+        return list(pool.map(_chain_task, tasks))
+    return [_run_chain(network, *task[1:]) for task in tasks]
+
+
+def _autocorrelations(series, mean, variance):
+    n = len(series)
+    centered = [x - mean for x in series]
+    rho = []
+    for lag in range(1, n):
+        cov = sum(centered[t] * centered[t + lag] for t in range(n - lag)) / n
+        rho.append(cov / variance)
+        # Geyer's initial positive sequence: stop once a pair of
+        # consecutive autocorrelations sums to a negative number
+        if len(rho) % 2 == 0 and rho[-2] + rho[-1] < 0:
+            rho = rho[:-2]
+            break
+    return rho
+
+
+def effective_sample_size(series_per_chain):
+    """
+    Effective sample size of a scalar quantity traced by several chains,
+    summing each chain's n / (1 + 2 * sum of autocorrelations).
+    """
+    ess = 0.0
+    for series in series_per_chain:
+        n = len(series)
+        if n < 2:
+            ess += n
+            continue
+        mean = sum(series) / n
+        variance = sum((x - mean) ** 2 for x in series) / n
+        if variance == 0:
+            ess += n
+            continue
+        tau = 1 + 2 * sum(_autocorrelations(series, mean, variance))
+        ess += n / max(tau, 1e-12)
+    return ess
+
+
+def r_hat(series_per_chain):
+    """
+    Gelman-Rubin potential scale reduction factor. Values near 1 mean the
+    chains agree; nan when it cannot be computed (fewer than two chains or
+    samples, or no variation within any chain).
+    """
+    chains = [s for s in series_per_chain if s]
+    if len(chains) < 2:
+        return float('nan')
+    n = min(len(s) for s in chains)
+    if n < 2:
+        return float('nan')
+    chains = [s[:n] for s in chains]
+    means = [sum(s) / n for s in chains]
+    grand = sum(means) / len(chains)
+    between = n * sum((m - grand) ** 2 for m in means) / (len(chains) - 1)
+    within = sum(sum((x - m) ** 2 for x in s) / (n - 1) for s, m in zip(chains, means)) / len(chains)
+    if within == 0:
+        return float('nan') if between == 0 else float('inf')
+    pooled = (n - 1) / n * within + between / n
+    return math.sqrt(pooled / within)
+
+
+def gibbs_query(query_vars, evidence, num_samples, chains=DEFAULT_CHAINS, burn_in=DEFAULT_BURN_IN,
+                thin=1, pool=None, network=None, rng=None):
+    """
+    Gibbs sampling estimate of P(query_vars | evidence) with convergence
+    diagnostics. R-hat and ESS are computed for the indicator of every
+    query assignment.
+
+    Returns:
+        GibbsResult(probabilities, r_hat, ess, samples, chains) where r_hat
+        and ess are dictionaries keyed like probabilities
+    """
+    if network is None:
+        network = get_network()
+    traces = run_chains(query_vars, evidence, num_samples, chains, burn_in, thin, pool, network, rng)
+    query_ids = network.query_ids(query_vars)
+
+    counts = {}
+    for trace in traces:
+        for key in trace:
+            counts[key] = counts.get(key, 0) + 1
+    probabilities = counts_to_probabilities(query_vars, counts, num_samples, network)
+
+    r_hats = {}
+    ess = {}
+    for combination in network.assignments(query_ids):
+        indicators = [[1.0 if key == combination else 0.0 for key in trace] for trace in traces]
+        value = network.decode(query_ids, combination)
+        r_hats[value] = r_hat(indicators)
+        ess[value] = effective_sample_size(indicators)
+
+    return GibbsResult(probabilities, r_hats, ess, num_samples, len(traces))
+
+
+def gibbs_counts(query_vars, evidence, num_samples, chains=DEFAULT_CHAINS, burn_in=DEFAULT_BURN_IN,
+                 thin=1, network=None, rng=None):
+    """
+    Gibbs sampling tallies over the kept samples of every chain.
+
+    Returns:
+        Tuple of (counts keyed by query state tuples, number of kept samples)
+    """
+    counts = {}
+    for trace in run_chains(query_vars, evidence, num_samples, chains, burn_in, thin, network=network, rng=rng):
+        for key in trace:
+            counts[key] = counts.get(key, 0) + 1
+    return counts, num_samples
+
+
+def gibbs_sampling(query_vars, evidence, num_samples, chains=DEFAULT_CHAINS, burn_in=DEFAULT_BURN_IN,
+                   thin=1, network=None, rng=None):
+    """
+    Approximate P(query_vars | evidence) using Gibbs sampling: each chain
+    repeatedly resamples every non-evidence node from its distribution
+    given its Markov blanket.
+
+    Args:
+        query_vars: List of query variable names
+        evidence: Dictionary of evidence
+        num_samples: Number of kept samples, split across the chains
+        chains: Number of independent chains
+        burn_in: Sweeps each chain discards first
+        thin: Keep one sample every thin sweeps
+        network: CompiledNetwork to use (defaults to network_definition)
+        rng: random generator or seed (see run_chains)
+
+    Returns:
+        Dictionary mapping query assignments to probabilities
+    """
+    with instrumentation.timer('infer'):
+        counts, total = gibbs_counts(query_vars, evidence, num_samples, chains, burn_in, thin, network, rng)
+    return counts_to_probabilities(query_vars, counts, total, network)
@@ -0,0 +1,375 @@
+import json
+import time
+import random
+import signal
+import asyncio
+from urllib.parse import urlsplit, parse_qs
+
+import instrumentation
+from compiled_network import get_network
+from exact_inference import query_exact_many
+from batch_queries import ENGINES, EXACT_METHODS, marginalize_joint, joint_posterior
+from query_cache import QueryCache
+from parallel_sampling import make_pool
+
+# Engines answered in the event loop; everything else goes to the worker pool
+INLINE_ENGINES = tuple(EXACT_METHODS)
+
+# How long sampling requests wait for others with the same evidence (seconds)
+DEFAULT_BATCH_WINDOW = 0.005
+
+MAX_BODY_BYTES = 1 << 20
+
+# Largest sample count one request may ask for
+DEFAULT_MAX_SAMPLES = 1000000
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 431: 'Request Header Fields Too Large',
+               500: 'Internal Server Error'}
+
+
+def _sample_joint(union_vars, evidence, engine, num_samples, seed):
+    """
+    Worker entry point: one sampling run on the counter-based stream of
+    seed, so the answer does not depend on which worker runs it and forked
+    workers do not replay the same random stream.
+    """
+    return joint_posterior(union_vars, evidence, engine, num_samples, seed)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class MicroBatcher:
+    """
+    Groups concurrent queries that share engine, sample count and evidence,
+    and answers each group with one inference run over the union of their
+    query variables (as BatchAnswerer does for batch files).
+
+    Exact groups are flushed on the next turn of the event loop and run
+    inline; sampling groups wait batch_window seconds for company and then
+    run on the executor, so a slow sampler never blocks exact queries.
+    Exact groups go through query_exact_many and their answers are
+    memoized, since they never change; the memo is an LRU of memo_size
+    entries, so a long-running server does not grow without bound.
+    """
+
+    def __init__(self, executor, batch_window=DEFAULT_BATCH_WINDOW, memo_size=1024):
+        self.executor = executor
+        self.batch_window = batch_window
+        self.pending = {}
+        self.answers = QueryCache(memo_size)
+
+    def submit(self, evidence, query_vars, engine, num_samples, seed=None):
+        """
+        Queue one query. Sampling queries with a seed are only grouped with
+        queries that give the same seed; the others get a fresh seed per
+        group.
+
+        Returns:
+            asyncio.Future resolving to the probability dictionary
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if engine in INLINE_ENGINES:
+            num_samples = seed = None
+        key = (engine, num_samples, seed, tuple(sorted(evidence.items())))
+        if key not in self.pending:
+            self.pending[key] = []
+            if engine in INLINE_ENGINES:
+                loop.call_soon(self._flush, key)
+            else:
+                loop.call_later(self.batch_window, self._flush, key)
+        self.pending[key].append((query_vars, future))
+        return future
+
+    def _flush(self, key):
+        members = self.pending.pop(key)
+        engine, num_samples, seed, evidence_key = key
+        instrumentation.add('server.batches')
+        instrumentation.add('server.batched_queries', len(members))
+        instrumentation.maximum('server.batch_size_max', len(members))
+
+        if engine in INLINE_ENGINES:
+            try:
+                self._answer_exact(engine, evidence_key, members)
+            except Exception as e:
+                self._fail(members, e)
+            return
+
+        union = []
+        for query_vars, _ in members:
+            for var in query_vars:
+                if var not in union:
+                    union.append(var)
+        union_vars = tuple(sorted(union))
+
+        loop = asyncio.get_running_loop()
+        job = loop.run_in_executor(self.executor, _sample_joint, list(union_vars), dict(evidence_key),
+                                   engine, num_samples, random.getrandbits(64) if seed is None else seed)
+        job.add_done_callback(lambda done: self._finish(members, union_vars, done))
+
+    def _answer_exact(self, engine, evidence_key, members):
+        self.answers.check_network(get_network())
+        found = {}
+        missing = []
+        for query_vars, _ in members:
+            memo = (engine, evidence_key, tuple(query_vars))
+            if memo in found or memo in missing:
+                continue
+            answer = self.answers.get(memo)
+            if answer is None:
+                missing.append(memo)
+            else:
+                found[memo] = answer
+        if missing:
+            answers = query_exact_many([list(memo[2]) for memo in missing], dict(evidence_key),
+                                       EXACT_METHODS[engine])
+            for memo, answer in zip(missing, answers):
+                self.answers.put(memo, answer)
+                found[memo] = answer
+        for query_vars, future in members:
+            if not future.done():
+                future.set_result(dict(found[(engine, evidence_key, tuple(query_vars))]))
+
+    def _finish(self, members, union_vars, done):
+        if done.exception() is not None:
+            self._fail(members, done.exception())
+        else:
+            self._resolve(members, union_vars, done.result())
+
+    def _resolve(self, members, union_vars, joint):
+        for query_vars, future in members:
+            if not future.done():
+                future.set_result(marginalize_joint(union_vars, joint, query_vars))
+
+    def _fail(self, members, error):
+        for _, future in members:
+            if not future.done():
+                future.set_exception(error)
+
+
+class InferenceServer:
+    """
+    Minimal HTTP/1.1 JSON server over asyncio streams.
+
+    Endpoints:
+        POST /query   body is a query line ([<N,V>][Q] or JSON); JSON bodies
+                      may also give "engine", "samples" and "seed"
+        GET  /query?q=[<N,V>][Q]&engine=...&samples=...&seed=...
+        GET  /health  liveness and the loaded network size
+        GET  /metrics Prometheus text (request, batching and engine counters)
+    """
+
+    def __init__(self, parse, render, workers=2, batch_window=DEFAULT_BATCH_WINDOW, default_samples=1000,
+                 max_samples=DEFAULT_MAX_SAMPLES):
+        """
+        Args:
+            parse: function turning a query line into (evidence, query_vars)
+            render: function (line, query_vars, result) -> JSON-ready dict
+            workers: processes in the sampling pool
+            batch_window: seconds sampling requests wait to be batched
+            default_samples: samples per query when the request gives none
+            max_samples: largest sample count a request may ask for
+        """
+        self.parse = parse
+        self.render = render
+        self.workers = workers
+        self.batch_window = batch_window
+        self.default_samples = default_samples
+        self.max_samples = max_samples
+        self.recorder = instrumentation.Recorder()
+        self.started = time.time()
+        self.executor = None
+        self.batcher = None
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=8000):
+        self.executor = make_pool(self.workers)
+        # Fork the workers before the listening socket exists, so they do
+        # not inherit it (and keep the port bound after the server exits)
+        await asyncio.get_running_loop().run_in_executor(self.executor, int)
+        self.batcher = MicroBatcher(self.executor, self.batch_window)
+        self.server = await asyncio.start_server(self._connection, host, port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, host='127.0.0.1', port=8000):
+        """
+        Serve until interrupted, recording engine counters for /metrics.
+        """
+        async def main():
+            bound_host, bound_port = await self.start(host, port)
+            print(f"Serving on http://{bound_host}:{bound_port} (Ctrl-C to stop)", flush=True)
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self.server.close)
+            try:
+                await self.server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+            finally:
+                await self.close()
+
+        with instrumentation.capture(self.recorder):
+            try:
+                asyncio.run(main())
+            except KeyboardInterrupt:
+                pass
+
+    async def _connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as e:
+                    # The rest of the stream cannot be trusted, so answer and close
+                    self.recorder.add('server.requests')
+                    self.recorder.add('server.errors')
+                    await self._respond(writer, e.status, 'application/json', json.dumps({'error': str(e)}), False)
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                start = time.perf_counter()
+                try:
+                    status, content_type, payload = await self._route(method, target, body)
+                except HTTPError as e:
+                    status, content_type, payload = e.status, 'application/json', json.dumps({'error': str(e)})
+                except Exception as e:
+                    status, content_type, payload = 500, 'application/json', json.dumps({'error': str(e)})
+                self.recorder.observe('request', time.perf_counter() - start)
+                self.recorder.add('server.requests')
+                if status >= 400:
+                    self.recorder.add('server.errors')
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self._respond(writer, status, content_type, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, content_type, payload, keep_alive):
+        data = payload.encode()
+        writer.write(
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data
+        )
+        await writer.drain()
+
+    async def _read_request(self, reader):
+        """
+        Returns:
+            Tuple of (method, target, headers, body), or None at end of stream
+
+        Raises:
+            HTTPError: 400 for a malformed request, 413 for an oversized body,
+                       431 for a line longer than the reader's limit
+        """
+        line = await self._read_line(reader)
+        if not line.strip():
+            return None
+        parts = line.decode('latin-1').split()
+        if len(parts) != 3:
+            raise HTTPError(400, "Malformed request line")
+        method, target, _ = parts
+
+        headers = {}
+        while True:
+            line = await self._read_line(reader)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length', 0) or 0)
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length < 0:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b''
+        try:
+            return method, target, headers, body.decode('utf-8')
+        except UnicodeDecodeError:
+            raise HTTPError(400, "Request body is not UTF-8")
+
+    async def _read_line(self, reader):
+        try:
+            return await reader.readline()
+        except ValueError:
+            # asyncio.LimitOverrunError: no line end within the reader's limit
+            raise HTTPError(431, "Request line or header too long")
+
+    async def _route(self, method, target, body):
+        url = urlsplit(target)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        if url.path == '/health':
+            return 200, 'application/json', json.dumps({
+                'status': 'ok',
+                'nodes': len(get_network().nodes),
+                'uptime_seconds': time.time() - self.started,
+            })
+        if url.path == '/metrics':
+            return 200, 'text/plain; version=0.0.4', self.recorder.to_prometheus()
+        if url.path != '/query':
+            raise HTTPError(404, f"Unknown path: {url.path}")
+
+        if method == 'GET':
+            line = params.get('q', '')
+        elif method == 'POST':
+            line = body.strip()
+        else:
+            raise HTTPError(405, f"Method {method} not allowed")
+        return 200, 'application/json', json.dumps(await self._query(line, params))
+
+    async def _query(self, line, params):
+        engine = params.get('engine', 'exact')
+        samples = params.get('samples', self.default_samples)
+        seed = params.get('seed')
+        try:
+            if line.startswith('{'):
+                item = json.loads(line)
+                engine = item.get('engine', engine)
+                samples = item.get('samples', samples)
+                seed = item.get('seed', seed)
+            try:
+                samples = int(samples)
+            except TypeError:
+                raise ValueError(f"Invalid number of samples: {samples!r}")
+            if samples <= 0:
+                raise ValueError("Number of samples must be positive")
+            if samples > self.max_samples:
+                raise ValueError(f"Number of samples must be at most {self.max_samples}")
+            if seed is not None:
+                seed = int(seed)
+            if engine not in ENGINES or engine == 'bank':
+                raise ValueError(f"Unknown engine: {engine}")
+            evidence, query_vars = self.parse(line)
+            if not query_vars:
+                raise ValueError("No query variables specified")
+        except (TypeError, ValueError) as e:
+            raise HTTPError(400, str(e))
+
+        try:
+            result = await self.batcher.submit(evidence, query_vars, engine, samples, seed)
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        record = self.render(line, query_vars, result)
+        record['engine'] = engine
+        return record
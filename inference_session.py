@@ -0,0 +1,127 @@
+from compiled_network import get_network
+from junction_tree import JunctionTree
+from variable_elimination import variable_elimination
+
+
+class InferenceSession:
+    """
+    Evidence that arrives one observation at a time.
+
+    The session keeps a calibrated junction tree. observe() and retract()
+    only invalidate the messages that flow out of the cliques holding the
+    changed node, so the next posterior() recomputes a few messages instead
+    of the whole network. Answers are memoized until the evidence changes.
+
+    fork() copies the session in O(cliques): the compiled tree and every
+    cached factor are shared, so what-if branches are cheap.
+
+        session = InferenceSession()
+        session.observe('J', True)
+        session.posterior(['B'])
+        what_if = session.fork().observe('M', True)
+    """
+
+    def __init__(self, network=None, tree=None):
+        """
+        Args:
+            network: CompiledNetwork to use (defaults to network_definition)
+            tree: existing JunctionTree to start from (its evidence is kept)
+        """
+        if tree is None:
+            tree = JunctionTree(network if network is not None else get_network())
+        self.tree = tree
+        self.network = tree.network
+        self.evidence = {self.network.nodes[i]: self.network.domains[i][s] for i, s in tree.evidence.items()}
+        self.answers = {}
+
+    def observe(self, node, value):
+        """
+        Add (or change) one observation.
+
+        Returns:
+            The session, so calls can be chained
+        """
+        evidence = dict(self.evidence)
+        evidence[node] = value
+        self._set(evidence)
+        return self
+
+    def retract(self, node):
+        """
+        Withdraw the observation of node.
+
+        Returns:
+            The session, so calls can be chained
+        """
+        if node not in self.evidence:
+            raise ValueError(f"{node} is not observed")
+        evidence = dict(self.evidence)
+        del evidence[node]
+        self._set(evidence)
+        return self
+
+    def _set(self, evidence):
+        # set_evidence validates names and values before anything changes
+        self.tree.set_evidence(evidence)
+        self.evidence = evidence
+        self.answers = {}
+
+    def posterior(self, query_vars):
+        """
+        P(query_vars | current evidence), in the same format as query_exact.
+
+        Queries that fit inside one clique are read off the tree; a joint
+        query spread over several cliques falls back to variable elimination.
+        An observed query variable keeps its observed value.
+        """
+        key = tuple(query_vars)
+        if key not in self.answers:
+            self.answers[key] = self._posterior(list(query_vars))
+        return dict(self.answers[key])
+
+    def _posterior(self, query_vars):
+        network = self.network
+        query_ids = network.query_ids(query_vars)
+        free = [i for i in query_ids if i not in self.tree.evidence]
+
+        if not free:
+            distribution = {(): 1.0}
+        else:
+            clique = self.tree.clique_for(free)
+            if clique is not None:
+                distribution = self.tree._distribution(clique, free)
+            else:
+                distribution = variable_elimination([network.nodes[i] for i in free], self.evidence, network=network)
+
+        # Put the observed query variables back, at their observed values
+        result = {}
+        for combination in network.assignments(query_ids):
+            values = network.decode(query_ids, combination)
+            if any(i in self.tree.evidence and s != self.tree.evidence[i] for i, s in zip(query_ids, combination)):
+                result[values] = 0.0
+                continue
+            free_values = tuple(v for i, v in zip(query_ids, values) if i not in self.tree.evidence)
+            result[values] = distribution[free_values]
+        return result
+
+    def marginals(self):
+        """
+        Posterior marginal of every unobserved node, from one calibration.
+        """
+        return self.tree.marginals()
+
+    def fork(self):
+        """
+        Independent copy of the session sharing all cached work so far.
+        """
+        other = InferenceSession(tree=self.tree.copy())
+        other.answers = dict(self.answers)
+        return other
+
+    @property
+    def messages_computed(self):
+        """
+        Junction tree messages computed so far, counting those inherited
+        at a fork.
+        """
+        return self.tree.messages_computed
@@ -0,0 +1,162 @@
+import json
+import time
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+
+# Checked by the engines before recording anything, so instrumentation
+# costs one attribute lookup per event while it is switched off
+active = False
+_recorder = None
+
+# Innermost phase timer running in the current thread or asyncio task, so
+# concurrent queries never charge their time to each other's phases
+_open_timer = ContextVar('open_timer', default=None)
+
+
+class Recorder:
+    """
+    Counters and phase timers collected while a capture is running.
+
+    Counter names are dotted, engine first (e.g. 'enumeration.calls',
+    'rejection.samples_accepted'); phases are 'parse', 'prune', 'compile',
+    'infer' and 'normalize'. Phase times are exclusive: a phase timed inside
+    another (normalize inside infer, say) is not counted in the outer one,
+    so the phase totals add up to the time spent.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.timers = {}
+
+    def add(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def maximum(self, name, value):
+        if value > self.counters.get(name, value - 1):
+            self.counters[name] = value
+
+    def observe(self, phase, seconds):
+        calls, total = self.timers.get(phase, (0, 0.0))
+        self.timers[phase] = (calls + 1, total + seconds)
+
+    def reset(self):
+        self.counters.clear()
+        self.timers.clear()
+
+    def to_dict(self):
+        return {
+            'counters': dict(sorted(self.counters.items())),
+            'timers': {phase: {'calls': calls, 'seconds': seconds}
+                       for phase, (calls, seconds) in sorted(self.timers.items())},
+        }
+
+    def to_json(self, indent=None):
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def to_prometheus(self, prefix='bayes'):
+        """
+        The counters and timers in the Prometheus text exposition format.
+        """
+        lines = []
+        for name, value in sorted(self.counters.items()):
+            metric = f"{prefix}_{name.replace('.', '_')}"
+            kind = 'gauge' if name.endswith(('_max', '_sum')) else 'counter'
+            if kind == 'counter':
+                metric += '_total'
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.append(f"{metric} {value}")
+        if self.timers:
+            metric = f"{prefix}_phase_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for phase, (calls, seconds) in sorted(self.timers.items()):
+                lines.append(f'{metric}_sum{{phase="{phase}"}} {seconds}')
+                lines.append(f'{metric}_count{{phase="{phase}"}} {calls}')
+        return '\n'.join(lines) + '\n'
+
+
+def add(name, value=1):
+    """
+    Add to a counter of the running capture (no-op when none is running).
+    """
+    if active:
+        _recorder.add(name, value)
+
+
+def maximum(name, value):
+    """
+    Keep the largest value seen for a counter (e.g. peak factor size).
+    """
+    if active:
+        _recorder.maximum(name, value)
+
+
+class _PhaseTimer:
+    __slots__ = ('phase', 'start', 'nested', 'token')
+
+    def __init__(self, phase):
+        self.phase = phase
+        self.nested = 0.0
+
+    def __enter__(self):
+        self.token = _open_timer.set(self)
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        _open_timer.reset(self.token)
+        outer = _open_timer.get()
+        if outer is not None:
+            outer.nested += elapsed
+        if _recorder is not None:
+            _recorder.observe(self.phase, elapsed - self.nested)
+        return False
+
+
+class _NoTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_TIMER = _NoTimer()
+
+
+def timer(phase):
+    """
+    Context manager timing one phase; a shared no-op when not capturing.
+    Time spent in phases opened inside it is left to those phases.
+    """
+    return _PhaseTimer(phase) if active else _NO_TIMER
+
+
+class capture(ContextDecorator):
+    """
+    Record counters and timers for the enclosed block or decorated function.
+
+        with capture() as recorder:
+            query_exact(['B'], {'J': True})
+        print(recorder.to_json())
+
+    Pass a Recorder to accumulate across several captures (this is how the
+    decorator form is read back). Captures nest; the inner one records
+    while it runs and the outer one resumes afterwards.
+    """
+
+    def __init__(self, recorder=None):
+        self.recorder = recorder if recorder is not None else Recorder()
+        self._saved = []
+
+    def __enter__(self):
+        global active, _recorder
+        self._saved.append((active, _recorder))
+        active, _recorder = True, self.recorder
+        return self.recorder
+
+    def __exit__(self, *exc):
+        global active, _recorder
+        active, _recorder = self._saved.pop()
+        return False
@@ -0,0 +1,178 @@
+import instrumentation
+from compiled_network import get_network
+from result_cache import QueryCache
+from variable_elimination import variable_elimination
+
+try:
+    import numpy as np
+except ImportError:  # the pure Python table is used instead
+    np = None
+
+# Largest full joint that will be materialized (number of states)
+DEFAULT_MAX_STATES = 2 ** 24
+
+
+def can_tabulate(network, max_states=DEFAULT_MAX_STATES):
+    """
+    True if the network is boolean and its full joint fits in max_states.
+    """
+    return network.is_boolean() and 2 ** len(network.nodes) <= max_states
+
+
+class JointTable:
+    """
+    The full joint distribution of a boolean network as one flat array.
+
+    State index x has bit i set when node i is True. A query is answered by
+    summing the entries whose evidence bits match, i.e. (x & mask) == values,
+    and bucketing them by their query bits. Answers are memoized per
+    (evidence mask, evidence values, query nodes) in an LRU of memo_size
+    entries, so repeated queries are a dictionary lookup.
+    """
+
+    def __init__(self, network=None, max_states=DEFAULT_MAX_STATES, memo_size=1024):
+        if network is None:
+            network = get_network()
+        if not can_tabulate(network, max_states):
+            raise ValueError("Network is too large (or not boolean) to tabulate")
+        self.network = network
+        self.size = 2 ** len(network.nodes)
+        self.joint = self._build()
+        self.answers = QueryCache(memo_size)
+
+    def _build(self):
+        """
+        Extend the joint one node at a time: for node i every existing entry
+        x splits into x (node False) and x | 1 << i (node True).
+        """
+        network = self.network
+        if np is not None:
+            joint = np.ones(1)
+            for i in range(len(network.nodes)):
+                x = np.arange(len(joint))
+                config = np.zeros(len(joint), dtype=np.intp)
+                for parent, stride in network.parent_strides[i]:
+                    config += (x >> parent & 1) * stride
+                prob_true = np.asarray(network.tables[i])[config * 2 + 1]
+                joint = np.concatenate([joint * (1 - prob_true), joint * prob_true])
+            return joint
+
+        joint = [1.0]
+        for i in range(len(network.nodes)):
+            table = network.tables[i]
+            strides = network.parent_strides[i]
+            low = []
+            high = []
+            for x, prob in enumerate(joint):
+                config = 0
+                for parent, stride in strides:
+                    config += (x >> parent & 1) * stride
+                prob_true = table[config * 2 + 1]
+                low.append(prob * (1 - prob_true))
+                high.append(prob * prob_true)
+            joint = low + high
+        return joint
+
+    def _masked_sums(self, mask, values, query_ids):
+        buckets = [0.0] * 2 ** len(query_ids)
+        if np is not None:
+            x = np.arange(self.size)
+            selected = (x & mask) == values
+            key = np.zeros(self.size, dtype=np.intp)
+            for node_id in query_ids:
+                key = (key << 1) | (x >> node_id & 1)
+            sums = np.bincount(key[selected], weights=self.joint[selected], minlength=len(buckets))
+            return sums.tolist()
+
+        # Walk every submask of the free bits
+        free = (self.size - 1) & ~mask
+        sub = free
+        while True:
+            x = values | sub
+            key = 0
+            for node_id in query_ids:
+                key = (key << 1) | (x >> node_id & 1)
+            buckets[key] += self.joint[x]
+            if sub == 0:
+                break
+            sub = (sub - 1) & free
+        return buckets
+
+    def query(self, query_vars, evidence):
+        """
+        Compute P(query_vars | evidence) from the table.
+
+        Returns:
+            Dictionary mapping query variable assignments to probabilities
+        """
+        network = self.network
+        query_ids = tuple(network.query_ids(query_vars))
+        mask = 0
+        values = 0
+        for node_id, state in network.encode_evidence(evidence).items():
+            mask |= 1 << node_id
+            values |= state << node_id
+        return self.answer(query_ids, mask, values)
+
+    def answer(self, query_ids, mask, values):
+        """
+        P(query nodes | evidence) for evidence already packed as bits
+        ((x & mask) == values selects the consistent states).
+
+        Args:
+            query_ids: tuple of query node ids
+            mask: bit i set when node i is observed
+            values: bit i set when node i is observed True
+        """
+        network = self.network
+        key = (mask, values, query_ids)
+        answer = self.answers.get(key)
+        if answer is not None:
+            instrumentation.add('tabulated.memo_hits')
+        else:
+            buckets = self._masked_sums(mask, values, query_ids)
+            total = sum(buckets)
+            if total == 0:
+                raise ValueError("Evidence has zero probability")
+            answer = {}
+            for combination in network.assignments(query_ids):
+                index = 0
+                for state in combination:
+                    index = (index << 1) | state
+                answer[network.decode(query_ids, combination)] = buckets[index] / total
+            self.answers.put(key, answer)
+        return dict(answer)
+
+
+_table = None
+
+
+def query_tabulated(query_vars, evidence, network=None, max_states=DEFAULT_MAX_STATES, keep=True):
+    """
+    Answer a query from the materialized joint, falling back to variable
+    elimination when the network is too large to tabulate.
+
+    The table is built on first use and kept until a different network (or
+    a recompiled one, after a CPT change) is queried. With keep=False (for
+    networks built for one query, such as pruned ones) the table is built
+    for this query only and the kept one stays in place.
+    """
+    if network is None:
+        network = get_network()
+    if not can_tabulate(network, max_states):
+        return variable_elimination(query_vars, evidence, network=network)
+    table = shared_table(network, max_states) if keep else JointTable(network, max_states)
+    return table.query(query_vars, evidence)
+
+
+def shared_table(network, max_states=DEFAULT_MAX_STATES):
+    """
+    The JointTable kept for network, built on first use; None when the
+    network cannot be tabulated.
+    """
+    global _table
+    if not can_tabulate(network, max_states):
+        return None
+    if _table is None or _table.network is not network:
+        _table = JointTable(network, max_states)
+    return _table
@@ -0,0 +1,235 @@
+import instrumentation
+from compiled_network import get_network
+from variable_elimination import Factor, make_factor, multiply, sum_out, interaction_graph, greedy_order
+
+
+def restrict(factor, evidence):
+    """
+    Drop the rows of a factor that disagree with the evidence.
+    Unlike make_factor the evidence variables stay in the factor's scope.
+    """
+    checks = [(i, evidence[v]) for i, v in enumerate(factor.variables) if v in evidence]
+    if not checks:
+        return factor
+    table = {values: prob for values, prob in factor.table.items()
+             if all(values[i] == state for i, state in checks)}
+    return Factor(factor.variables, table)
+
+
+def marginalize(factor, keep):
+    """
+    Sum every variable not in keep out of a factor.
+    """
+    for var in factor.variables:
+        if var not in keep:
+            factor = sum_out(var, factor)
+    return factor
+
+
+class JunctionTree:
+    """
+    Clique tree compiled from a network for all-marginals-at-once queries.
+
+    The tree is calibrated with Shafer-Shenoy message passing. Messages are
+    cached per directed edge, and when the evidence changes only the
+    messages whose sending side contains a clique touched by the change are
+    recomputed.
+    """
+
+    def __init__(self, network=None, heuristic='min_fill'):
+        """
+        Args:
+            network: CompiledNetwork to compile (defaults to network_definition)
+            heuristic: triangulation heuristic, 'min_fill' or 'min_degree'
+        """
+        if network is None:
+            network = get_network()
+        self.network = network
+
+        # Triangulate the moral graph; every elimination step yields a clique
+        graph = interaction_graph(network, range(len(network.nodes)))
+        candidates = [frozenset(neighbours) | {var}
+                      for var, neighbours in greedy_order(graph, range(len(network.nodes)), heuristic)]
+        cliques = []
+        for clique in candidates:
+            if not any(clique < other for other in candidates) and clique not in cliques:
+                cliques.append(clique)
+        self.cliques = [tuple(sorted(c)) for c in cliques]
+
+        # Maximum spanning tree on separator size (Kruskal, deterministic ties)
+        pairs = []
+        for i in range(len(self.cliques)):
+            for j in range(i + 1, len(self.cliques)):
+                pairs.append((-len(cliques[i] & cliques[j]), i, j))
+        pairs.sort()
+        component = list(range(len(self.cliques)))
+
+        def find(i):
+            while component[i] != i:
+                i = component[i]
+            return i
+
+        self.neighbours = [[] for _ in self.cliques]
+        self.separators = {}
+        for _, i, j in pairs:
+            ri, rj = find(i), find(j)
+            if ri != rj:
+                component[ri] = rj
+                self.neighbours[i].append(j)
+                self.neighbours[j].append(i)
+                sep = tuple(sorted(cliques[i] & cliques[j]))
+                self.separators[(i, j)] = sep
+                self.separators[(j, i)] = sep
+
+        # Cliques on the sending side of every directed edge
+        self.upstream = {}
+        for (i, j) in self.separators:
+            self.upstream[(i, j)] = self._side(i, j)
+
+        # Each CPT goes to the first clique that holds its whole family
+        self.base_potentials = [None] * len(self.cliques)
+        for node_id in range(len(network.nodes)):
+            family = set(network.parents[node_id]) | {node_id}
+            home = next(i for i, c in enumerate(cliques) if family <= c)
+            cpt = make_factor(network, node_id, {})
+            if self.base_potentials[home] is None:
+                self.base_potentials[home] = cpt
+            else:
+                self.base_potentials[home] = multiply(self.base_potentials[home], cpt)
+        for i, clique in enumerate(self.cliques):
+            potential = self.base_potentials[i]
+            if potential is None:
+                potential = Factor((), {(): 1.0})
+            # Give every potential the full clique scope
+            for var in clique:
+                if var not in potential.variables:
+                    unit = Factor((var,), {(s,): 1.0 for s in range(network.cardinality[var])})
+                    potential = multiply(potential, unit)
+            self.base_potentials[i] = potential
+
+        self.evidence = {}
+        self.potentials = list(self.base_potentials)
+        self.messages = {}
+        self.messages_computed = 0
+
+    def _side(self, i, j):
+        """
+        Cliques reachable from i without crossing the edge i-j.
+        """
+        seen = {i}
+        stack = [i]
+        while stack:
+            k = stack.pop()
+            for n in self.neighbours[k]:
+                if n not in seen and not (k == i and n == j):
+                    seen.add(n)
+                    stack.append(n)
+        return frozenset(seen)
+
+    def copy(self):
+        """
+        Cheap copy sharing the compiled structure; factors are never mutated
+        so cached messages can be shared too.
+        """
+        other = object.__new__(JunctionTree)
+        other.__dict__.update(self.__dict__)
+        other.evidence = dict(self.evidence)
+        other.potentials = list(self.potentials)
+        other.messages = dict(self.messages)
+        return other
+
+    def set_evidence(self, evidence):
+        """
+        Replace the current evidence, invalidating only the affected messages.
+
+        Args:
+            evidence: Dictionary of evidence {variable: value}
+        """
+        encoded = self.network.encode_evidence(evidence)
+        changed = {v for v in set(encoded) | set(self.evidence)
+                   if encoded.get(v) != self.evidence.get(v)}
+        if not changed:
+            return
+        self.evidence = encoded
+
+        touched = set()
+        for i, clique in enumerate(self.cliques):
+            if changed & set(clique):
+                touched.add(i)
+                self.potentials[i] = restrict(self.base_potentials[i], encoded)
+
+        for edge in list(self.messages):
+            if self.upstream[edge] & touched:
+                del self.messages[edge]
+
+    def _message(self, i, j):
+        if (i, j) not in self.messages:
+            factor = self.potentials[i]
+            for k in self.neighbours[i]:
+                if k != j:
+                    factor = multiply(factor, self._message(k, i))
+            self.messages[(i, j)] = marginalize(factor, self.separators[(i, j)])
+            self.messages_computed += 1
+            instrumentation.add('junction_tree.messages')
+        return self.messages[(i, j)]
+
+    def belief(self, i):
+        """
+        Unnormalized joint over clique i and the evidence.
+        """
+        factor = self.potentials[i]
+        for k in self.neighbours[i]:
+            factor = multiply(factor, self._message(k, i))
+        return factor
+
+    def clique_for(self, node_ids):
+        """
+        Index of the smallest clique containing all of node_ids, or None.
+        """
+        wanted = set(node_ids)
+        best = None
+        for i, clique in enumerate(self.cliques):
+            if wanted <= set(clique) and (best is None or len(clique) < len(self.cliques[best])):
+                best = i
+        return best
+
+    def _distribution(self, i, node_ids):
+        factor = marginalize(self.belief(i), node_ids)
+        positions = [factor.variables.index(v) for v in node_ids]
+        unnormalized = {}
+        for combination in self.network.assignments(node_ids):
+            unnormalized[combination] = 0.0
+        for values, prob in factor.table.items():
+            unnormalized[tuple(values[p] for p in positions)] += prob
+        total = sum(unnormalized.values())
+        if total == 0:
+            raise ValueError("Evidence has zero probability")
+        return {self.network.decode(node_ids, k): v / total for k, v in unnormalized.items()}
+
+    def marginals(self, evidence=None):
+        """
+        Posterior marginals of every non-evidence node.
+
+        Args:
+            evidence: Dictionary of evidence; None keeps the current evidence
+
+        Returns:
+            Dictionary {node: {(value,): probability}}, each entry in the same
+            format query_exact returns for a single query variable
+        """
+        if evidence is not None:
+            self.set_evidence(evidence)
+
+        result = {}
+        for node_id, name in enumerate(self.network.nodes):
+            if node_id in self.evidence:
+                continue
+            result[name] = self._distribution(self.clique_for([node_id]), [node_id])
+        return result
+
+
+def query_all_marginals(evidence, network=None):
+    """
+    P(X | evidence) for every non-evidence node X from one calibration.
+    """
+    return JunctionTree(network).marginals(evidence)
@@ -0,0 +1,47 @@
+import math
+
+# log(0); products of probabilities become sums of these
+LOG_ZERO = -math.inf
+
+
+def log(p):
+    """
+    Natural log that maps a zero probability to LOG_ZERO instead of raising.
+    """
+    return math.log(p) if p > 0 else LOG_ZERO
+
+
+def logaddexp(a, b):
+    """
+    log(exp(a) + exp(b)) without leaving log space.
+    """
+    if a < b:
+        a, b = b, a
+    if b == LOG_ZERO:
+        return a
+    return a + math.log1p(math.exp(b - a))
+
+
+def logsumexp(values):
+    """
+    log(sum(exp(v) for v in values)), shifted by the largest value so that
+    nothing underflows; LOG_ZERO for an empty or all-zero input.
+    """
+    values = list(values)
+    top = max(values, default=LOG_ZERO)
+    if top == LOG_ZERO:
+        return LOG_ZERO
+    return top + math.log(sum(math.exp(v - top) for v in values))
+
+
+def log_normalize(log_weights):
+    """
+    Turn {key: log weight} into {key: probability} with log-sum-exp.
+
+    Raises:
+        ValueError: if every weight is zero
+    """
+    total = logsumexp(log_weights.values())
+    if total == LOG_ZERO:
+        raise ValueError("Evidence has zero probability")
+    return {key: math.exp(v - total) for key, v in log_weights.items()}
@@ -1,85 +1,40 @@
 import sys 
 import random
 import itertools
+import contextlib
+import json
+import csv
 from collections import defaultdict
 
 from network_definition import *
+from compiled_network import get_network, set_network
+from network_loader import load_network
 from bayes_network import get_probability, get_all_parent_values
 from exact_inference import query_exact
 from sampling_inference import prior_sampling, rejection_sampling, likelihood_weighting
+from random_streams import STREAMS
+from gibbs_sampling import gibbs_sampling
+from adaptive_sampling import adaptive_importance_sampling, adaptive_query
+from parallel_sampling import make_pool, submit_trials, collect_trials
+from network_pruning import run_pruned
+from query_cache import cached_query_exact, default_cache
+from query_plan import compile_query, plan_cache_info
+from arithmetic_circuit import load_or_compile, use_circuit
+from anytime_sampling import StoppingRule, NoMatchingSamples, anytime_query
+from batch_queries import BatchAnswerer, blocks
+import instrumentation
+from inference_server import InferenceServer, DEFAULT_BATCH_WINDOW, DEFAULT_MAX_SAMPLES
 
-def parse_input(input_str):
-    input_str = input_str.strip()
-
-    if not input_str.startswith('['):
-        raise ValueError("Input must start with '['")
-    
-    depth = 0
-    evidence_end = -1
-    for i, char in enumerate(input_str):
-        if char == '[':
-            depth += 1
-        elif char == ']':
-            depth -= 1
-            if depth == 0 and evidence_end == -1:
-                evidence_end = i
-                break
-    
-    if evidence_end == -1 or evidence_end + 1 >= len(input_str) or input_str[evidence_end+1] != '[':
-        raise ValueError("Invalid format. Expected [evidence][query]")
-    
-    evidence_str = input_str[1:evidence_end]
-    query_str = input_str[evidence_end+2:-1]
 
-    evidence = {}
-    if evidence_str.strip():
-        evidence_str = evidence_str.replace(" ", "")
-    
-        # Split into evidence items
-        items = []
-        start = 0
-        while start < len(evidence_str):
-            if evidence_str[start] == '<':
-                end = evidence_str.find('>', start)
-                if end == -1:
-                    raise ValueError("Unclosed '<' in evidence")
-                items.append(evidence_str[start+1:end])
-                start = end + 1
-            else:
-                start += 1
-        
-        for item in items:
-            parts = item.split(',')
-            if len(parts) != 2:
-                raise ValueError(f"Invalid evidence item: {item}")
-            
-            node = parts[0]
-            value_str = parts[1].lower()
-            
-            if value_str == 't':
-                value = True
-            elif value_str == 'f':
-                value = False
-            else:
-                raise ValueError(f"Invalid value: {value_str}. Use 't' or 'f'.")
-            
-            if node not in ['A', 'B', 'E', 'J', 'M']:
-                raise ValueError(f"Invalid node: {node}")
-            
-            evidence[node] = value
-    
-    # Parse query
-    query_vars = []
-    if query_str.strip():
-        query_str = query_str.replace(" ", "")
-        items = query_str.split(',')
-        for item in items:
-            if item in ['A', 'B', 'E', 'J', 'M']:
-                query_vars.append(item)
-            else:
-                raise ValueError(f"Invalid query variable: {item}")
-    
-    return evidence, query_vars
+def parse_input(input_str):
+    """
+    Parse [<N1,V1><N2,V2>][Q1,Q2] into (evidence dict, query list).
+    Node names and values are checked against the active network.
+    Parsed strings are compiled to cached QueryPlans; callers get fresh
+    copies they may modify.
+    """
+    plan = compile_query(input_str)
+    return plan.evidence_dict(), plan.query_vars()
 
 
 def format_output(query_vars, probabilities):
@@ -89,6 +44,13 @@ def format_output(query_vars, probabilities):
     if not query_vars:
         return "[]"
     
+    if any(not isinstance(value, bool) for values in probabilities for value in values):
+        # Multi-valued variables: list every assignment
+        label = lambda value: ('t' if value else 'f') if isinstance(value, bool) else str(value)
+        items = ''.join(f"<{','.join(query_vars)},{','.join(map(label, values))},{prob:.4f}>"
+                        for values, prob in probabilities.items())
+        return f"[{items}]"
+    
     if len(query_vars) == 1:
         # Single query variable
         true_prob = probabilities.get((True,), 0)
@@ -101,52 +63,84 @@ def format_output(query_vars, probabilities):
         return f"[<{nodes_str},{joint_prob:.6f}>]"
 
 
-def run_sampling_trials(query_vars, evidence, num_samples, num_trials=10):
+# Sample cap for the anytime runs in analyze
+ANYTIME_MAX_SAMPLES = 100000
+
+
+def run_sampling_trials(query_vars, evidence, num_samples, num_trials=10, pool=None, stream='random'):
     """
     Run sampling methods multiple times and return average results.
+    If a process pool is given the trials are sharded across its workers.
+    stream is the random-stream backend for prior, rejection and likelihood
+    weighting (see random_streams).
     """
+    if pool is not None:
+        return collect_trials(submit_trials(pool, query_vars, evidence, num_samples, num_trials, stream=stream))
+
     # For joint queries, we want probability that all are True
     target_key = tuple([True] * len(query_vars))
     
     prior_results = []
     rejection_results = []
     likelihood_results = []
+    gibbs_results = []
+    adaptive_results = []
     
     for _ in range(num_trials):
         # Prior sampling
-        prior_probs = prior_sampling(query_vars, evidence, num_samples)
+        prior_probs = prior_sampling(query_vars, evidence, num_samples, stream=stream)
         prior_results.append(prior_probs.get(target_key, 0))
         
         # Rejection sampling
-        reject_probs = rejection_sampling(query_vars, evidence, num_samples)
+        reject_probs = rejection_sampling(query_vars, evidence, num_samples, stream=stream)
         rejection_results.append(reject_probs.get(target_key, 0))
         
         # Likelihood weighting
-        lw_probs = likelihood_weighting(query_vars, evidence, num_samples)
+        lw_probs = likelihood_weighting(query_vars, evidence, num_samples, stream=stream)
         likelihood_results.append(lw_probs.get(target_key, 0))
+        
+        # Gibbs sampling
+        gibbs_probs = gibbs_sampling(query_vars, evidence, num_samples)
+        gibbs_results.append(gibbs_probs.get(target_key, 0))
+        
+        # Adaptive importance sampling
+        adaptive_probs = adaptive_importance_sampling(query_vars, evidence, num_samples)
+        adaptive_results.append(adaptive_probs.get(target_key, 0))
     
     # Calculate averages
     avg_prior = sum(prior_results) / len(prior_results) if prior_results else 0
     avg_rejection = sum(rejection_results) / len(rejection_results) if rejection_results else 0
     avg_likelihood = sum(likelihood_results) / len(likelihood_results) if likelihood_results else 0
+    avg_gibbs = sum(gibbs_results) / len(gibbs_results) if gibbs_results else 0
+    avg_adaptive = sum(adaptive_results) / len(adaptive_results) if adaptive_results else 0
     
     return {
         'prior': avg_prior,
         'rejection': avg_rejection,
         'likelihood': avg_likelihood,
+        'gibbs': avg_gibbs,
+        'adaptive': avg_adaptive,
         'prior_all': prior_results,
         'rejection_all': rejection_results,
-        'likelihood_all': likelihood_results
+        'likelihood_all': likelihood_results,
+        'gibbs_all': gibbs_results,
+        'adaptive_all': adaptive_results
     }
 
 
-def analyze_specific_cases():
+def analyze_specific_cases(pool=None, half_width=None, stream='random'):
     """
     Analyze the three specific cases mentioned in the assignment
+    If a process pool is given every trial is queued up front and run in parallel.
+    If half_width is given, each method is also run until its estimate reaches
+    that precision, and the number of samples it needed is reported.
+    stream selects the random-stream backend of the first three samplers.
     """
     print("\n" + "="*80)
     print("ANALYSIS OF THREE SPECIFIC CASES")
     print("Each method run 10 times and averaged for each sample size")
+    if stream != 'random':
+        print(f"Prior, rejection and likelihood weighting draw from the '{stream}' random stream")
     print("="*80)
     
     cases = [
@@ -172,6 +166,13 @@ def analyze_specific_cases():
     
     sample_sizes = [10, 50, 100, 200, 500, 1000, 10000]
     
+    # Queue all the work first so the pool stays busy while results are printed
+    pending = {}
+    if pool is not None:
+        for case_idx, case in enumerate(cases, 1):
+            for n in sample_sizes:
+                pending[(case_idx, n)] = submit_trials(pool, case['query'], case['evidence'], n, 10, stream=stream)
+    
     for case_idx, case in enumerate(cases, 1):
         print(f"\n{'='*60}")
         print(f"CASE {case_idx}: {case['name']}")
@@ -189,22 +190,38 @@ def analyze_specific_cases():
             exact_prob = 0
         
         # Run sampling methods for different sample sizes
-        print(f"\n{'Samples':<10} {'Prior':<15} {'Rejection':<15} {'Likelihood':<15}")
-        print(f"{'-'*55}")
+        print(f"\n{'Samples':<10} {'Prior':<15} {'Rejection':<15} {'Likelihood':<15} {'Gibbs':<15} {'Adaptive':<15}")
+        print(f"{'-'*85}")
         
         for n in sample_sizes:
             # Run each method 10 times and average
-            results = run_sampling_trials(case['query'], case['evidence'], n, 10)
+            if pool is not None:
+                results = collect_trials(pending[(case_idx, n)])
+            else:
+                results = run_sampling_trials(case['query'], case['evidence'], n, 10, stream=stream)
             
-            print(f"{n:<10} {results['prior']:<15.8f} {results['rejection']:<15.8f} {results['likelihood']:<15.8f}")
+            print(f"{n:<10} {results['prior']:<15.8f} {results['rejection']:<15.8f} {results['likelihood']:<15.8f} "
+                  f"{results['gibbs']:<15.8f} {results['adaptive']:<15.8f}")
         
         # Add exact result row
-        print(f"{'Exact':<10} {exact_prob:<15.8f} {exact_prob:<15.8f} {exact_prob:<15.8f}")
+        print(f"{'Exact':<10} {exact_prob:<15.8f} {exact_prob:<15.8f} {exact_prob:<15.8f} {exact_prob:<15.8f} {exact_prob:<15.8f}")
+        
+        if half_width is not None:
+            print(f"\nAnytime sampling, stopping at half-width {half_width} (at most {ANYTIME_MAX_SAMPLES} samples)")
+            print(f"{'Method':<12} {'Estimate':<15} {'Half-width':<15} {'Samples':<10}")
+            print(f"{'-'*55}")
+            all_true_key = tuple([True] * len(case['query']))
+            for method in ['prior', 'rejection', 'likelihood']:
+                stop = StoppingRule(half_width=half_width, max_samples=ANYTIME_MAX_SAMPLES)
+                estimate = anytime_query(method, case['query'], case['evidence'], stop)
+                prob = estimate.probabilities.get(all_true_key, 0)
+                print(f"{method:<12} {prob:<15.8f} {estimate.half_width:<15.8f} {estimate.samples:<10}")
 
 
-def interactive_mode():
+def interactive_mode(stream='random'):
     """
-    Interactive mode for testing queries
+    Interactive mode for testing queries; stream is the random-stream
+    backend for prior, rejection and likelihood weighting.
     """
     print("\n" + "="*80)
     print("INTERACTIVE INFERENCE MODE")
@@ -225,7 +242,11 @@ def interactive_mode():
             if user_input.lower() == 'quit':
                 break
             elif user_input.lower() == 'analyze':
-                analyze_specific_cases()
+                analyze_specific_cases(stream=stream)
+                continue
+            elif user_input.lower() == 'stats':
+                print(f"Query cache: {default_cache.stats()}")
+                print(f"Parse cache: {plan_cache_info()}")
                 continue
             
             # Parse input
@@ -240,7 +261,7 @@ def interactive_mode():
             
             # Get exact inference
             try:
-                exact_result = query_exact(query_vars, evidence)
+                exact_result = cached_query_exact(query_vars, evidence)
                 exact_output = format_output(query_vars, exact_result)
                 print(f"Exact Inference: {exact_output}")
                 
@@ -259,24 +280,55 @@ def interactive_mode():
                 try:
                     num_samples = int(input("Number of samples (default 1000): ") or "1000")
                     
+                    target = input("Target half-width (blank for a fixed sample count): ").strip()
+                    if target and stream != 'random':
+                        # Anytime runs draw in chunks, which the other backends cannot do
+                        print(f"A target half-width needs the 'random' stream, not '{stream}'")
+                        continue
+                    if target:
+                        # Stop each method as soon as it is precise enough,
+                        # using num_samples as the budget
+                        stop = StoppingRule(half_width=float(target), max_samples=num_samples)
+                        print(f"\nRunning until half-width {target} (at most {num_samples} samples)...")
+                        for label, method in [("Prior Sampling:    ", 'prior'),
+                                              ("Rejection Sampling: ", 'rejection'),
+                                              ("Likelihood Weighting: ", 'likelihood')]:
+                            estimate = anytime_query(method, query_vars, evidence, stop)
+                            output = format_output(query_vars, estimate.probabilities)
+                            print(f"{label}{output}  ({estimate.samples} samples, half-width {estimate.half_width:.6f})")
+                        continue
+                    
                     # Run sampling methods
                     print(f"\nRunning with {num_samples} samples...")
                     
                     # Prior sampling
-                    prior_result = prior_sampling(query_vars, evidence, num_samples)
+                    prior_result = prior_sampling(query_vars, evidence, num_samples, stream=stream)
                     prior_output = format_output(query_vars, prior_result)
                     print(f"Prior Sampling:    {prior_output}")
                     
                     # Rejection sampling
-                    reject_result = rejection_sampling(query_vars, evidence, num_samples)
+                    reject_result = rejection_sampling(query_vars, evidence, num_samples, stream=stream)
                     reject_output = format_output(query_vars, reject_result)
                     print(f"Rejection Sampling: {reject_output}")
                     
                     # Likelihood weighting
-                    lw_result = likelihood_weighting(query_vars, evidence, num_samples)
+                    lw_result = likelihood_weighting(query_vars, evidence, num_samples, stream=stream)
                     lw_output = format_output(query_vars, lw_result)
                     print(f"Likelihood Weighting: {lw_output}")
                     
+                    # Gibbs sampling
+                    gibbs_result = gibbs_sampling(query_vars, evidence, num_samples)
+                    gibbs_output = format_output(query_vars, gibbs_result)
+                    print(f"Gibbs Sampling:    {gibbs_output}")
+                    
+                    # Adaptive importance sampling
+                    adaptive_result = adaptive_query(query_vars, evidence, num_samples)
+                    adaptive_output = format_output(query_vars, adaptive_result.probabilities)
+                    print(f"Adaptive Importance Sampling: {adaptive_output}  "
+                          f"(effective sample size {adaptive_result.effective_sample_size:.1f})")
+                    
+                except NoMatchingSamples as e:
+                    print(f"Error in sampling: {e}")
                 except ValueError:
                     print("Invalid number of samples")
                 except Exception as e:
@@ -288,42 +340,228 @@ def interactive_mode():
             print(f"Unexpected error: {e}")
 
 
+def parse_batch_line(line):
+    """
+    Parse one batch input line: either the [<N,V>][Q] syntax or a JSON object
+    like {"evidence": {"A": true}, "query": ["J"]} (values may also be "t"/"f").
+    """
+    if not line.startswith('{'):
+        return parse_input(line)
+    
+    item = json.loads(line)
+    items = []
+    for node, value in item.get('evidence', {}).items():
+        if isinstance(value, bool):
+            value = 't' if value else 'f'
+        elif str(value).lower() in ('true', 'false'):
+            value = str(value)[0]
+        items.append(f"<{node},{value}>")
+    query_vars = list(item.get('query', []))
+    # Reuse the text parser for validation
+    return parse_input('[' + ''.join(items) + '][' + ','.join(query_vars) + ']')
+
+
+def result_record(line, query_vars, result):
+    """
+    JSON-ready record for one answered query (or the exception raised for it).
+    """
+    if isinstance(result, Exception):
+        return {'input': line, 'error': str(result)}
+    return {
+        'input': line,
+        'result': format_output(query_vars, result),
+        'probabilities': {
+            ','.join(('t' if v else 'f') if isinstance(v, bool) else str(v) for v in values): prob
+            for values, prob in result.items()
+        },
+    }
+
+
+def batch_mode(source, out, engine='exact', num_samples=1000, fmt='jsonl', seed=None):
+    """
+    Answer every query read from source and stream one result per line to out.
+    
+    Args:
+        source: iterable of input lines
+        out: writable text stream
+        engine: 'exact', 'enumeration', 'tabulated', 'bank', 'prior', 'rejection', 'likelihood', 'gibbs' or 'adaptive'
+        num_samples: samples per evidence group for the sampling engines
+        fmt: 'jsonl' or 'csv'
+        seed: optional seed making the sampling engines reproducible per query
+    """
+    answerer = BatchAnswerer(engine, num_samples, seed)
+    writer = None
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(['input', 'result', 'error'])
+    elif fmt != 'jsonl':
+        raise ValueError(f"Unknown output format: {fmt}")
+    
+    for block in blocks(source):
+        parsed = []
+        errors = {}
+        for i, line in enumerate(block):
+            try:
+                evidence, query_vars = parse_batch_line(line)
+                if not query_vars:
+                    raise ValueError("No query variables specified")
+                parsed.append((evidence, query_vars))
+            except Exception as e:
+                errors[i] = e
+                parsed.append(({}, []))
+        
+        answers = answerer.answer([p for i, p in enumerate(parsed) if i not in errors])
+        answers = iter(answers)
+        
+        for i, line in enumerate(block):
+            result = errors[i] if i in errors else next(answers)
+            query_vars = parsed[i][1]
+            if writer is not None:
+                if isinstance(result, Exception):
+                    writer.writerow([line, '', str(result)])
+                else:
+                    writer.writerow([line, format_output(query_vars, result), ''])
+            else:
+                out.write(json.dumps(result_record(line, query_vars, result)) + '\n')
+
+
+def pop_option(args, name, convert):
+    """
+    Remove '--name value' from args and return the converted value (or None).
+    """
+    if name not in args:
+        return None
+    i = args.index(name)
+    try:
+        value = convert(args[i + 1])
+    except (IndexError, ValueError):
+        raise ValueError(f"{name} needs a {convert.__name__} value")
+    del args[i:i + 2]
+    return value
+
+
 def main():
     """
     Main entry point
     """
+    args = sys.argv[1:]
+    try:
+        network_path = pop_option(args, '--network', str)
+        if network_path:
+            set_network(load_network(network_path))
+        circuit_path = pop_option(args, '--circuit', str)
+        if circuit_path:
+            # Reuse the compiled circuit saved there, or compile and save it
+            use_circuit(load_or_compile(circuit_path))
+    except (OSError, ValueError, ImportError) as e:
+        print(f"Error loading network: {e}", file=sys.stderr)
+        sys.exit(1)
+    
+    if args and args[0] == 'batch':
+        # Batch mode writes machine-readable output only, so no banner
+        try:
+            engine = pop_option(args, '--engine', str) or 'exact'
+            num_samples = pop_option(args, '--samples', int) or 1000
+            fmt = pop_option(args, '--format', str) or 'jsonl'
+            seed = pop_option(args, '--seed', int)
+            path = args[1] if len(args) > 1 else '-'
+            if path == '-':
+                batch_mode(sys.stdin, sys.stdout, engine, num_samples, fmt, seed)
+            else:
+                with open(path) as source:
+                    batch_mode(source, sys.stdout, engine, num_samples, fmt, seed)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        return
+    
+    if args and args[0] == 'serve':
+        try:
+            host = pop_option(args, '--host', str) or '127.0.0.1'
+            port = pop_option(args, '--port', int) or 8000
+            workers = pop_option(args, '--workers', int) or 2
+            window_ms = pop_option(args, '--batch-window', float)
+            samples = pop_option(args, '--samples', int) or 1000
+            max_samples = pop_option(args, '--max-samples', int) or DEFAULT_MAX_SAMPLES
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        window = DEFAULT_BATCH_WINDOW if window_ms is None else window_ms / 1000
+        server = InferenceServer(parse_batch_line, result_record, workers, window, samples, max_samples)
+        server.run(host, port)
+        return
+    
     print("Bayesian Network Inference System")
-    print("Network: Burglary-Earthquake-Alarm (from Russell & Norvig 4th ed, Figure 13.2)")
-    print("CPT values from textbook:")
-    print("  P(B) = 0.001, P(E) = 0.002")
-    print("  P(A|B,E): B=t,E=t:0.70, B=t,E=f:0.01, B=f,E=t:0.70, B=f,E=f:0.01")
-    print("  P(J|A): A=t:0.90, A=f:0.05")
-    print("  P(M|A): A=t:0.70, A=f:0.01")
+    if network_path:
+        print(f"Network: {network_path} ({len(get_network().nodes)} nodes)")
+    else:
+        print("Network: Burglary-Earthquake-Alarm (from Russell & Norvig 4th ed, Figure 13.2)")
+        print("CPT values from textbook:")
+        print("  P(B) = 0.001, P(E) = 0.002")
+        print("  P(A|B,E): B=t,E=t:0.70, B=t,E=f:0.01, B=f,E=t:0.70, B=f,E=f:0.01")
+        print("  P(J|A): A=t:0.90, A=f:0.05")
+        print("  P(M|A): A=t:0.70, A=f:0.01")
     
-    if len(sys.argv) > 1:
-        # Command line mode
-        if sys.argv[1] == 'analyze':
-            analyze_specific_cases()
-        elif sys.argv[1] == 'test':
-            test_queries()
-        else:
-            # Single query from command line
-            input_str = ' '.join(sys.argv[1:])
-            try:
-                evidence, query_vars = parse_input(input_str)
-                print(f"Evidence: {evidence}")
-                print(f"Query: {query_vars}")
+    try:
+        workers = pop_option(args, '--workers', int)
+        half_width = pop_option(args, '--half-width', float)
+        stream = pop_option(args, '--stream', str) or 'random'
+        if stream not in STREAMS:
+            raise ValueError(f"--stream must be one of {', '.join(STREAMS)}")
+        if half_width is not None and stream != 'random':
+            raise ValueError("--half-width runs anytime sampling, which only supports --stream random")
+        prune = '--prune' in args
+        if prune:
+            args.remove('--prune')
+        profile = pop_option(args, '--profile', str)
+        if profile not in (None, 'json', 'prometheus'):
+            raise ValueError("--profile must be json or prometheus")
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+    
+    # With --profile the whole command runs inside one capture (work done
+    # in --workers processes is not included)
+    recorder = instrumentation.Recorder()
+    capture = instrumentation.capture(recorder) if profile else contextlib.nullcontext()
+    with capture:
+        if args:
+            # Command line mode
+            if args[0] == 'analyze':
+                if workers:
+                    with make_pool(workers) as pool:
+                        analyze_specific_cases(pool, half_width, stream)
+                else:
+                    analyze_specific_cases(half_width=half_width, stream=stream)
+            elif args[0] == 'test':
+                test_queries()
+            else:
+                # Single query from command line
+                input_str = ' '.join(args)
+                try:
+                    evidence, query_vars = parse_input(input_str)
+                    print(f"Evidence: {evidence}")
+                    print(f"Query: {query_vars}")
                 
-                # Get exact result
-                exact_result = query_exact(query_vars, evidence)
-                output = format_output(query_vars, exact_result)
-                print(f"Result: {output}")
+                    # Get exact result
+                    if prune:
+                        exact_result, report = run_pruned(query_exact, query_vars, evidence, method='elimination')
+                        print(f"Pruning: {report}".replace('\n', '\n  '))
+                    else:
+                        exact_result = cached_query_exact(query_vars, evidence)
+                    output = format_output(query_vars, exact_result)
+                    print(f"Result: {output}")
                 
-            except Exception as e:
-                print(f"Error: {e}")
-    else:
-        # Interactive mode
-        interactive_mode()
+                except Exception as e:
+                    print(f"Error: {e}")
+        else:
+            # Interactive mode
+            interactive_mode(stream)
+    
+    if profile == 'json':
+        print(recorder.to_json(indent=2), file=sys.stderr)
+    elif profile == 'prometheus':
+        print(recorder.to_prometheus(), end='', file=sys.stderr)
 
 
 def test_queries():
@@ -348,7 +586,7 @@ def test_queries():
             print(f"Query: {query_vars}")
             
             # Get exact result
-            exact_result = query_exact(query_vars, evidence)
+            exact_result = cached_query_exact(query_vars, evidence)
             output = format_output(query_vars, exact_result)
             print(f"Result: {output}")
             
@@ -40,4 +40,13 @@ PARENTS = {
 }
 
 # All nodes in topological order
-NODES = ['B', 'E', 'A', 'J', 'M']
\ No newline at end of file
+NODES = ['B', 'E', 'A', 'J', 'M']
+
+# CPT for each node, as referenced by the compiled network
+CPTS = {
+    'B': P_BURGLARY,
+    'E': P_EARTHQUAKE,
+    'A': P_ALARM,
+    'J': P_JOHN,
+    'M': P_MARY
+}
@@ -0,0 +1,319 @@
+import os
+import re
+import json
+import pickle
+
+from compiled_network import CompiledNetwork
+
+# Bumped whenever the layout of the binary cache changes
+CACHE_VERSION = 1
+
+# Domains that are read as booleans, so the t/f query syntax keeps working
+BOOLEAN_DOMAINS = [
+    ('false', 'true'),
+    ('f', 't'),
+    ('no', 'yes'),
+]
+
+
+def _boolean_order(values):
+    """
+    If values name a boolean domain, return the position of False and True
+    in values, otherwise None.
+    """
+    labels = [str(v).lower() for v in values]
+    if all(isinstance(v, bool) for v in values) and len(set(values)) == 2:
+        return values.index(False), values.index(True)
+    for false_label, true_label in BOOLEAN_DOMAINS:
+        if sorted(labels) == sorted([false_label, true_label]):
+            return labels.index(false_label), labels.index(true_label)
+    return None
+
+
+def build_network(variables, parents, cpts):
+    """
+    Validate a network description and compile it.
+
+    Args:
+        variables: dictionary {name: list of values}, in declaration order
+        parents: dictionary {name: list of parent names}
+        cpts: dictionary {name: flat list of P(value | parent config)} laid
+              out as in CompiledNetwork (first parent varies fastest, the
+              node's own value fastest of all), in the declared value order
+
+    Returns:
+        CompiledNetwork with nodes in topological order
+    """
+    for name in variables:
+        if len(variables[name]) < 2:
+            raise ValueError(f"Variable {name} needs at least two values")
+        if len(set(variables[name])) != len(variables[name]):
+            raise ValueError(f"Variable {name} has repeated values")
+        if name not in cpts:
+            raise ValueError(f"Variable {name} has no probability table")
+        for parent in parents.get(name, []):
+            if parent not in variables:
+                raise ValueError(f"Unknown parent {parent} of {name}")
+    for name in cpts:
+        if name not in variables:
+            raise ValueError(f"Probability table for undeclared variable {name}")
+
+    # Kahn's algorithm, keeping declaration order among ready nodes
+    order = []
+    placed = set()
+    pending = list(variables)
+    while pending:
+        ready = [n for n in pending if all(p in placed for p in parents.get(n, []))]
+        if not ready:
+            raise ValueError(f"Network has a cycle through {', '.join(pending)}")
+        for n in ready:
+            order.append(n)
+            placed.add(n)
+        pending = [n for n in pending if n not in placed]
+
+    domains = {}
+    tables = {}
+    for name in order:
+        values = list(variables[name])
+        card = len(values)
+        configs = 1
+        for parent in parents.get(name, []):
+            configs *= len(variables[parent])
+        table = [float(p) for p in cpts[name]]
+        if len(table) != configs * card:
+            raise ValueError(f"Probability table for {name} has {len(table)} entries, expected {configs * card}")
+        for config in range(configs):
+            row = table[config * card:(config + 1) * card]
+            if any(p < 0 for p in row) or abs(sum(row) - 1.0) > 1e-6:
+                raise ValueError(f"Probability table row {config} for {name} does not sum to 1")
+
+        boolean = _boolean_order(values)
+        if boolean is not None:
+            false_at, true_at = boolean
+            domains[name] = (False, True)
+            tables[name] = []
+            for config in range(configs):
+                tables[name] += [table[config * 2 + false_at], table[config * 2 + true_at]]
+        else:
+            domains[name] = tuple(values)
+            tables[name] = table
+
+    # Parent configs of boolean parents must follow the (False, True) order too
+    for name in order:
+        tables[name] = _reorder_parents(name, parents.get(name, []), variables, domains, tables[name])
+
+    return CompiledNetwork(order, {n: list(parents.get(n, [])) for n in order}, domains, tables)
+
+
+def _reorder_parents(name, parent_names, variables, domains, table):
+    """
+    Re-index a table whose parent configurations follow the declared value
+    order so they follow the compiled domain order instead.
+    """
+    if not parent_names:
+        return table
+    card = len(domains[name])
+    maps = []
+    for parent in parent_names:
+        declared = list(variables[parent])
+        if domains[parent] == (False, True):
+            false_at, true_at = _boolean_order(declared)
+            maps.append([false_at, true_at])
+        else:
+            maps.append(list(range(len(declared))))
+
+    result = [0.0] * len(table)
+    configs = len(table) // card
+    for config in range(configs):
+        # Decode the compiled config into compiled parent states, then find
+        # the declared config holding that row
+        rest = config
+        declared_config = 0
+        stride = 1
+        for parent, mapping in zip(parent_names, maps):
+            parent_card = len(mapping)
+            state = rest % parent_card
+            rest //= parent_card
+            declared_config += mapping[state] * stride
+            stride *= parent_card
+        result[config * card:(config + 1) * card] = table[declared_config * card:(declared_config + 1) * card]
+    return result
+
+
+def parse_json(text):
+    """
+    Parse the JSON network format:
+
+        {"nodes": [
+            {"name": "B", "values": ["t", "f"], "parents": [], "cpt": [[0.001, 0.999]]},
+            {"name": "J", "values": ["t", "f"], "parents": ["A"],
+             "cpt": [[0.9, 0.1], [0.05, 0.95]]}
+        ]}
+
+    "cpt" has one row per parent configuration, the first parent varying
+    fastest over its declared values; a flat list is accepted too.
+    """
+    data = json.loads(text)
+    variables = {}
+    parents = {}
+    cpts = {}
+    for node in data['nodes']:
+        name = node['name']
+        if name in variables:
+            raise ValueError(f"Variable {name} is declared twice")
+        variables[name] = list(node['values'])
+        parents[name] = list(node.get('parents', []))
+        cpt = node['cpt']
+        if cpt and isinstance(cpt[0], list):
+            cpt = [p for row in cpt for p in row]
+        cpts[name] = cpt
+    return variables, parents, cpts
+
+
+_BIF_VARIABLE = re.compile(r'variable\s+([^\s{]+)\s*\{[^}]*?type\s+discrete\s*\[\s*(\d+)\s*\]\s*\{([^}]*)\}', re.S)
+_BIF_PROBABILITY = re.compile(r'probability\s*\(\s*([^|)\s]+)\s*(?:\|\s*([^)]*))?\)\s*\{([^}]*)\}', re.S)
+_BIF_ROW = re.compile(r'\(([^)]*)\)\s*([^;]*);')
+_BIF_TABLE = re.compile(r'table\s+([^;]*);')
+
+
+def _numbers(text):
+    return [float(x) for x in re.split(r'[\s,]+', text.strip()) if x]
+
+
+def parse_bif(text):
+    """
+    Parse the discrete subset of the BIF interchange format.
+
+    Conditional tables may use explicit rows, "(v1, v2) p1, p2;", or a
+    "table" line listing P(value | parents) with the node's value slowest
+    and the last parent fastest (the usual BIF convention).
+    """
+    text = re.sub(r'//[^\n]*', '', text)
+    variables = {}
+    for name, count, values in _BIF_VARIABLE.findall(text):
+        labels = [v.strip() for v in values.split(',') if v.strip()]
+        if len(labels) != int(count):
+            raise ValueError(f"Variable {name} declares {count} values but lists {len(labels)}")
+        variables[name] = labels
+
+    parents = {name: [] for name in variables}
+    cpts = {}
+    for name, parent_text, body in _BIF_PROBABILITY.findall(text):
+        if name not in variables:
+            raise ValueError(f"Probability table for undeclared variable {name}")
+        node_parents = [p.strip() for p in parent_text.split(',') if p.strip()] if parent_text else []
+        for parent in node_parents:
+            if parent not in variables:
+                raise ValueError(f"Unknown parent {parent} of {name}")
+        parents[name] = node_parents
+        card = len(variables[name])
+        parent_cards = [len(variables[p]) for p in node_parents]
+        configs = 1
+        for c in parent_cards:
+            configs *= c
+        table = [None] * (configs * card)
+
+        rows = _BIF_ROW.findall(body)
+        tables = _BIF_TABLE.findall(body)
+        if tables:
+            numbers = _numbers(tables[0])
+            if len(numbers) != configs * card:
+                raise ValueError(f"Table for {name} has {len(numbers)} entries, expected {configs * card}")
+            for value in range(card):
+                for bif_config in range(configs):
+                    # Last parent fastest in BIF, first parent fastest here
+                    rest = bif_config
+                    states = []
+                    for c in reversed(parent_cards):
+                        states.append(rest % c)
+                        rest //= c
+                    config = 0
+                    stride = 1
+                    for s, c in zip(reversed(states), parent_cards):
+                        config += s * stride
+                        stride *= c
+                    table[config * card + value] = numbers[value * configs + bif_config]
+        for labels, numbers in rows:
+            labels = [l.strip() for l in labels.split(',')]
+            if len(labels) != len(node_parents):
+                raise ValueError(f"Row ({', '.join(labels)}) of {name} does not match its parents")
+            config = 0
+            stride = 1
+            for label, parent in zip(labels, node_parents):
+                if label not in variables[parent]:
+                    raise ValueError(f"Unknown value {label} of {parent} in table for {name}")
+                config += variables[parent].index(label) * stride
+                stride *= len(variables[parent])
+            probs = _numbers(numbers)
+            if len(probs) != card:
+                raise ValueError(f"Row ({', '.join(labels)}) of {name} has {len(probs)} entries, expected {card}")
+            table[config * card:(config + 1) * card] = probs
+
+        if any(p is None for p in table):
+            raise ValueError(f"Probability table for {name} is incomplete")
+        cpts[name] = table
+
+    return variables, parents, cpts
+
+
+def _cache_path(path):
+    return path + '.cache'
+
+
+def _source_stamp(path):
+    stat = os.stat(path)
+    return (CACHE_VERSION, os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+def load_network(path, use_cache=True):
+    """
+    Load a network from a .bif or .json file.
+
+    With use_cache the compiled tables are pickled next to the source
+    (<path>.cache) and reused while the source is unchanged, so large
+    networks skip parsing and validation on later loads.
+
+    Returns:
+        CompiledNetwork
+    """
+    stamp = _source_stamp(path)
+    cache = _cache_path(path)
+
+    if use_cache and os.path.exists(cache):
+        try:
+            with open(cache, 'rb') as f:
+                cached = pickle.load(f)
+            if cached['stamp'] == stamp:
+                network = CompiledNetwork(cached['nodes'], cached['parents'], cached['domains'], cached['tables'])
+                network.fingerprint = stamp
+                return network
+        except (OSError, pickle.PickleError, EOFError, KeyError, ValueError):
+            pass  # stale or unreadable cache: rebuild it below
+
+    with open(path) as f:
+        text = f.read()
+    if path.endswith('.json'):
+        description = parse_json(text)
+    elif path.endswith('.bif'):
+        description = parse_bif(text)
+    else:
+        raise ValueError(f"Unknown network format: {path} (expected .bif or .json)")
+
+    network = build_network(*description)
+    network.fingerprint = stamp
+
+    if use_cache:
+        cached = {
+            'stamp': stamp,
+            'nodes': network.nodes,
+            'parents': network.parent_names,
+            'domains': {n: network.domains[i] for i, n in enumerate(network.nodes)},
+            'tables': {n: network.tables[i] for i, n in enumerate(network.nodes)},
+        }
+        try:
+            with open(cache, 'wb') as f:
+                pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError:
+            pass  # read-only location: loading still works, just uncached
+
+    return network
@@ -0,0 +1,171 @@
+import instrumentation
+from compiled_network import CompiledNetwork, get_network
+
+
+class PruneReport:
+    """
+    What prune_network removed and why, for debugging.
+
+    Attributes:
+        barren: nodes removed because they are neither query, evidence nor
+                an ancestor of one (summing them out gives 1)
+        cut_edges: (parent, child) edges dropped because the parent is
+                   observed; its value was folded into the child's CPT
+        separated: nodes removed because, after the cuts, they are not
+                   connected to any query node (d-separated given the evidence)
+        observed: evidence nodes removed because every edge out of them was
+                  cut (their values now live in the children's CPTs)
+        kept: nodes of the reduced network, in topological order
+    """
+
+    def __init__(self):
+        self.barren = []
+        self.cut_edges = []
+        self.separated = []
+        self.observed = []
+        self.kept = []
+
+    def removed(self):
+        return self.barren + self.separated + self.observed
+
+    def __str__(self):
+        lines = [f"kept {len(self.kept)} node(s): {', '.join(self.kept) or '-'}"]
+        if self.barren:
+            lines.append(f"barren: {', '.join(self.barren)}")
+        if self.cut_edges:
+            lines.append(f"observed-parent edges cut: {', '.join(f'{p}->{c}' for p, c in self.cut_edges)}")
+        if self.separated:
+            lines.append(f"d-separated from the query: {', '.join(self.separated)}")
+        if self.observed:
+            lines.append(f"observed (folded into CPTs): {', '.join(self.observed)}")
+        return '\n'.join(lines)
+
+
+def prune_network(query_vars, evidence, network=None):
+    """
+    Reduce a network to the part that matters for P(query_vars | evidence).
+
+    1. Drop barren nodes: anything that is not an ancestor of (or equal to)
+       a query or evidence node.
+    2. Cut every edge leaving an observed node, conditioning the child's CPT
+       on the observed value.
+    3. Drop every node no longer connected to a query node.
+
+    The posterior over query_vars is the same on the reduced network.
+
+    Returns:
+        Tuple of (reduced CompiledNetwork, evidence restricted to it, PruneReport)
+    """
+    if network is None:
+        network = get_network()
+    with instrumentation.timer('prune'):
+        reduced, reduced_evidence, report = _prune(network, query_vars, evidence)
+    if instrumentation.active:
+        instrumentation.add('prune.nodes_removed', len(report.removed()))
+        instrumentation.add('prune.edges_cut', len(report.cut_edges))
+    return reduced, reduced_evidence, report
+
+
+def _prune(network, query_vars, evidence):
+    query_ids = network.query_ids(query_vars)
+    encoded = network.encode_evidence(evidence)
+    report = PruneReport()
+
+    # 1. Ancestral closure of the query and evidence nodes
+    relevant = set(query_ids) | set(encoded)
+    stack = list(relevant)
+    while stack:
+        for parent in network.parents[stack.pop()]:
+            if parent not in relevant:
+                relevant.add(parent)
+                stack.append(parent)
+    report.barren = [network.nodes[i] for i in range(len(network.nodes)) if i not in relevant]
+
+    # 2. Cut edges out of observed nodes
+    kept_parents = {}
+    neighbours = {i: set() for i in relevant}
+    for i in relevant:
+        kept_parents[i] = []
+        for parent in network.parents[i]:
+            if parent in encoded:
+                report.cut_edges.append((network.nodes[parent], network.nodes[i]))
+            else:
+                kept_parents[i].append(parent)
+                neighbours[i].add(parent)
+                neighbours[parent].add(i)
+
+    # 3. Keep the connected components that hold a query node
+    connected = set(query_ids)
+    stack = list(query_ids)
+    while stack:
+        for n in neighbours[stack.pop()]:
+            if n not in connected:
+                connected.add(n)
+                stack.append(n)
+    report.separated = [network.nodes[i] for i in sorted(relevant - connected) if i not in encoded]
+    report.observed = [network.nodes[i] for i in sorted(relevant - connected) if i in encoded]
+    report.cut_edges = [(p, c) for p, c in report.cut_edges if network.index[c] in connected]
+
+    kept = sorted(connected)
+    report.kept = [network.nodes[i] for i in kept]
+
+    tables = {}
+    for i in kept:
+        tables[network.nodes[i]] = _condition_table(network, i, kept_parents[i], encoded)
+
+    reduced = CompiledNetwork(
+        report.kept,
+        {network.nodes[i]: [network.nodes[p] for p in kept_parents[i]] for i in kept},
+        {network.nodes[i]: network.domains[i] for i in kept},
+        tables,
+    )
+    reduced.fingerprint = ('pruned', network.fingerprint, tuple(report.kept),
+                           tuple(sorted((network.nodes[i], s) for i, s in encoded.items() if i in connected)))
+    reduced_evidence = {name: value for name, value in evidence.items() if name in reduced.index}
+    return reduced, reduced_evidence, report
+
+
+def _condition_table(network, node_id, kept_parents, encoded):
+    """
+    CPT of node_id over kept_parents only, with the observed parents fixed
+    to their evidence states.
+    """
+    card = network.cardinality[node_id]
+    if len(kept_parents) == len(network.parents[node_id]):
+        return list(network.tables[node_id])
+
+    assignment = [0] * len(network.nodes)
+    for parent in network.parents[node_id]:
+        if parent in encoded:
+            assignment[parent] = encoded[parent]
+
+    configs = 1
+    for parent in kept_parents:
+        configs *= network.cardinality[parent]
+
+    table = []
+    for config in range(configs):
+        # Decode the reduced config (first kept parent fastest)
+        rest = config
+        for parent in kept_parents:
+            assignment[parent] = rest % network.cardinality[parent]
+            rest //= network.cardinality[parent]
+        row = network.parent_config(node_id, assignment) * card
+        table.extend(network.tables[node_id][row:row + card])
+    return table
+
+
+def run_pruned(engine, query_vars, evidence, *args, network=None, **kwargs):
+    """
+    Prune the network for this query, then run any engine on the result.
+
+    Args:
+        engine: function taking (query_vars, evidence, ..., network=...)
+        query_vars, evidence: the query
+        *args, **kwargs: passed through to the engine
+
+    Returns:
+        Tuple of (engine result, PruneReport)
+    """
+    reduced, reduced_evidence, report = prune_network(query_vars, evidence, network)
+    return engine(query_vars, reduced_evidence, *args, network=reduced, **kwargs), report
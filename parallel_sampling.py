@@ -0,0 +1,153 @@
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from sampling_inference import prior_counts, rejection_counts, likelihood_counts, counts_to_probabilities
+from gibbs_sampling import gibbs_counts
+from adaptive_sampling import adaptive_counts
+from counter_rng import CounterStream
+from compiled_network import get_network, set_network
+
+SAMPLERS = {
+    'prior': prior_counts,
+    'rejection': rejection_counts,
+    'likelihood': likelihood_counts,
+    'gibbs': gibbs_counts,
+    'adaptive': adaptive_counts,
+}
+
+# Samplers that take their uniform draws from a random_streams backend
+STREAM_SAMPLERS = ('prior', 'rejection', 'likelihood')
+
+# Trials with more samples than this are split into several shards
+DEFAULT_CHUNK_SIZE = 2500
+
+
+def _run_shard(task):
+    """
+    Worker entry point: draw one shard of samples with its own generator.
+
+    Args:
+        task: tuple (method, query_vars, evidence, num_samples, seed, stream)
+              where seed seeds a random.Random, or is the shard's
+              CounterStream
+
+    Returns:
+        Tuple of (counts keyed by query state tuples, total)
+    """
+    method, query_vars, evidence, num_samples, seed, stream = task
+    rng = seed if isinstance(seed, CounterStream) else random.Random(seed)
+    if method in STREAM_SAMPLERS:
+        return SAMPLERS[method](query_vars, evidence, num_samples, stream=stream, rng=rng)
+    return SAMPLERS[method](query_vars, evidence, num_samples, rng=rng)
+
+
+def _shard_sizes(num_samples, chunk_size):
+    sizes = [chunk_size] * (num_samples // chunk_size)
+    if num_samples % chunk_size:
+        sizes.append(num_samples % chunk_size)
+    return sizes or [0]
+
+
+def trial_stream(seed, trial, method):
+    """
+    CounterStream of one sampler in one trial of a seeded run.
+    """
+    return CounterStream(seed).spawn(trial).spawn(list(SAMPLERS).index(method))
+
+
+def _shards(seed, trial, method, num_samples, chunk_size, stream):
+    """
+    (num_samples, seed) of every shard of one trial of one sampler.
+    """
+    shards = _shard_sizes(num_samples, chunk_size)
+    if seed is None:
+        return [(n, random.getrandbits(64)) for n in shards]
+    root = trial_stream(seed, trial, method)
+    if method in STREAM_SAMPLERS and stream == 'random':
+        # Shard k takes the sample range after shards 0 .. k-1
+        starts = [sum(shards[:k]) for k in range(len(shards))]
+        return [(n, root.advance(start)) for n, start in zip(shards, starts)]
+    # Chains, adaptive stages and the quasi-random backends cannot be cut
+    # into sample ranges, so the trial runs as one task
+    return [(num_samples, root)]
+
+
+def submit_trials(pool, query_vars, evidence, num_samples, num_trials=10, chunk_size=DEFAULT_CHUNK_SIZE,
+                  stream='random', seed=None):
+    """
+    Queue every trial of every sampler on the pool.
+
+    Each shard gets a seed drawn from the global random module in a fixed
+    order, so the results only depend on the top-level random.seed() and
+    not on how the pool schedules the work. stream is the random-stream
+    backend for the STREAM_SAMPLERS; every shard draws its own randomized
+    sequence.
+
+    With an explicit seed the shards run on counter-based streams instead
+    (see trial_stream). Prior, rejection and likelihood weighting shards
+    then cover consecutive sample ranges of one stream, so their counts
+    are the same for any chunk_size and number of workers (weight sums up
+    to rounding). Gibbs, adaptive and the non-'random' backends run each
+    trial as one unsharded task on the trial's stream, so their results
+    depend only on (seed, trial, method).
+
+    Returns:
+        Handle to pass to collect_trials
+    """
+    futures = {}
+    for trial in range(num_trials):
+        for method in SAMPLERS:
+            futures[(trial, method)] = [
+                pool.submit(_run_shard, (method, query_vars, evidence, n, shard_seed, stream))
+                for n, shard_seed in _shards(seed, trial, method, num_samples, chunk_size, stream)
+            ]
+    return query_vars, num_trials, futures
+
+
+def collect_trials(handle):
+    """
+    Wait for the trials queued by submit_trials and merge their shards.
+
+    Shard counts are summed in shard order, so the merge is deterministic.
+
+    Returns:
+        Dictionary in the same format as main.run_sampling_trials
+    """
+    query_vars, num_trials, futures = handle
+    target_key = tuple([True] * len(query_vars))
+    results = {method: [] for method in SAMPLERS}
+
+    for trial in range(num_trials):
+        for method in SAMPLERS:
+            counts = {}
+            total = 0
+            for future in futures[(trial, method)]:
+                shard_counts, shard_total = future.result()
+                for key, value in shard_counts.items():
+                    counts[key] = counts.get(key, 0) + value
+                total += shard_total
+            probs = counts_to_probabilities(query_vars, counts, total)
+            results[method].append(probs.get(target_key, 0))
+
+    averages = {method: sum(values) / len(values) if values else 0 for method, values in results.items()}
+    return {
+        'prior': averages['prior'],
+        'rejection': averages['rejection'],
+        'likelihood': averages['likelihood'],
+        'gibbs': averages['gibbs'],
+        'adaptive': averages['adaptive'],
+        'prior_all': results['prior'],
+        'rejection_all': results['rejection'],
+        'likelihood_all': results['likelihood'],
+        'gibbs_all': results['gibbs'],
+        'adaptive_all': results['adaptive']
+    }
+
+
+def make_pool(workers):
+    """
+    Process pool used by the --workers execution mode. Every worker starts
+    by installing the active network, so a network loaded with --network or
+    set_network reaches workers that are spawned rather than forked.
+    """
+    return ProcessPoolExecutor(max_workers=workers, initializer=set_network, initargs=(get_network(),))
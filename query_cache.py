@@ -0,0 +1,79 @@
+from compiled_network import get_network
+from exact_inference import query_exact
+from result_cache import QueryCache
+from sampling_inference import prior_sampling, rejection_sampling, likelihood_weighting
+
+SAMPLERS = {
+    'prior': prior_sampling,
+    'rejection': rejection_sampling,
+    'likelihood': likelihood_weighting,
+}
+
+
+default_cache = QueryCache()
+
+
+def canonical_key(query_vars, evidence, engine, num_samples=None, seed=None):
+    """
+    Canonical cache key: evidence order does not matter, query order does
+    (it fixes the layout of the result tuples).
+    """
+    return (engine, tuple(query_vars), tuple(sorted(evidence.items())), num_samples, seed)
+
+
+def cached_query_exact(query_vars, evidence, method='enumeration', cache=None):
+    """
+    query_exact with memoization.
+
+    Args:
+        query_vars: List of query variables
+        evidence: Dictionary of evidence
+        method: exact inference method passed to query_exact
+        cache: QueryCache to use (defaults to the module-level cache)
+
+    Returns:
+        Dictionary of probabilities for each query assignment
+    """
+    if cache is None:
+        cache = default_cache
+    cache.check_network(get_network())
+
+    key = canonical_key(query_vars, evidence, method)
+    result = cache.get(key)
+    if result is None:
+        result = query_exact(query_vars, evidence, method)
+        cache.put(key, result)
+    return dict(result)
+
+
+def cached_sampling(method, query_vars, evidence, num_samples, seed, cache=None):
+    """
+    Seeded sampling with memoization.
+
+    The sampler runs on the counter-based stream of `seed` and never
+    touches the global random module, so a cached answer is the same one a
+    fresh run would give, from any thread.
+
+    Args:
+        method: 'prior', 'rejection' or 'likelihood'
+        query_vars: List of query variables
+        evidence: Dictionary of evidence
+        num_samples: Number of samples
+        seed: Seed for the run; results are only cacheable when it is fixed
+        cache: QueryCache to use (defaults to the module-level cache)
+
+    Returns:
+        Dictionary of probabilities for each query assignment
+    """
+    if method not in SAMPLERS:
+        raise ValueError(f"Unknown sampling method: {method}")
+    if cache is None:
+        cache = default_cache
+    cache.check_network(get_network())
+
+    key = canonical_key(query_vars, evidence, method, num_samples, seed)
+    result = cache.get(key)
+    if result is None:
+        result = SAMPLERS[method](query_vars, evidence, num_samples, rng=seed)
+        cache.put(key, result)
+    return dict(result)
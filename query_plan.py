@@ -0,0 +1,155 @@
+import re
+from collections import namedtuple
+
+import instrumentation
+from compiled_network import get_network
+from result_cache import QueryCache
+from exact_inference import enumerate_query
+from variable_elimination import eliminate_query
+from joint_table import shared_table
+
+# [<N1,V1><N2,V2>][Q1,Q2]: the evidence group holds only <...> items, optionally
+# separated by commas, and the query group directly follows it
+QUERY_SYNTAX = re.compile(r'\[(\s*(?:<[^<>\[\]]*>(?:\s*,?\s*<[^<>\[\]]*>)*)?\s*)\]\[([^\[\]]*)\]')
+EVIDENCE_ITEM = re.compile(r'<([^<>]*)>')
+
+PLAN_CACHE_SIZE = 4096
+
+
+class QueryPlan(namedtuple('QueryPlan', ['network', 'evidence', 'query_ids', 'mask', 'values'])):
+    """
+    A parsed and validated query, in the compiled network's terms.
+
+    evidence is a tuple of (node_id, state) pairs in input order and
+    query_ids a tuple of node ids. mask and values pack the evidence into
+    the network's bit fields (CompiledNetwork.bit_fields): an assignment x
+    agrees with the evidence when (x & mask) == values. For a boolean
+    network bit i is node i, the layout JointTable and SampleBank use.
+    """
+    __slots__ = ()
+
+    def encoded(self):
+        """
+        The evidence as {node_id: state}, as the engines' id-level entry
+        points take it.
+        """
+        return dict(self.evidence)
+
+    def evidence_dict(self):
+        """
+        The evidence as {name: value}.
+        """
+        network = self.network
+        return {network.nodes[i]: network.domains[i][s] for i, s in self.evidence}
+
+    def query_vars(self):
+        return [self.network.nodes[i] for i in self.query_ids]
+
+
+def _syntax_error(text):
+    if not text.startswith('['):
+        return ValueError("Input must start with '['")
+    head = text[:text.find(']')] if ']' in text else text
+    if head.count('<') > head.count('>'):
+        return ValueError("Unclosed '<' in evidence")
+    return ValueError("Invalid format. Expected [evidence][query]")
+
+
+# Parsed queries by (string, network schema); entries hold no network, so
+# the cache keeps none alive
+_plans = QueryCache(PLAN_CACHE_SIZE)
+
+
+def _compile(text, network):
+    """
+    The evidence, query ids, mask and values of a query string.
+    """
+    match = QUERY_SYNTAX.fullmatch(text)
+    if match is None:
+        raise _syntax_error(text)
+    evidence_str, query_str = match.groups()
+
+    offsets, widths = network.bit_fields()
+    evidence = {}
+    for item in EVIDENCE_ITEM.findall(evidence_str.replace(" ", "")):
+        parts = item.split(',')
+        if len(parts) != 2:
+            raise ValueError(f"Invalid evidence item: {item}")
+        node = parts[0]
+        if node not in network.index:
+            raise ValueError(f"Invalid node: {node}")
+        node_id = network.index[node]
+        evidence[node_id] = network.state_index[node_id][network.parse_value(node, parts[1])]
+
+    query_ids = []
+    query_str = query_str.replace(" ", "")
+    if query_str:
+        for item in query_str.split(','):
+            if item not in network.index:
+                raise ValueError(f"Invalid query variable: {item}")
+            query_ids.append(network.index[item])
+
+    mask = 0
+    values = 0
+    for node_id, state in evidence.items():
+        mask |= ((1 << widths[node_id]) - 1) << offsets[node_id]
+        values |= state << offsets[node_id]
+    return tuple(evidence.items()), tuple(query_ids), mask, values
+
+
+def compile_query(text, network=None):
+    """
+    Parse [<N1,V1><N2,V2>][Q1,Q2] into a QueryPlan, checking node names and
+    values against the network.
+
+    Plans are cached per (string, network schema), so a repeated query
+    string costs one dictionary lookup, and a network recompiled after a
+    CPT change reuses them. Evidence items may be separated by commas
+    ([<A,t>,<B,f>][Q]).
+
+    Raises:
+        ValueError: for malformed input or unknown nodes and values
+    """
+    if network is None:
+        network = get_network()
+    with instrumentation.timer('parse'):
+        text = text.strip()
+        key = (text, network.schema)
+        parsed = _plans.get(key)
+        if parsed is None:
+            parsed = _compile(text, network)
+            _plans.put(key, parsed)
+        return QueryPlan(network, *parsed)
+
+
+def plan_cache_info():
+    return _plans.stats()
+
+
+def run_plan(plan, method='elimination', heuristic='min_fill'):
+    """
+    Answer a compiled query without going back through names and values.
+
+    Args:
+        plan: QueryPlan from compile_query
+        method: 'enumeration', 'elimination' or 'tabulated' (which reads the
+                shared JointTable with the plan's mask and values, falling
+                back to elimination when the network cannot be tabulated)
+        heuristic: elimination order for 'elimination'
+
+    Returns:
+        Dictionary of probabilities for each query assignment, as query_exact
+    """
+    if method not in ('enumeration', 'elimination', 'tabulated'):
+        raise ValueError(f"Unknown exact inference method: {method}")
+    network = plan.network
+    instrumentation.add(f'{method}.queries')
+    with instrumentation.timer('infer'):
+        if method == 'tabulated':
+            table = shared_table(network)
+            if table is not None:
+                return table.answer(plan.query_ids, plan.mask, plan.values)
+            method = 'elimination'
+        if method == 'enumeration':
+            return enumerate_query(network, list(plan.query_ids), plan.encoded())
+        return eliminate_query(network, list(plan.query_ids), plan.encoded(), heuristic)
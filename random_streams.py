@@ -0,0 +1,213 @@
+import math
+import random
+
+# Backends accepted by the samplers' stream argument. 'random' is the plain
+# random.random() draw per node and leaves the samplers' behaviour unchanged.
+STREAMS = ('random', 'stratified', 'lhs', 'halton', 'sobol')
+
+# Sobol direction numbers (Joe and Kuo, new-joe-kuo-6.21201) for dimensions
+# 2..21 as (degree, polynomial coefficients, initial m values). Dimension 1
+# is the van der Corput sequence in base 2.
+SOBOL_DIRECTIONS = [
+    (1, 0, (1,)),
+    (2, 1, (1, 3)),
+    (3, 1, (1, 3, 1)),
+    (3, 2, (1, 1, 1)),
+    (4, 1, (1, 1, 3, 3)),
+    (4, 4, (1, 3, 5, 13)),
+    (5, 2, (1, 1, 5, 5, 17)),
+    (5, 4, (1, 1, 5, 5, 5)),
+    (5, 7, (1, 1, 7, 11, 19)),
+    (5, 11, (1, 1, 5, 1, 1)),
+    (5, 13, (1, 1, 1, 3, 11)),
+    (5, 14, (1, 3, 5, 5, 31)),
+    (6, 1, (1, 3, 3, 9, 7, 49)),
+    (6, 13, (1, 1, 1, 15, 21, 21)),
+    (6, 16, (1, 3, 1, 13, 27, 49)),
+    (6, 19, (1, 1, 1, 15, 7, 5)),
+    (6, 22, (1, 3, 1, 15, 13, 25)),
+    (6, 25, (1, 1, 5, 5, 19, 61)),
+    (7, 1, (1, 3, 7, 11, 23, 15, 103)),
+    (7, 4, (1, 3, 7, 13, 13, 15, 69)),
+]
+
+SOBOL_BITS = 32
+
+# Most coordinates (network nodes) a Sobol stream can drive
+MAX_SOBOL_DIMS = len(SOBOL_DIRECTIONS) + 1
+
+
+def _latin_hypercube(rng, num_samples, dims):
+    """
+    Every coordinate takes exactly one value in each of the num_samples
+    equal-width strata of [0, 1); the strata are paired across coordinates
+    by independent random permutations.
+    """
+    columns = []
+    for _ in range(dims):
+        strata = list(range(num_samples))
+        rng.shuffle(strata)
+        columns.append(strata)
+    for i in range(num_samples):
+        yield [(column[i] + rng.random()) / num_samples for column in columns]
+
+
+def _stratified(rng, num_samples, dims):
+    """
+    Jittered grid over the leading coordinates: the first k coordinates
+    (the first k nodes in topological order) are split into m strata each, and
+    every one of the m ** k cells gets one point per full pass over the
+    grid. Points left over after the last full pass, and the remaining
+    coordinates, are drawn independently.
+    """
+    k = min(dims, max(1, int(math.log2(num_samples)))) if num_samples > 1 else 0
+    # k <= log2(num_samples), so there are at least two strata per coordinate
+    m = int(num_samples ** (1 / k) + 1e-9) if k else 1
+    cells = m ** k
+    passes = num_samples // cells if m >= 2 else 0
+
+    points = []
+    for _ in range(passes):
+        for cell in range(cells):
+            point = []
+            for _ in range(k):
+                cell, stratum = divmod(cell, m)
+                point.append((stratum + rng.random()) / m)
+            point.extend(rng.random() for _ in range(dims - k))
+            points.append(point)
+    while len(points) < num_samples:
+        points.append([rng.random() for _ in range(dims)])
+    rng.shuffle(points)
+    return iter(points)
+
+
+def _primes(count):
+    primes = []
+    candidate = 2
+    while len(primes) < count:
+        if all(candidate % p for p in primes if p * p <= candidate):
+            primes.append(candidate)
+        candidate += 1
+    return primes
+
+
+def _halton(rng, num_samples, dims):
+    """
+    Halton sequence (radical inverses in the first dims primes) with random
+    digit permutations: digit d of every coordinate goes through its own
+    permutation of 0..base-1, which keeps the stratification of the
+    sequence and makes every point uniform.
+    """
+    bases = _primes(dims)
+    digits = [max(1, math.ceil(math.log(num_samples + 1, b))) + 1 for b in bases]
+    permutations = []
+    for base, count in zip(bases, digits):
+        levels = []
+        for _ in range(count):
+            perm = list(range(base))
+            rng.shuffle(perm)
+            levels.append(perm)
+        permutations.append(levels)
+
+    for i in range(num_samples):
+        point = []
+        for base, levels in zip(bases, permutations):
+            n = i
+            value = 0.0
+            scale = 1.0 / base
+            for perm in levels:
+                n, digit = divmod(n, base)
+                value += perm[digit] * scale
+                scale /= base
+            # Jitter inside the smallest box so points are continuous
+            point.append(value + rng.random() * scale * base)
+        yield point
+
+
+def _sobol_directions(dim):
+    """
+    Direction numbers v[j] (as SOBOL_BITS-bit integers) of Sobol dimension dim.
+    """
+    if dim == 0:
+        return [1 << (SOBOL_BITS - 1 - j) for j in range(SOBOL_BITS)]
+    degree, coefficients, initial = SOBOL_DIRECTIONS[dim - 1]
+    m = list(initial)
+    for j in range(degree, SOBOL_BITS):
+        value = m[j - degree] ^ (m[j - degree] << degree)
+        for k in range(1, degree):
+            if coefficients >> (degree - 1 - k) & 1:
+                value ^= m[j - k] << k
+        m.append(value)
+    return [m[j] << (SOBOL_BITS - 1 - j) for j in range(SOBOL_BITS)]
+
+
+def _scramble(directions, rng):
+    """
+    Random linear matrix scramble: multiply every direction number by the
+    same random lower-triangular bit matrix with a unit diagonal (bits are
+    counted from the most significant one).
+    """
+    rows = []
+    for i in range(SOBOL_BITS):
+        row = rng.getrandbits(i) << (SOBOL_BITS - i) if i else 0
+        rows.append(row | 1 << (SOBOL_BITS - 1 - i))
+    scrambled = []
+    for v in directions:
+        out = 0
+        for i, row in enumerate(rows):
+            if bin(row & v).count('1') & 1:
+                out |= 1 << (SOBOL_BITS - 1 - i)
+        scrambled.append(out)
+    return scrambled
+
+
+def _sobol(rng, num_samples, dims):
+    """
+    Sobol sequence in Gray code order with a random linear matrix scramble
+    and a random digital shift per coordinate (Owen-style randomization
+    that keeps the net structure and makes every point uniform).
+    """
+    if dims > MAX_SOBOL_DIMS:
+        raise ValueError(f"Sobol streams support at most {MAX_SOBOL_DIMS} nodes")
+    directions = [_scramble(_sobol_directions(d), rng) for d in range(dims)]
+    state = [rng.getrandbits(SOBOL_BITS) for _ in range(dims)]
+    scale = 1.0 / (1 << SOBOL_BITS)
+    for i in range(num_samples):
+        if i:
+            # Gray code: flip the direction number of the lowest zero bit of i - 1
+            c = ((i - 1) ^ i).bit_length() - 1
+            state = [x ^ v[c] for x, v in zip(state, directions)]
+        yield [(x + rng.random()) * scale for x in state]
+
+
+_BACKENDS = {
+    'stratified': _stratified,
+    'lhs': _latin_hypercube,
+    'halton': _halton,
+    'sobol': _sobol,
+}
+
+
+def uniform_stream(stream, num_samples, dims, rng=None):
+    """
+    Iterator over num_samples points of [0, 1) ** dims from the chosen
+    backend; coordinate i drives node i. The backend is seeded from rng,
+    or from the global random module so that random.seed() still fixes
+    the result.
+
+    Args:
+        stream: one of STREAMS
+        num_samples: number of points the sampler will draw
+        dims: number of coordinates per point (the number of nodes)
+        rng: optional generator with getrandbits() to seed the backend from
+
+    Returns:
+        Iterator of coordinate lists, or None for the 'random' backend (the
+        samplers then call random.random() as before)
+    """
+    if stream not in STREAMS:
+        raise ValueError(f"Unknown random stream: {stream}. Use one of {', '.join(STREAMS)}.")
+    if stream == 'random':
+        return None
+    rng = random.Random((random if rng is None else rng).getrandbits(64))
+    return _BACKENDS[stream](rng, num_samples, dims)
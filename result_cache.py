@@ -0,0 +1,67 @@
+from collections import OrderedDict
+
+import instrumentation
+
+
+class QueryCache:
+    """
+    Bounded LRU cache of posterior results.
+
+    Entries are keyed by the caller (query_cache.canonical_key for the
+    posterior cache). Callers that pass a network to check_network get the
+    entries dropped when its fingerprint changes, so edits to the CPTs in
+    network_definition (picked up by reload_network) never serve stale
+    answers.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.fingerprint = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def check_network(self, network):
+        """
+        Drop every entry if the network changed since the entries were stored.
+        """
+        if self.fingerprint != network.fingerprint:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+            self.fingerprint = network.fingerprint
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            instrumentation.add('cache.hits')
+            return self.entries[key]
+        self.misses += 1
+        instrumentation.add('cache.misses')
+        return None
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        return {
+            'size': len(self.entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
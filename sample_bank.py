@@ -0,0 +1,231 @@
+import json
+
+from compiled_network import get_network
+from sampling_inference import cpt_arrays, weighted_sample_batch, counts_to_probabilities
+from counter_rng import counter_stream, sequential_rng
+
+try:
+    import numpy as np
+except ImportError:  # sample banks need numpy; the other samplers do not
+    np = None
+
+# Rows scanned at a time, so a memory-mapped bank is never loaded whole
+DEFAULT_CHUNK_ROWS = 1 << 20
+
+
+def field_layout(network):
+    """
+    Bit field of every node inside a packed sample row: node i occupies
+    widths[i] bits starting at offsets[i] (see CompiledNetwork.bit_fields).
+
+    Returns:
+        Tuple of (offsets, widths)
+    """
+    offsets, widths = network.bit_fields()
+    bits = offsets[-1] + widths[-1] if offsets else 0
+    if bits > 64:
+        raise ValueError(f"Samples need {bits} bits, sample banks hold at most 64 per row")
+    return offsets, widths
+
+
+class SampleBank:
+    """
+    Prior samples stored as one uint64 per sample, with every node's state
+    in its own bit field (see field_layout).
+
+    The bank is drawn once and then answers any number of (query, evidence)
+    pairs rejection-style: a row matches the evidence when
+    (row & mask) == values, and matching rows are bucketed by their query
+    fields. Banks can be saved and reopened as memory-mapped files.
+    """
+
+    def __init__(self, rows, network=None):
+        """
+        Args:
+            rows: uint64 array (or memmap) of packed samples
+            network: CompiledNetwork the samples were drawn from
+        """
+        if np is None:
+            raise ImportError("numpy is required for sample banks")
+        if network is None:
+            network = get_network()
+        self.network = network
+        self.rows = rows
+        self.offsets, self.widths = field_layout(network)
+
+    def __len__(self):
+        return len(self.rows)
+
+    @classmethod
+    def generate(cls, num_samples, network=None, batch_size=65536, rng=None):
+        """
+        Draw num_samples prior samples in NumPy batches.
+
+        The generator is seeded from rng, by default the global random
+        module so that random.seed() still controls the bank. With an
+        integer seed or a CounterStream the bank holds the same samples
+        for any batch_size (see sampling_inference.prior_sampling).
+        """
+        if np is None:
+            raise ImportError("numpy is required for sample banks")
+        if network is None:
+            network = get_network()
+        offsets, _ = field_layout(network)
+        counter = counter_stream(rng)
+        if counter is None:
+            generator = np.random.default_rng(sequential_rng(rng).getrandbits(64))
+        tables = cpt_arrays(network)
+
+        rows = np.zeros(num_samples, dtype=np.uint64)
+        for start in range(0, num_samples, batch_size):
+            n = min(batch_size, num_samples - start)
+            if counter is not None:
+                generator = counter.advance(start)
+            states, _ = weighted_sample_batch({}, n, generator, network, tables)
+            packed = np.zeros(n, dtype=np.uint64)
+            for node_id, offset in enumerate(offsets):
+                packed |= states[node_id].astype(np.uint64) << np.uint64(offset)
+            rows[start:start + n] = packed
+        return cls(rows, network)
+
+    def save(self, path):
+        """
+        Write the rows to path (in .npy format, under exactly that name) and
+        the node layout to path + '.json', so load() can check the bank
+        against a network.
+        """
+        # np.save(path) would append '.npy' to a path without it
+        with open(path, 'wb') as f:
+            np.save(f, np.asarray(self.rows))
+        meta = {
+            'nodes': self.network.nodes,
+            'cardinality': self.network.cardinality,
+            'samples': len(self.rows),
+        }
+        with open(path + '.json', 'w') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path, network=None):
+        """
+        Open a saved bank memory-mapped (read-only).
+        """
+        if np is None:
+            raise ImportError("numpy is required for sample banks")
+        if network is None:
+            network = get_network()
+        with open(path + '.json') as f:
+            meta = json.load(f)
+        if meta['nodes'] != network.nodes or meta['cardinality'] != network.cardinality:
+            raise ValueError(f"Sample bank {path} was drawn from a different network")
+        return cls(np.load(path, mmap_mode='r'), network)
+
+    def _selector(self, evidence):
+        """
+        (mask, values) selecting the rows that agree with the evidence.
+        """
+        mask = 0
+        values = 0
+        for node_id, state in self.network.encode_evidence(evidence).items():
+            mask |= ((1 << self.widths[node_id]) - 1) << self.offsets[node_id]
+            values |= state << self.offsets[node_id]
+        return np.uint64(mask), np.uint64(values)
+
+    def count_many(self, queries, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """
+        Rejection-style tallies for many queries in one pass over the bank.
+
+        Queries with the same evidence share the row selection, and repeated
+        queries are counted once.
+
+        Args:
+            queries: list of (evidence dict, query_vars list) pairs
+
+        Returns:
+            List of (counts keyed by query state tuples, matching rows) pairs,
+            in the order of queries
+        """
+        network = self.network
+        selectors = {}
+        groups = {}
+        for i, (evidence, query_vars) in enumerate(queries):
+            evidence_key = tuple(sorted(evidence.items()))
+            if evidence_key not in selectors:
+                selectors[evidence_key] = self._selector(evidence)
+            query_ids = tuple(network.query_ids(query_vars))
+            groups.setdefault(selectors[evidence_key], {}).setdefault(query_ids, []).append(i)
+        return self._count_groups(groups, len(queries), chunk_rows)
+
+    def count_plans(self, plans, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """
+        count_many for compiled QueryPlans, whose evidence mask and values
+        use the same bit fields as the bank rows.
+        """
+        groups = {}
+        for i, plan in enumerate(plans):
+            if plan.network is not self.network:
+                raise ValueError("Query plan was compiled for a different network")
+            selector = (np.uint64(plan.mask), np.uint64(plan.values))
+            groups.setdefault(selector, {}).setdefault(plan.query_ids, []).append(i)
+        return self._count_groups(groups, len(plans), chunk_rows)
+
+    def _count_groups(self, groups, num_queries, chunk_rows):
+        """
+        Args:
+            groups: {(mask, values): {query_ids: [positions in the result]}}
+        """
+        network = self.network
+        plans = []
+        for (mask, values), members in groups.items():
+            targets = []
+            for query_ids, indices in members.items():
+                size = 1
+                for node_id in query_ids:
+                    size *= network.cardinality[node_id]
+                targets.append((indices, query_ids, np.zeros(size, dtype=np.int64)))
+            plans.append({'mask': mask, 'values': values, 'matched': 0, 'targets': targets})
+
+        for start in range(0, len(self.rows), chunk_rows):
+            chunk = np.asarray(self.rows[start:start + chunk_rows])
+            for plan in plans:
+                selected = chunk[(chunk & plan['mask']) == plan['values']]
+                plan['matched'] += len(selected)
+                for _, query_ids, totals in plan['targets']:
+                    # Mixed-radix key with query_ids[0] most significant
+                    key = np.zeros(len(selected), dtype=np.intp)
+                    for node_id in query_ids:
+                        field = (selected >> np.uint64(self.offsets[node_id])) & np.uint64((1 << self.widths[node_id]) - 1)
+                        key = key * network.cardinality[node_id] + field.astype(np.intp)
+                    totals += np.bincount(key, minlength=len(totals))
+
+        results = [None] * num_queries
+        for plan in plans:
+            for indices, query_ids, totals in plan['targets']:
+                counts = {}
+                for combination, count in zip(network.assignments(query_ids), totals.tolist()):
+                    if count:
+                        counts[combination] = count
+                for i in indices:
+                    results[i] = (dict(counts), plan['matched'])
+        return results
+
+    def counts(self, query_vars, evidence):
+        """
+        Returns:
+            Tuple of (counts keyed by query state tuples, number of matching rows)
+        """
+        return self.count_many([(evidence, query_vars)])[0]
+
+    def query(self, query_vars, evidence):
+        """
+        Approximate P(query_vars | evidence) from the rows matching the evidence.
+        """
+        counts, total = self.counts(query_vars, evidence)
+        return counts_to_probabilities(query_vars, counts, total, self.network)
+
+    def query_many(self, queries):
+        """
+        query() for a list of (evidence, query_vars) pairs, in one pass.
+        """
+        return [counts_to_probabilities(query_vars, counts, total, self.network)
+                for (_, query_vars), (counts, total) in zip(queries, self.count_many(queries))]
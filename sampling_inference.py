@@ -1,195 +1,471 @@
+import math
 import random
-import itertools
-from network_definition import NODES, PARENTS
-from bayes_network import get_probability, get_all_parent_values
+import instrumentation
+from compiled_network import get_network
+from random_streams import uniform_stream
+from counter_rng import CounterStream, counter_stream, sequential_rng
+from log_math import LOG_ZERO, log, logaddexp
 
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for the batched sampling paths
+    np = None
 
-def generate_prior_sample():
+
+def _prior_states(network, u=None, rand=random.random):
+    """
+    Sample a full state assignment (list indexed by node id) from the prior.
+    u, if given, holds the uniform draw for every node (see random_streams);
+    otherwise every node calls rand().
+    """
+    states = [0] * len(network.nodes)
+    for node_id in range(len(network.nodes)):
+        config = network.parent_config(node_id, states)
+        states[node_id] = network.sample_state(node_id, config, rand() if u is None else u[node_id])
+    return states
+
+
+def _sample_draws(rng, stream, num_samples, dims):
+    """
+    Where the scalar samplers take their uniform draws from.
+
+    Returns:
+        Tuple of (iterator of per-sample draw lists or None, rand function
+        used when the iterator is None)
+    """
+    counter = counter_stream(rng)
+    if counter is not None and stream == 'random':
+        return counter.uniforms(num_samples, dims), None
+    generator = sequential_rng(rng)
+    return uniform_stream(stream, num_samples, dims, generator), generator.random
+
+
+def generate_prior_sample(network=None, uniforms=None):
     """
     Generate one sample from the prior distribution (no evidence).
     Sample each variable in topological order based on its parents.
-    
+
+    Args:
+        network: CompiledNetwork to use (defaults to network_definition)
+        uniforms: optional iterator from random_streams.uniform_stream; the
+                  sample takes its uniform draws from the next point
+
     Returns:
         Dictionary {variable: value} representing one complete sample
     """
-    sample = {}
-    
-    for node in NODES:
-        # Get parent values from what we've already sampled
-        parent_values = get_all_parent_values(node, sample)
-        
-        # Get probability of this node being True given its parents
-        prob_true = get_probability(node, True, parent_values)
-        
-        # Sample: generate random number and compare to probability
-        sample[node] = random.random() < prob_true
-    
-    return sample
+    if network is None:
+        network = get_network()
+    states = _prior_states(network, None if uniforms is None else next(uniforms))
+    return {name: network.domains[i][s] for i, (name, s) in enumerate(zip(network.nodes, states))}
+
 
+def _uniform(network, query_ids):
+    combinations = list(network.assignments(query_ids))
+    return {network.decode(query_ids, c): 1.0 / len(combinations) for c in combinations}
 
-def prior_sampling(query_vars, evidence, num_samples):
+
+def counts_to_probabilities(query_vars, counts, total, network=None):
     """
-    Approximate P(query_vars | evidence) using prior sampling.
-    Generate samples and count those matching both evidence and query.
-    
-    Args:
-        query_vars: List of query variable names
-        evidence: Dictionary of evidence {variable: value}
-        num_samples: Number of samples to generate
-    
+    Turn per-assignment counts (or weights) keyed by query state tuples into
+    a distribution over query values.
+    Returns the uniform distribution when nothing was counted.
+    """
+    if network is None:
+        network = get_network()
+    with instrumentation.timer('normalize'):
+        return _normalize(network, network.query_ids(query_vars), counts, total)
+
+
+def _normalize(network, query_ids, counts, total):
+    if total == 0:
+        return _uniform(network, query_ids)
+
+    probabilities = {network.decode(query_ids, k): v / total for k, v in counts.items()}
+
+    # Fill in missing combinations with 0 probability
+    for combination in network.assignments(query_ids):
+        key = network.decode(query_ids, combination)
+        if key not in probabilities:
+            probabilities[key] = 0.0
+
+    return probabilities
+
+
+def prior_counts(query_vars, evidence, num_samples, network=None, stream='random', rng=None):
+    """
+    Prior sampling tallies: how often each query assignment was seen among
+    the samples that matched the evidence. stream picks the random-stream
+    backend (see random_streams.STREAMS) and rng the generator (see
+    prior_sampling).
+
     Returns:
-        Dictionary mapping query assignments to probabilities
+        Tuple of (counts keyed by query state tuples, number of matching samples)
     """
+    if network is None:
+        network = get_network()
+    query_ids = network.query_ids(query_vars)
+    encoded = list(network.encode_evidence(evidence).items())
+    uniforms, rand = _sample_draws(rng, stream, num_samples, len(network.nodes))
+
     # Count matches for each query combination
     counts = {}
     total_matching_evidence = 0
-    
+
     for _ in range(num_samples):
-        sample = generate_prior_sample()
-        
+        sample = _prior_states(network, None if uniforms is None else next(uniforms), rand)
+
         # Check if sample matches evidence
-        matches_evidence = all(sample[var] == val for var, val in evidence.items())
-        
+        matches_evidence = all(sample[var] == val for var, val in encoded)
+
         if matches_evidence:
             total_matching_evidence += 1
-            
+
             # Extract query values from this sample
-            query_values = tuple(sample[var] for var in query_vars)
+            query_values = tuple(sample[var] for var in query_ids)
             counts[query_values] = counts.get(query_values, 0) + 1
-    
-    # Convert counts to probabilities
-    if total_matching_evidence == 0:
-        # No samples matched evidence - return uniform distribution
-        num_combinations = 2 ** len(query_vars)
-        return {tuple([True if i & (1 << j) else False for j in range(len(query_vars))]): 
-                1.0 / num_combinations for i in range(num_combinations)}
-    
-    probabilities = {k: v / total_matching_evidence for k, v in counts.items()}
-    
-    # Fill in missing combinations with 0 probability
-    import itertools
-    for combination in itertools.product([True, False], repeat=len(query_vars)):
-        if combination not in probabilities:
-            probabilities[combination] = 0.0
-    
-    return probabilities
 
+    if instrumentation.active:
+        instrumentation.add('prior.samples_generated', num_samples)
+        instrumentation.add('prior.samples_accepted', total_matching_evidence)
+        instrumentation.add('prior.cpt_lookups', num_samples * len(network.nodes))
+    return counts, total_matching_evidence
 
-def rejection_sampling(query_vars, evidence, num_samples):
+
+def prior_sampling(query_vars, evidence, num_samples, network=None, stream='random', rng=None):
     """
-    Approximate P(query_vars | evidence) using rejection sampling.
-    Generate samples and reject those that don't match evidence.
-    
+    Approximate P(query_vars | evidence) using prior sampling.
+    Generate samples and count those matching both evidence and query.
+
     Args:
         query_vars: List of query variable names
-        evidence: Dictionary of evidence
-        num_samples: Number of samples to generate (before rejection)
-    
+        evidence: Dictionary of evidence {variable: value}
+        num_samples: Number of samples to generate
+        network: CompiledNetwork to use (defaults to network_definition)
+        stream: random-stream backend ('random', 'stratified', 'lhs',
+                'halton' or 'sobol')
+        rng: random generator for the run: an integer seed or a
+             counter_rng.CounterStream (sample i then always gets the same
+             draws, whatever the batching or sharding), an object with
+             random() and getrandbits() such as random.Random, or None
+             for the global random module
+
     Returns:
         Dictionary mapping query assignments to probabilities
     """
+    with instrumentation.timer('infer'):
+        counts, total = prior_counts(query_vars, evidence, num_samples, network, stream, rng)
+    return counts_to_probabilities(query_vars, counts, total, network)
+
+
+def rejection_counts(query_vars, evidence, num_samples, network=None, stream='random', rng=None):
+    """
+    Rejection sampling tallies over the accepted samples, with the uniform
+    draws taken from the given random-stream backend and generator.
+
+    Returns:
+        Tuple of (counts keyed by query state tuples, number of accepted samples)
+    """
+    if network is None:
+        network = get_network()
+    query_ids = network.query_ids(query_vars)
+    encoded = list(network.encode_evidence(evidence).items())
+
+    uniforms, rand = _sample_draws(rng, stream, num_samples, len(network.nodes))
+
     counts = {}
     total_accepted = 0
-    
+
     samples_generated = 0
     while samples_generated < num_samples:
-        sample = generate_prior_sample()
+        sample = _prior_states(network, None if uniforms is None else next(uniforms), rand)
         samples_generated += 1
-        
+
         # Check if sample matches evidence
-        matches_evidence = all(sample[var] == val for var, val in evidence.items())
-        
+        matches_evidence = all(sample[var] == val for var, val in encoded)
+
         if matches_evidence:
             # Accept this sample
             total_accepted += 1
-            
+
             # Extract query values
-            query_values = tuple(sample[var] for var in query_vars)
+            query_values = tuple(sample[var] for var in query_ids)
             counts[query_values] = counts.get(query_values, 0) + 1
-    
-    # Convert counts to probabilities
-    if total_accepted == 0:
-        num_combinations = 2 ** len(query_vars)
-        return {tuple([True if i & (1 << j) else False for j in range(len(query_vars))]): 
-                1.0 / num_combinations for i in range(num_combinations)}
-    
-    probabilities = {k: v / total_accepted for k, v in counts.items()}
-    
-    # Fill in missing combinations
-    import itertools
-    for combination in itertools.product([True, False], repeat=len(query_vars)):
-        if combination not in probabilities:
-            probabilities[combination] = 0.0
-    
-    return probabilities
+
+    if instrumentation.active:
+        instrumentation.add('rejection.samples_generated', samples_generated)
+        instrumentation.add('rejection.samples_accepted', total_accepted)
+        instrumentation.add('rejection.samples_rejected', samples_generated - total_accepted)
+        instrumentation.add('rejection.cpt_lookups', samples_generated * len(network.nodes))
+    return counts, total_accepted
 
 
-def weighted_sample(evidence):
+def rejection_sampling(query_vars, evidence, num_samples, network=None, stream='random', rng=None):
     """
-    Generate one weighted sample for likelihood weighting.
-    Evidence variables are fixed, others are sampled.
-    
+    Approximate P(query_vars | evidence) using rejection sampling.
+    Generate samples and reject those that don't match evidence.
+
     Args:
-        evidence: Dictionary of evidence {variable: value}
-    
+        query_vars: List of query variable names
+        evidence: Dictionary of evidence
+        num_samples: Number of samples to generate (before rejection)
+        network: CompiledNetwork to use (defaults to network_definition)
+        stream: random-stream backend (see prior_sampling)
+        rng: random generator or seed (see prior_sampling)
+
     Returns:
-        Tuple of (sample, weight) where sample is a dict and weight is a float
+        Dictionary mapping query assignments to probabilities
     """
-    sample = {}
-    weight = 1.0
-    
-    for node in NODES:
-        parent_values = get_all_parent_values(node, sample)
-        
-        if node in evidence:
+    with instrumentation.timer('infer'):
+        counts, total = rejection_counts(query_vars, evidence, num_samples, network, stream, rng)
+    return counts_to_probabilities(query_vars, counts, total, network)
+
+
+def _weighted_states(network, evidence, u=None, log_space=False, rand=random.random):
+    """
+    One likelihood-weighting sample over compiled ids.
+
+    Args:
+        network: CompiledNetwork
+        evidence: dictionary of encoded evidence {node_id: state}
+        u: optional uniform draw for every node (evidence nodes ignore theirs)
+        log_space: return the log of the weight, which cannot underflow
+        rand: draw function for the non-evidence nodes when u is None
+
+    Returns:
+        Tuple of (states list, weight)
+    """
+    states = [0] * len(network.nodes)
+    weight = 0.0 if log_space else 1.0
+
+    for node_id in range(len(network.nodes)):
+        config = network.parent_config(node_id, states)
+
+        if node_id in evidence:
             # Evidence variable: fix its value and update weight
-            sample[node] = evidence[node]
+            state = evidence[node_id]
+            states[node_id] = state
             # Weight is multiplied by P(node=evidence_value | parents)
-            weight *= get_probability(node, evidence[node], parent_values)
+            prob = network.tables[node_id][config * network.cardinality[node_id] + state]
+            if log_space:
+                weight += log(prob)
+            else:
+                weight *= prob
         else:
             # Non-evidence variable: sample as usual
-            prob_true = get_probability(node, True, parent_values)
-            sample[node] = random.random() < prob_true
-    
+            states[node_id] = network.sample_state(node_id, config, rand() if u is None else u[node_id])
+
+    return states, weight
+
+
+def weighted_sample(evidence, network=None, uniforms=None):
+    """
+    Generate one weighted sample for likelihood weighting.
+    Evidence variables are fixed, others are sampled.
+
+    Args:
+        evidence: Dictionary of evidence {variable: value}
+        network: CompiledNetwork to use (defaults to network_definition)
+        uniforms: optional iterator from random_streams.uniform_stream
+
+    Returns:
+        Tuple of (sample, weight) where sample is a dict and weight is a float
+    """
+    if network is None:
+        network = get_network()
+    states, weight = _weighted_states(network, network.encode_evidence(evidence),
+                                      None if uniforms is None else next(uniforms))
+    sample = {name: network.domains[i][s] for i, (name, s) in enumerate(zip(network.nodes, states))}
     return sample, weight
 
 
-def likelihood_weighting(query_vars, evidence, num_samples):
+def cpt_arrays(network=None):
+    """
+    The compiled CPTs as NumPy arrays of shape (parent configs, cardinality).
+
+    Returns:
+        List of float arrays indexed by node id
+    """
+    if network is None:
+        network = get_network()
+    return [np.asarray(table).reshape(-1, card) for table, card in zip(network.tables, network.cardinality)]
+
+
+def weighted_sample_batch(evidence, batch_size, rng, network=None, tables=None, log_space=False):
+    """
+    Generate a batch of weighted samples for likelihood weighting.
+    Every node is sampled for the whole batch at once in topological order.
+
+    Args:
+        evidence: Dictionary of encoded evidence {node_id: state}
+        batch_size: Number of samples in the batch
+        rng: numpy.random.Generator used for the uniform draws, or a
+             CounterStream positioned at the batch's first sample (the
+             batch then draws exactly what the scalar samplers would)
+        network: CompiledNetwork to use (defaults to network_definition)
+        tables: Optional result of cpt_arrays() to reuse across batches
+        log_space: return log weights (-inf for an impossible sample)
+
+    Returns:
+        Tuple of (states, weights) where states is a list of integer state
+        arrays indexed by node id and weights is a float array
+    """
+    if network is None:
+        network = get_network()
+    if tables is None:
+        tables = cpt_arrays(network)
+
+    states = []
+    weights = np.zeros(batch_size) if log_space else np.ones(batch_size)
+    u = rng.uniform_matrix(batch_size, len(network.nodes)) if isinstance(rng, CounterStream) else None
+
+    for node_id in range(len(network.nodes)):
+        config = np.zeros(batch_size, dtype=np.intp)
+        for parent, stride in network.parent_strides[node_id]:
+            config += states[parent] * stride
+        rows = tables[node_id][config]
+
+        if node_id in evidence:
+            state = evidence[node_id]
+            states.append(np.full(batch_size, state, dtype=np.intp))
+            if log_space:
+                with np.errstate(divide='ignore'):
+                    weights += np.log(rows[:, state])
+            else:
+                weights *= rows[:, state]
+        else:
+            draws = rng.random(batch_size) if u is None else u[:, node_id]
+            if network.cardinality[node_id] == 2:
+                states.append((draws < rows[:, 1]).astype(np.intp))
+            else:
+                states.append((draws[:, None] >= np.cumsum(rows, axis=1)[:, :-1]).sum(axis=1))
+
+    return states, weights
+
+
+def _likelihood_weighting_batched(network, query_ids, evidence, num_samples, batch_size, log_space=False,
+                                  rng=None):
+    if np is None:
+        raise ImportError("numpy is required for batched likelihood weighting")
+
+    counter = counter_stream(rng)
+    if counter is None:
+        # Seed from the given (or global) generator so random.seed() still controls the result
+        generator = np.random.default_rng(sequential_rng(rng).getrandbits(64))
+    tables = cpt_arrays(network)
+    cards = [network.cardinality[i] for i in query_ids]
+    size = 1
+    for card in cards:
+        size *= card
+    totals = np.full(size, -np.inf) if log_space else np.zeros(size)
+
+    remaining = num_samples
+    while remaining > 0:
+        n = min(batch_size, remaining)
+        if counter is not None:
+            generator = counter.advance(num_samples - remaining)
+        states, weights = weighted_sample_batch(evidence, n, generator, network, tables, log_space)
+
+        # Mixed-radix pack each sample's query assignment; query_ids[0] is most significant
+        key = np.zeros(n, dtype=np.intp)
+        for node_id, card in zip(query_ids, cards):
+            key = key * card + states[node_id]
+        if log_space:
+            # Sum the batch's weights shifted by its largest log weight,
+            # then fold the per-key log totals into the running ones
+            top = weights.max()
+            if top > -np.inf:
+                with np.errstate(divide='ignore'):
+                    batch = np.log(np.bincount(key, weights=np.exp(weights - top), minlength=size)) + top
+                totals = np.logaddexp(totals, batch)
+        else:
+            totals += np.bincount(key, weights=weights, minlength=size)
+        remaining -= n
+
+    weighted_counts = {}
+    combinations = network.assignments(query_ids)
+    for combination, total in zip(combinations, totals.tolist()):
+        if total > (LOG_ZERO if log_space else 0):
+            weighted_counts[combination] = total
+    return weighted_counts
+
+
+def likelihood_counts(query_vars, evidence, num_samples, batch_size=None, network=None, stream='random',
+                      log_space=False, rng=None):
+    """
+    Likelihood weighting tallies: total weight per query assignment. Other
+    random-stream backends than 'random' need the unbatched path. With a
+    seed or CounterStream as rng, the batched and unbatched paths draw the
+    same samples.
+
+    With log_space the weights are accumulated as logs and the tallies are
+    returned divided by the largest one, so evidence whose weights would
+    underflow to zero still gives a distribution. The rescaled tallies of
+    separate calls are not on the same scale and must not be added up.
+
+    Returns:
+        Tuple of (weights keyed by query state tuples, total weight)
+    """
+    if network is None:
+        network = get_network()
+    query_ids = network.query_ids(query_vars)
+    encoded = network.encode_evidence(evidence)
+
+    if batch_size:
+        if stream != 'random':
+            raise ValueError("Batched likelihood weighting only supports the 'random' stream")
+        weighted_counts = _likelihood_weighting_batched(network, query_ids, encoded, num_samples, batch_size,
+                                                        log_space, rng)
+    else:
+        weighted_counts = {}
+        uniforms, rand = _sample_draws(rng, stream, num_samples, len(network.nodes))
+
+        for _ in range(num_samples):
+            sample, weight = _weighted_states(network, encoded, None if uniforms is None else next(uniforms),
+                                              log_space, rand)
+
+            # Extract query values
+            query_values = tuple(sample[var] for var in query_ids)
+            if log_space:
+                if weight > LOG_ZERO:
+                    weighted_counts[query_values] = logaddexp(weighted_counts.get(query_values, LOG_ZERO), weight)
+            else:
+                weighted_counts[query_values] = weighted_counts.get(query_values, 0) + weight
+
+    if log_space and weighted_counts:
+        top = max(weighted_counts.values())
+        weighted_counts = {k: math.exp(v - top) for k, v in weighted_counts.items()}
+
+    total_weight = sum(weighted_counts.values())
+    if instrumentation.active:
+        instrumentation.add('likelihood.samples_generated', num_samples)
+        instrumentation.add('likelihood.cpt_lookups', num_samples * len(network.nodes))
+        if not log_space:
+            instrumentation.add('likelihood.weight_sum', total_weight)
+    return weighted_counts, total_weight
+
+
+def likelihood_weighting(query_vars, evidence, num_samples, batch_size=None, network=None, stream='random',
+                         log_space=False, rng=None):
     """
     Approximate P(query_vars | evidence) using likelihood weighting.
     Generate weighted samples where evidence is fixed.
-    
+
     Args:
         query_vars: List of query variable names
         evidence: Dictionary of evidence
         num_samples: Number of weighted samples to generate
-    
+        batch_size: If given, draw samples in NumPy batches of this size
+                    instead of one dict per sample (requires numpy)
+        network: CompiledNetwork to use (defaults to network_definition)
+        stream: random-stream backend (see prior_sampling)
+        log_space: accumulate log weights (see likelihood_counts)
+        rng: random generator or seed (see prior_sampling)
+
     Returns:
         Dictionary mapping query assignments to probabilities
     """
-    weighted_counts = {}
-    
-    for _ in range(num_samples):
-        sample, weight = weighted_sample(evidence)
-        
-        # Extract query values
-        query_values = tuple(sample[var] for var in query_vars)
-        weighted_counts[query_values] = weighted_counts.get(query_values, 0) + weight
-    
     # Normalize by total weight
-    total_weight = sum(weighted_counts.values())
-    
-    if total_weight == 0:
-        num_combinations = 2 ** len(query_vars)
-        return {tuple([True if i & (1 << j) else False for j in range(len(query_vars))]): 
-                1.0 / num_combinations for i in range(num_combinations)}
-    
-    probabilities = {k: v / total_weight for k, v in weighted_counts.items()}
-    
-    # Fill in missing combinations
-    import itertools
-    for combination in itertools.product([True, False], repeat=len(query_vars)):
-        if combination not in probabilities:
-            probabilities[combination] = 0.0
-    
-    return probabilities
\ No newline at end of file
+    with instrumentation.timer('infer'):
+        weighted_counts, total_weight = likelihood_counts(query_vars, evidence, num_samples, batch_size,
+                                                          network, stream, log_space, rng)
+    return counts_to_probabilities(query_vars, weighted_counts, total_weight, network)
@@ -0,0 +1,289 @@
+import instrumentation
+from compiled_network import get_network
+from log_math import log, logsumexp, log_normalize
+import itertools
+
+
+class Factor:
+    """
+    A table over a tuple of variables.
+
+    Variables are compiled node ids and the table maps a tuple of states (one
+    per variable, in the same order as `variables`) to a non-negative number.
+    Rows that are missing are treated as zero, which is how evidence
+    restriction drops inconsistent rows.
+    """
+
+    def __init__(self, variables, table):
+        self.variables = tuple(variables)
+        self.table = table
+
+    def __repr__(self):
+        return f"Factor({self.variables}, {len(self.table)} rows)"
+
+
+def make_factor(network, node_id, evidence, log_space=False):
+    """
+    Build the CPT factor P(node | parents(node)) restricted to the evidence.
+
+    Args:
+        network: CompiledNetwork
+        node_id: id of the node whose CPT is used
+        evidence: dictionary of encoded evidence {node_id: state}
+        log_space: store log probabilities instead
+
+    Returns:
+        Factor over the non-evidence variables among the node and its parents
+    """
+    scope = network.parents[node_id] + (node_id,)
+    free = [v for v in scope if v not in evidence]
+
+    assignment = [0] * len(network.nodes)
+    for v in scope:
+        if v in evidence:
+            assignment[v] = evidence[v]
+
+    table = {}
+    for states in network.assignments(free):
+        for v, s in zip(free, states):
+            assignment[v] = s
+        prob = network.probability(node_id, assignment[node_id], assignment)
+        table[states] = log(prob) if log_space else prob
+
+    if instrumentation.active:
+        instrumentation.add('factor.built')
+        instrumentation.add('factor.cpt_lookups', len(table))
+    return Factor(free, table)
+
+
+def multiply(f1, f2, log_space=False):
+    """
+    Pointwise product of two factors (a sum of log factors with log_space).
+
+    Rows of f2 are grouped by their values on the shared variables so each
+    row of f1 only meets the rows of f2 it agrees with.
+    """
+    shared = [v for v in f1.variables if v in f2.variables]
+    extra = [v for v in f2.variables if v not in f1.variables]
+    shared_in_1 = [f1.variables.index(v) for v in shared]
+    shared_in_2 = [f2.variables.index(v) for v in shared]
+    extra_in_2 = [f2.variables.index(v) for v in extra]
+
+    groups = {}
+    for values, prob in f2.table.items():
+        key = tuple(values[i] for i in shared_in_2)
+        tail = tuple(values[i] for i in extra_in_2)
+        groups.setdefault(key, []).append((tail, prob))
+
+    table = {}
+    for values, prob in f1.table.items():
+        key = tuple(values[i] for i in shared_in_1)
+        for tail, other in groups.get(key, ()):
+            table[values + tail] = prob + other if log_space else prob * other
+
+    if instrumentation.active:
+        instrumentation.add('factor.multiplications')
+        instrumentation.maximum('factor.size_max', len(table))
+    return Factor(f1.variables + tuple(extra), table)
+
+
+def sum_out(var, factor, log_space=False):
+    """
+    Sum a variable out of a factor (with log-sum-exp for a log factor).
+    """
+    idx = factor.variables.index(var)
+    table = {}
+    if log_space:
+        groups = {}
+        for values, prob in factor.table.items():
+            groups.setdefault(values[:idx] + values[idx + 1:], []).append(prob)
+        table = {key: logsumexp(terms) for key, terms in groups.items()}
+    else:
+        for values, prob in factor.table.items():
+            key = values[:idx] + values[idx + 1:]
+            table[key] = table.get(key, 0.0) + prob
+
+    instrumentation.add('factor.sum_outs')
+    variables = factor.variables[:idx] + factor.variables[idx + 1:]
+    return Factor(variables, table)
+
+
+def interaction_graph(network, variables):
+    """
+    Moral graph of the network restricted to `variables` (node ids).
+
+    Returns:
+        Dictionary {node_id: set of neighbouring node ids}
+    """
+    variables = set(variables)
+    graph = {v: set() for v in variables}
+    for node_id in range(len(network.nodes)):
+        scope = [v for v in network.parents[node_id] + (node_id,) if v in variables]
+        for a, b in itertools.combinations(scope, 2):
+            graph[a].add(b)
+            graph[b].add(a)
+    return graph
+
+
+def _fill_in(graph, var):
+    neighbours = list(graph[var])
+    missing = 0
+    for a, b in itertools.combinations(neighbours, 2):
+        if b not in graph[a]:
+            missing += 1
+    return missing
+
+
+def _degree(graph, var):
+    return len(graph[var])
+
+
+HEURISTICS = {
+    'min_fill': _fill_in,
+    'min_degree': _degree,
+}
+
+
+def greedy_order(graph, candidates, heuristic='min_fill'):
+    """
+    Greedily eliminate candidates from an interaction graph.
+
+    The graph is modified in place: each eliminated variable is removed and
+    its neighbours are connected.
+
+    Returns:
+        List of (variable, neighbours at elimination time) in elimination order
+    """
+    if heuristic not in HEURISTICS:
+        raise ValueError(f"Unknown elimination heuristic: {heuristic}")
+    score = HEURISTICS[heuristic]
+
+    remaining = sorted(candidates)
+    steps = []
+
+    while remaining:
+        # Ties are broken by topological position so the order is deterministic
+        var = min(remaining, key=lambda v: score(graph, v))
+        remaining.remove(var)
+
+        neighbours = graph.pop(var)
+        for a, b in itertools.combinations(neighbours, 2):
+            graph[a].add(b)
+            graph[b].add(a)
+        for n in neighbours:
+            graph[n].discard(var)
+        steps.append((var, neighbours))
+
+    return steps
+
+
+def elimination_order(network, hidden, evidence, heuristic='min_fill'):
+    """
+    Choose the order in which hidden variables are summed out.
+
+    Args:
+        network: CompiledNetwork
+        hidden: node ids that have to be eliminated
+        evidence: dictionary of encoded evidence (evidence nodes are not in the graph)
+        heuristic: 'min_fill', 'min_degree' or an explicit list of variable names
+
+    Returns:
+        List of hidden node ids in elimination order
+    """
+    if not isinstance(heuristic, str):
+        order = [network.index[v] for v in heuristic]
+        if sorted(order) != sorted(hidden):
+            raise ValueError("Elimination order must list every hidden variable exactly once")
+        return order
+
+    graph = interaction_graph(network, [v for v in range(len(network.nodes)) if v not in evidence])
+    return [var for var, _ in greedy_order(graph, hidden, heuristic)]
+
+
+def eliminate(factors, order, log_space=False):
+    """
+    Sum the variables in order out of a list of factors and multiply what is left.
+    """
+    for var in order:
+        involved = [f for f in factors if var in f.variables]
+        factors = [f for f in factors if var not in f.variables]
+        if not involved:
+            continue
+        product = involved[0]
+        for f in involved[1:]:
+            product = multiply(product, f, log_space)
+        factors.append(sum_out(var, product, log_space))
+
+    result = Factor((), {(): 0.0 if log_space else 1.0})
+    for f in factors:
+        result = multiply(result, f, log_space)
+    return result
+
+
+def variable_elimination(query_vars, evidence, heuristic='min_fill', network=None, log_space=False):
+    """
+    Compute P(query_vars | evidence) by variable elimination.
+
+    One elimination pass produces the unnormalized joint over all query
+    variables, so joint queries do not re-run inference per combination.
+
+    Args:
+        query_vars: List of query variable names
+        evidence: Dictionary of evidence {variable: value}
+        heuristic: 'min_fill', 'min_degree' or an explicit elimination order
+        network: CompiledNetwork to use (defaults to network_definition)
+        log_space: eliminate log factors (sums and log-sum-exp), so that
+                   evidence too unlikely for floats still normalizes
+
+    Returns:
+        Dictionary mapping query variable assignments to probabilities
+    """
+    if network is None:
+        network = get_network()
+    return eliminate_query(network, network.query_ids(query_vars), network.encode_evidence(evidence),
+                           heuristic, log_space)
+
+
+def eliminate_query(network, query_ids, encoded, heuristic='min_fill', log_space=False):
+    """
+    variable_elimination over compiled ids: query_ids is a list of node ids
+    and encoded is the evidence as {node_id: state}.
+    """
+    hidden = [v for v in range(len(network.nodes)) if v not in encoded and v not in query_ids]
+    order = elimination_order(network, hidden, encoded, heuristic)
+
+    factors = [make_factor(network, v, encoded, log_space) for v in range(len(network.nodes))]
+    result = eliminate(factors, order, log_space)
+
+    if log_space:
+        terms = {combination: [] for combination in network.assignments(query_ids)}
+        for values, log_prob in result.table.items():
+            row = dict(zip(result.variables, values))
+            row.update(encoded)
+            terms[tuple(row[v] for v in query_ids)].append(log_prob)
+        with instrumentation.timer('normalize'):
+            return log_normalize({network.decode(query_ids, k): logsumexp(v) for k, v in terms.items()})
+
+    # Reorder the joint to follow query_vars; a query variable that is also
+    # evidence keeps its observed value
+    unnormalized = {}
+    for combination in network.assignments(query_ids):
+        unnormalized[combination] = 0.0
+    for values, prob in result.table.items():
+        row = dict(zip(result.variables, values))
+        row.update(encoded)
+        key = tuple(row[v] for v in query_ids)
+        unnormalized[key] += prob
+
+    with instrumentation.timer('normalize'):
+        total = sum(unnormalized.values())
+        if total == 0:
+            raise ValueError("Evidence has zero probability")
+        return {network.decode(query_ids, k): v / total for k, v in unnormalized.items()}
+
+
+def query_exact(query_vars, evidence, heuristic='min_fill', network=None):
+    """
+    Drop-in replacement for exact_inference.query_exact using variable elimination.
+    """
+    return variable_elimination(query_vars, evidence, heuristic, network)